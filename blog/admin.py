@@ -3,8 +3,10 @@ from .models import Post
 
 
 from django.contrib import admin
+from django.contrib.postgres.search import SearchQuery
 from django.utils.html import format_html
-from .models import Post
+from catalog.models import SEARCH_CONFIG
+from .models import Post, PostArchiveMonth
 
 
 @admin.register(Post)
@@ -63,3 +65,26 @@ class PostAdmin(admin.ModelAdmin):
         return "Изображение не загружено"
 
     preview_admin.short_description = "Текущее изображение"
+
+    # --- ПОИСК ---
+
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по поисковому вектору поста вместо ILIKE по title/content."""
+        if not search_term.strip():
+            return queryset, False
+        query = SearchQuery(search_term, search_type="websearch", config=SEARCH_CONFIG)
+        return queryset.filter(search_vector=query), False
+
+
+@admin.register(PostArchiveMonth)
+class PostArchiveMonthAdmin(admin.ModelAdmin):
+    """Счётчики архива по месяцам — только для просмотра, их ведут сигналы."""
+
+    list_display = ("month", "audience", "count")
+    list_filter = ("audience",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -5,3 +5,6 @@ class BlogConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "blog"
     verbose_name = "Блог"
+
+    def ready(self):
+        from . import signals  # noqa
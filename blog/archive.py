@@ -0,0 +1,174 @@
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from blog.models import Post, PostArchiveMonth
+from catalog.cache_utils import POSTS_TAG, read_through
+
+# ---------- АРХИВ БЛОГА ПО МЕСЯЦАМ ----------
+# Число постов за каждый месяц хранится в таблице PostArchiveMonth и меняется
+# на ±1 сигналами Post (создание, удаление, смена публикации или даты),
+# поэтому боковая панель «Архив» не делает GROUP BY по всей blog_post.
+# Как и фасеты каталога (catalog.facets), счётчики ведутся отдельно для staff
+# (все посты) и для публичной выдачи (только опубликованные).
+# Если счётчики разошлись с данными (правка мимо ORM), их пересчитывает
+# manage.py rebuild_blog_archive.
+
+AUDIENCE_PUBLIC = PostArchiveMonth.AUDIENCE_PUBLIC
+AUDIENCE_STAFF = PostArchiveMonth.AUDIENCE_STAFF
+
+_STATE_FIELDS = ("created_at", "is_published")
+
+
+def audience(is_staff: bool) -> str:
+    return AUDIENCE_STAFF if is_staff else AUDIENCE_PUBLIC
+
+
+def month_of(created_at) -> date:
+    """Первое число месяца поста в часовом поясе сайта."""
+    return timezone.localtime(created_at).date().replace(day=1)
+
+
+def month_bounds(month: date):
+    """[начало месяца, начало следующего) — aware datetime для фильтра по created_at."""
+    next_month = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return tuple(
+        timezone.make_aware(datetime.combine(day, time.min))
+        for day in (month, next_month)
+    )
+
+
+def parse_month(value):
+    """«2025-10» → date(2025, 10, 1); None — пусто или не разобрать."""
+    try:
+        year, month = (int(part) for part in (value or "").split("-"))
+        return date(year, month, 1)
+    except ValueError:
+        return None
+
+
+def _contributions(state):
+    """Ключи (month, audience), в которые пост с таким состоянием даёт +1."""
+    if state is None or state[0] is None:
+        return []
+    created_at, is_published = state
+    audiences = [AUDIENCE_STAFF] + ([AUDIENCE_PUBLIC] if is_published else [])
+    return [(month_of(created_at), aud) for aud in audiences]
+
+
+def state_deltas(old, new) -> Counter:
+    """Изменения счётчиков при переходе поста из состояния old в new
+    (состояние — кортеж (created_at, is_published), None — поста нет)."""
+    deltas = Counter()
+    for item in _contributions(old):
+        deltas[item] -= 1
+    for item in _contributions(new):
+        deltas[item] += 1
+    return deltas
+
+
+def apply_deltas(deltas):
+    """Применяет изменения счётчиков одним INSERT ... ON CONFLICT DO UPDATE."""
+    rows = sorted((item, n) for item, n in deltas.items() if n)
+    if not rows:
+        return
+    values = ", ".join(["(%s, %s, %s)"] * len(rows))
+    params = [value for (month, aud), n in rows for value in (month, aud, n)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO blog_postarchivemonth (month, audience, count)
+            VALUES {values}
+            ON CONFLICT (month, audience)
+            DO UPDATE SET count = blog_postarchivemonth.count + EXCLUDED.count
+            """,
+            params,
+        )
+
+
+# ---------- СОСТОЯНИЕ ПОСТА ДЛЯ СИГНАЛОВ ----------
+
+
+def current_state(post):
+    return post.created_at, post.is_published
+
+
+def stored_state(post):
+    """Состояние поста, которое сейчас учтено в счётчиках: из последнего
+    сохранения, из значений, прочитанных из БД (Post.from_db), и только
+    если их нет — отдельным SELECT."""
+    state = getattr(post, "_archive_state", None)
+    if state is not None:
+        return state
+    loaded = getattr(post, "_loaded_values", {})
+    if all(field in loaded for field in _STATE_FIELDS):
+        return tuple(loaded[field] for field in _STATE_FIELDS)
+    if post.pk is None:
+        return None
+    return (
+        type(post)
+        ._base_manager.filter(pk=post.pk)
+        .values_list(*_STATE_FIELDS)
+        .first()
+    )
+
+
+# ---------- ЧТЕНИЕ ----------
+
+
+def months(is_staff: bool) -> list:
+    """Месяцы с постами для выдачи нужной роли, новые сверху:
+    [{"month": date, "count": n}]. Кешируется под тегом списка постов."""
+
+    def compute():
+        return [
+            {"month": month, "count": count}
+            for month, count in PostArchiveMonth.objects.filter(
+                audience=audience(is_staff), count__gt=0
+            )
+            .order_by("-month")
+            .values_list("month", "count")
+        ]
+
+    return read_through(
+        f"blog:archive:{audience(is_staff)}", compute, tags=[POSTS_TAG]
+    )
+
+
+# ---------- ПЕРЕСЧЁТ ----------
+
+
+def compute_counts(posts) -> Counter:
+    """Полный пересчёт счётчиков по QuerySet постов — один GROUP BY."""
+    counts = Counter()
+    grouped = (
+        posts.order_by()
+        .annotate(month=TruncMonth("created_at"))
+        .values("month", "is_published")
+        .annotate(n=Count("pk"))
+    )
+    for row in grouped:
+        month = timezone.localtime(row["month"]).date()
+        audiences = [AUDIENCE_STAFF] + ([AUDIENCE_PUBLIC] if row["is_published"] else [])
+        for aud in audiences:
+            counts[(month, aud)] += row["n"]
+    return counts
+
+
+def rebuild(post_model=None, archive_model=None) -> int:
+    """Перезаписывает таблицу счётчиков пересчитанными значениями.
+    Модели можно передать явно (исторические модели в миграции)."""
+    if post_model is None or archive_model is None:
+        post_model, archive_model = Post, PostArchiveMonth
+    with transaction.atomic():
+        counts = compute_counts(post_model._base_manager.all())
+        archive_model._base_manager.all().delete()
+        archive_model._base_manager.bulk_create(
+            archive_model(month=month, audience=aud, count=n)
+            for (month, aud), n in counts.items()
+        )
+    return len(counts)
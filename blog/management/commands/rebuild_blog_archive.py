@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from blog import archive
+
+
+class Command(BaseCommand):
+    """
+    Пересчитывает счётчики архива блога по месяцам с нуля одним GROUP BY
+    по blog_post. Обычно счётчики ведутся инкрементально сигналами; команда
+    нужна после правок постов мимо ORM.
+    """
+
+    help = "Пересчитать счётчики архива блога по месяцам."
+
+    def handle(self, *args, **options):
+        rows = archive.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Месяцев в архиве: {rows}"))
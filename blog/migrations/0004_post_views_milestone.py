@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_views_milestone(apps, schema_editor):
+    """Рубежи, пройденные до миграции, считаем отмеченными — писем о них
+    администратору уже отправляли (порог 100) или они в прошлом."""
+    Post = apps.get_model("blog", "Post")
+    for milestone in sorted(getattr(settings, "BLOG_VIEW_MILESTONES", (100,))):
+        Post.objects.filter(views_count__gte=milestone).update(
+            views_milestone=milestone
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0003_post_author_alter_post_is_published_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="views_milestone",
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                verbose_name="Отмеченный рубеж просмотров",
+            ),
+        ),
+        migrations.RunPython(fill_views_milestone, migrations.RunPython.noop),
+    ]
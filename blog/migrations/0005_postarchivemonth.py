@@ -0,0 +1,68 @@
+from django.db import migrations, models
+
+
+def fill_archive_counts(apps, schema_editor):
+    """Начальные значения счётчиков — тем же пересчётом, что и rebuild_blog_archive."""
+    from blog import archive
+
+    archive.rebuild(
+        post_model=apps.get_model("blog", "Post"),
+        archive_model=apps.get_model("blog", "PostArchiveMonth"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0004_post_views_milestone"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PostArchiveMonth",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("month", models.DateField(verbose_name="Месяц")),
+                (
+                    "audience",
+                    models.CharField(
+                        choices=[
+                            ("public", "Публичные"),
+                            ("staff", "Для сотрудников"),
+                        ],
+                        max_length=8,
+                        verbose_name="Аудитория",
+                    ),
+                ),
+                (
+                    "count",
+                    models.IntegerField(default=0, verbose_name="Количество постов"),
+                ),
+            ],
+            options={
+                "verbose_name": "Месяц архива блога",
+                "verbose_name_plural": "Архив блога по месяцам",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("month", "audience"),
+                        name="blog_archive_month_unique",
+                    )
+                ],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="blog_post_created_id_idx"
+            ),
+        ),
+        migrations.RunPython(fill_archive_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+from django.db.models import Q
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0005_postarchivemonth"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True, verbose_name="Поисковый вектор"
+            ),
+        ),
+        # заполняем вектор для уже существующих постов тем же выражением,
+        # что и Post.save (POST_SEARCH_VECTOR)
+        migrations.RunSQL(
+            sql="""
+                UPDATE blog_post SET search_vector =
+                    setweight(to_tsvector('russian', coalesce(title, '')), 'A')
+                    || setweight(to_tsvector('russian', coalesce(content, '')), 'B');
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=django.contrib.postgres.indexes.GinIndex(
+                condition=Q(("is_published", True)),
+                fields=["search_vector"],
+                name="blog_post_search_gin",
+            ),
+        ),
+    ]
@@ -0,0 +1,48 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+from django.db.models import Q
+
+
+class Migration(migrations.Migration):
+    """Поисковый вектор — генерируемый столбец вместо UPDATE из Post.save:
+    обычное поле нельзя превратить в генерируемое, поэтому пересоздаём его
+    вместе с GIN-индексом (значения Postgres посчитает сам)."""
+
+    dependencies = [
+        ("blog", "0006_post_search_vector"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="post",
+            name="blog_post_search_gin",
+        ),
+        migrations.RemoveField(
+            model_name="post",
+            name="search_vector",
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="search_vector",
+            field=models.GeneratedField(
+                db_persist=True,
+                expression=django.contrib.postgres.search.SearchVector(
+                    "title", weight="A", config="russian"
+                )
+                + django.contrib.postgres.search.SearchVector(
+                    "content", weight="B", config="russian"
+                ),
+                output_field=django.contrib.postgres.search.SearchVectorField(),
+                verbose_name="Поисковый вектор",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=django.contrib.postgres.indexes.GinIndex(
+                condition=Q(("is_published", True)),
+                fields=["search_vector"],
+                name="blog_post_search_gin",
+            ),
+        ),
+    ]
@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.db import connection, transaction
+
+# ---------- РУБЕЖИ ПРОСМОТРОВ ПОСТОВ ----------
+# О первом достижении каждого рубежа из BLOG_VIEW_MILESTONES (100, 1000, 10000)
+# администратору уходит письмо (через очередь notifications.outbox). Рубеж
+# определяет сам UPDATE, прибавляющий просмотры: он же поднимает
+# Post.views_milestone — наибольший уже отмеченный рубеж — и возвращает
+# (RETURNING) его старое и новое значение. Строки блокируются в порядке id,
+# поэтому параллельные сбросы из разных воркеров видят непересекающиеся
+# диапазоны, и каждый рубеж достаётся ровно одному из них. views_milestone
+# не уменьшается, так что после обнуления счётчика письма не повторяются.
+# Отдельного SELECT перед записью не нужно.
+
+
+def thresholds() -> list:
+    return sorted(getattr(settings, "BLOG_VIEW_MILESTONES", (100, 1000, 10000)))
+
+
+def reached(views_count: int) -> int:
+    """Наибольший рубеж, не превышающий views_count (0 — ни одного)."""
+    return max((t for t in thresholds() if t <= views_count), default=0)
+
+
+def add_views(deltas) -> list:
+    """Прибавляет deltas {post_id: n} к views_count одним запросом и ставит
+    в очередь письма о пройденных рубежах — в одной транзакции.
+    Возвращает [(post_id, стало просмотров)] для обновлённых постов."""
+    from blog.models import Post
+
+    ids = sorted(deltas)
+    if not ids:
+        return []
+    table = Post._meta.db_table
+    values = ", ".join(["(%s::bigint, %s::integer)"] * len(ids))
+    params = [value for pk in ids for value in (pk, deltas[pk])]
+    params.append(thresholds())
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH deltas (id, delta) AS (VALUES {values}),
+                locked AS (
+                    SELECT post.id, post.views_milestone
+                    FROM {table} AS post JOIN deltas ON deltas.id = post.id
+                    ORDER BY post.id FOR UPDATE OF post
+                )
+                UPDATE {table} AS post
+                SET views_count = post.views_count + deltas.delta,
+                    views_milestone = GREATEST(
+                        post.views_milestone,
+                        COALESCE(
+                            (SELECT MAX(t) FROM unnest(%s::integer[]) AS t
+                             WHERE t <= post.views_count + deltas.delta),
+                            0
+                        )
+                    )
+                FROM locked JOIN deltas ON deltas.id = locked.id
+                WHERE post.id = locked.id
+                RETURNING post.id, post.title, post.views_count,
+                          locked.views_milestone, post.views_milestone
+                """,
+                params,
+            )
+            rows = cursor.fetchall()
+        for pk, title, views_count, before, after in rows:
+            for milestone in thresholds():
+                if before < milestone <= after:
+                    Post(pk=pk, title=title).send_milestone_email(
+                        milestone, views_count
+                    )
+    return [(pk, views_count) for pk, _, views_count, _, _ in rows]
@@ -1,9 +1,19 @@
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db import models, transaction
+from django.db.models import Q
 from django.urls import reverse_lazy, reverse
-from django.core.mail import send_mail
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 
+from catalog.models import SEARCH_CONFIG
+
+# 🔎 Полнотекстовый поиск по блогу: заголовок весомее текста.
+# Вектор — генерируемый столбец, его пересчитывает сам Postgres
+POST_SEARCH_VECTOR = SearchVector(
+    "title", weight="A", config=SEARCH_CONFIG
+) + SearchVector("content", weight="B", config=SEARCH_CONFIG)
+
 
 class Post(models.Model):
     """Блог-пост:
@@ -11,7 +21,8 @@ class Post(models.Model):
     - author (для прав и подписи)
     - is_published (отображение в списке)
     - views_count (счётчик)
-    При первом достижении 100 просмотров отправляет письмо администратору."""
+    О первом достижении рубежей просмотров (BLOG_VIEW_MILESTONES) пишет
+    администратору — см. blog.milestones."""
 
     title = models.CharField(_("Заголовок"), max_length=200)
     content = models.TextField(_("Содержимое"))
@@ -40,6 +51,16 @@ class Post(models.Model):
     is_published = models.BooleanField(_("Опубликован"), default=True)
 
     views_count = models.PositiveIntegerField(_("Количество просмотров"), default=0)
+    # наибольший рубеж просмотров, о котором уже написали (ведёт blog.milestones)
+    views_milestone = models.PositiveIntegerField(
+        _("Отмеченный рубеж просмотров"), default=0, editable=False
+    )
+    search_vector = models.GeneratedField(
+        expression=POST_SEARCH_VECTOR,
+        output_field=SearchVectorField(),
+        db_persist=True,
+        verbose_name=_("Поисковый вектор"),
+    )
 
     class Meta:
         verbose_name = _("Блоговая запись")
@@ -48,6 +69,16 @@ class Post(models.Model):
         indexes = [
             models.Index(fields=["-created_at"]),
             models.Index(fields=["is_published"]),
+            # keyset-пагинация списка: порядок (created_at, id) целиком из индекса
+            models.Index(
+                fields=["-created_at", "-id"], name="blog_post_created_id_idx"
+            ),
+            # ищем только среди опубликованных — частичный индекс меньше и быстрее
+            GinIndex(
+                fields=["search_vector"],
+                name="blog_post_search_gin",
+                condition=Q(is_published=True),
+            ),
         ]
 
     def __str__(self):
@@ -57,31 +88,114 @@ class Post(models.Model):
         """Возвращает ссылку на просмотр этой статьи."""
         return reverse("blog:post_detail", kwargs={"pk": self.pk})
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Запоминаем значения, прочитанные из БД: по ним save() пишет разницу
+        счётчика просмотров, а сигналы архива видят смену месяца/публикации —
+        без лишнего SELECT."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using, fields, from_queryset)
+        loaded = getattr(self, "_loaded_values", {})
+        for field in self._meta.concrete_fields:
+            if (fields is None or field.attname in fields) and (
+                field.attname in self.__dict__
+            ):
+                loaded[field.attname] = self.__dict__[field.attname]
+        self._loaded_values = loaded
+
     def save(self, *args, **kwargs):
-        """Отправляем письмо один раз при первом переходе порога 100 просмотров."""
-        send_congrats = False
-        if self.pk:
-            old = Post.objects.only("views_count").filter(pk=self.pk).first()
-            if old and old.views_count < 100 <= self.views_count:
-                send_congrats = True
-
-        super().save(*args, **kwargs)
-
-        if send_congrats:
-            try:
-                send_mail(
-                    subject="🎉 Пост набрал 100+ просмотров",
-                    message=(
-                        f"Пост «{self.title}» достиг {self.views_count} просмотров.\n"
-                        "Так держать!"
-                    ),
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[settings.ADMIN_EMAIL],
-                    fail_silently=False,
-                )
-            except Exception:
-                # умышленно не роняем сохранение поста
-                pass
+        """Изменённый views_count пишется не как есть, а прибавлением разницы
+        с загруженным значением тем же UPDATE, что и просмотры
+        (blog.milestones.add_views): параллельные просмотры не теряются,
+        а пройденный рубеж отмечается без дополнительного SELECT.
+        views_count и views_milestone принадлежат add_views — обычное
+        сохранение загруженного поста их не перезаписывает, иначе устаревший
+        рубеж вернул бы уже отправленное письмо."""
+        from blog import milestones
+
+        loaded = getattr(self, "_loaded_values", {}).get("views_count")
+        if self._state.adding:
+            # рубежи, пройденные до создания поста, не празднуем
+            self.views_milestone = milestones.reached(self.views_count)
+            super().save(*args, **kwargs)
+            return
+        if loaded is None:
+            super().save(*args, **kwargs)
+            return
+
+        counted = ("views_count", "views_milestone")
+        update_fields = kwargs.pop("update_fields", None)
+        if update_fields is None:
+            update_fields = [
+                f.attname
+                for f in self._meta.concrete_fields
+                if not f.primary_key and not f.generated and f.attname not in counted
+            ]
+        else:
+            update_fields = [name for name in update_fields if name not in counted]
+        delta = self.views_count - loaded
+        with transaction.atomic():
+            if update_fields:
+                super().save(*args, update_fields=update_fields, **kwargs)
+            if not delta:
+                return
+            for _pk, views_count in milestones.add_views({self.pk: delta}):
+                self.views_count = views_count
+            self._loaded_values = {
+                **getattr(self, "_loaded_values", {}),
+                "views_count": self.views_count,
+            }
+
+    def send_milestone_email(self, milestone, views_count):
+        """Ставит в очередь письмо администратору о первом достижении рубежа.
+        Вызывается из blog.milestones.add_views внутри транзакции,
+        которая меняет счётчик."""
+        from notifications import outbox
+
+        outbox.enqueue(
+            subject=f"🎉 Пост набрал {milestone}+ просмотров",
+            message=(
+                f"Пост «{self.title}» достиг {views_count} просмотров.\n"
+                "Так держать!"
+            ),
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            recipient_list=[settings.ADMIN_EMAIL],
+        )
+
+
+class PostArchiveMonth(models.Model):
+    """Число постов за месяц для боковой панели «Архив» (см. blog.archive).
+    Ведётся сигналами Post на ±1; для staff считаются все посты,
+    для остальных — только опубликованные."""
+
+    AUDIENCE_PUBLIC = "public"
+    AUDIENCE_STAFF = "staff"
+    AUDIENCE_CHOICES = (
+        (AUDIENCE_PUBLIC, _("Публичные")),
+        (AUDIENCE_STAFF, _("Для сотрудников")),
+    )
+
+    month = models.DateField(_("Месяц"))  # первое число месяца
+    audience = models.CharField(
+        _("Аудитория"), max_length=8, choices=AUDIENCE_CHOICES
+    )
+    count = models.IntegerField(_("Количество постов"), default=0)
+
+    class Meta:
+        verbose_name = _("Месяц архива блога")
+        verbose_name_plural = _("Архив блога по месяцам")
+        constraints = [
+            models.UniqueConstraint(
+                fields=("month", "audience"), name="blog_archive_month_unique"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.month:%m.%Y} ({self.audience}): {self.count}"
 
 
 # без доп задания
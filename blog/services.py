@@ -0,0 +1,208 @@
+import hashlib
+
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+from django.db.models import F
+from django.db.models.functions import Left
+from django.urls import reverse
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+from django.utils.text import Truncator
+
+from catalog.cache_utils import POSTS_TAG, read_through
+from catalog.dto import ImageRef
+from catalog.models import SEARCH_CONFIG
+from catalog.pagination import DEFAULT_ORDERING, keyset_page_rows, page_token
+from catalog.services import SEARCH_ORDERING, normalize_search_query
+
+from blog import archive
+from blog.models import Post
+
+EXCERPT_CHARS = 140  # как truncatechars:140 в списке постов
+
+
+class PostCard:
+    """Лёгкая карточка поста для списка — то, что выводит post_list.html,
+    плюс created_at и id для курсора пагинации. В кеше хранится кортежем."""
+
+    __slots__ = ("id", "title", "excerpt", "preview", "created_at", "is_published")
+
+    def __init__(self, id, title, excerpt, preview, created_at, is_published):
+        self.id = id
+        self.title = title
+        self.excerpt = excerpt
+        self.preview = ImageRef(preview)
+        self.created_at = created_at
+        self.is_published = is_published
+
+    @property
+    def pk(self):
+        return self.id
+
+    def get_absolute_url(self):
+        return reverse("blog:post_detail", kwargs={"pk": self.id})
+
+    def to_tuple(self) -> tuple:
+        return (
+            self.id,
+            self.title,
+            self.excerpt,
+            self.preview.name,
+            self.created_at,
+            self.is_published,
+        )
+
+    @classmethod
+    def from_post(cls, post):
+        """Карточка из Post, выбранного get_post_page (с аннотацией head)."""
+        return cls(
+            post.pk,
+            post.title,
+            Truncator(post.head).chars(EXCERPT_CHARS),
+            post.preview.name if post.preview else "",
+            post.created_at,
+            post.is_published,
+        )
+
+    def __repr__(self):
+        return f"<PostCard {self.id}: {self.title}>"
+
+
+def post_page_key(is_staff, month, token) -> str:
+    scope = f"{month:%Y-%m}" if month else "all"
+    return f"blog:posts:{archive.audience(is_staff)}:{scope}:{token}"
+
+
+def get_post_page(
+    is_staff, *, month=None, page=1, after=None, before=None, page_size=12
+):
+    """Одна страница списка постов: (cards, number, has_next, has_previous).
+    staff видит и черновики; month (date первого числа) сужает выдачу до месяца
+    архива. Навигация — keyset по (created_at, id), без OFFSET и COUNT(*);
+    каждая страница кешируется своим ключом под тегом списка постов,
+    который сбрасывается при сохранении и удалении любого поста."""
+
+    def compute():
+        qs = Post.objects.only(
+            "id", "title", "preview", "created_at", "is_published"
+        ).annotate(head=Left("content", EXCERPT_CHARS + 1))
+        if not is_staff:
+            qs = qs.filter(is_published=True)
+        if month is not None:
+            start, end = archive.month_bounds(month)
+            qs = qs.filter(created_at__gte=start, created_at__lt=end)
+        rows, number, has_next, has_previous = keyset_page_rows(
+            qs,
+            page_size,
+            ordering=DEFAULT_ORDERING,
+            after=after,
+            before=before,
+            page=page,
+        )
+        cards = [PostCard.from_post(post).to_tuple() for post in rows]
+        return cards, number, has_next, has_previous
+
+    rows, number, has_next, has_previous = read_through(
+        post_page_key(is_staff, month, page_token(after, before, page)),
+        compute,
+        tags=[POSTS_TAG],
+    )
+    return [PostCard(*row) for row in rows], number, has_next, has_previous
+
+
+# ---------- ПОИСК ----------
+
+# Границы подсветки в ts_headline — управляющие символы, которых нет в тексте:
+# текст поста экранируется целиком, и только потом они становятся <mark>
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_STOP = "\x03"
+
+
+def highlight(text: str) -> str:
+    """Экранированный HTML с <mark> вместо границ подсветки ts_headline."""
+    return (
+        escape(text)
+        .replace(HIGHLIGHT_START, "<mark>")
+        .replace(HIGHLIGHT_STOP, "</mark>")
+    )
+
+
+class PostHit:
+    """Результат поиска по блогу: заголовок и фрагменты текста с подсвеченными
+    словами запроса (готовый HTML). В кеше хранится кортежем."""
+
+    __slots__ = ("id", "title", "snippet", "created_at")
+
+    def __init__(self, id, title, snippet, created_at):
+        self.id = id
+        self.title = mark_safe(title)
+        self.snippet = mark_safe(snippet)
+        self.created_at = created_at
+
+    @property
+    def pk(self):
+        return self.id
+
+    def get_absolute_url(self):
+        return reverse("blog:post_detail", kwargs={"pk": self.id})
+
+    def __repr__(self):
+        return f"<PostHit {self.id}>"
+
+
+def search_posts(query, *, page=1, page_size=10):
+    """Одна страница результатов полнотекстового поиска по опубликованным постам:
+    (hits, number, has_next, has_previous). Запрос разбирается как websearch
+    с русской морфологией, выдача сортируется по SearchRank, поиск идёт
+    по GIN-индексу blog_post_search_gin. Фрагменты с подсветкой строит
+    ts_headline в том же запросе; Postgres откладывает дорогие выражения
+    списка SELECT до LIMIT, поэтому они считаются только для строк страницы.
+    Страница кешируется по нормализованному запросу под тегом списка постов."""
+    query = normalize_search_query(query)
+    digest = hashlib.sha1(query.encode()).hexdigest()
+    cache_key = f"search:posts:{digest}:{page_token(page=page)}"
+
+    def compute():
+        search_query = SearchQuery(query, search_type="websearch", config=SEARCH_CONFIG)
+        marks = {"start_sel": HIGHLIGHT_START, "stop_sel": HIGHLIGHT_STOP}
+        qs = (
+            Post.objects.filter(is_published=True, search_vector=search_query)
+            .annotate(
+                rank=SearchRank(F("search_vector"), search_query),
+                title_headline=SearchHeadline(
+                    "title",
+                    search_query,
+                    config=SEARCH_CONFIG,
+                    highlight_all=True,
+                    **marks,
+                ),
+                snippet=SearchHeadline(
+                    "content",
+                    search_query,
+                    config=SEARCH_CONFIG,
+                    max_fragments=2,
+                    max_words=30,
+                    min_words=12,
+                    fragment_delimiter=" … ",
+                    **marks,
+                ),
+            )
+            .only("id", "created_at")
+        )
+        rows, number, has_next, has_previous = keyset_page_rows(
+            qs, page_size, ordering=SEARCH_ORDERING, page=page
+        )
+        hits = [
+            (
+                post.pk,
+                highlight(post.title_headline),
+                highlight(post.snippet),
+                post.created_at,
+            )
+            for post in rows
+        ]
+        return hits, number, has_next, has_previous
+
+    hits, number, has_next, has_previous = read_through(
+        cache_key, compute, tags=[POSTS_TAG]
+    )
+    return [PostHit(*hit) for hit in hits], number, has_next, has_previous
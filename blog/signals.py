@@ -0,0 +1,39 @@
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+
+from catalog.cache_utils import POST_IDS_TAG, POSTS_TAG, invalidate_tags, post_tag
+from . import archive
+from .models import Post
+
+
+@receiver([post_save, post_delete], sender=Post)
+def invalidate_post_cache(sender, instance: Post, signal, **kwargs):
+    """Сохранение/удаление поста сбрасывает записи кеша, зависящие от него и от списка постов.
+    Битовые карты id — только если пост появился, исчез или сменил публикацию."""
+    tags = [POSTS_TAG, post_tag(instance.pk)]
+    before = getattr(instance, "_archive_state_before", None)
+    if signal is post_delete or before is None or before[1] != instance.is_published:
+        tags.append(POST_IDS_TAG)
+    invalidate_tags(*tags)
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_archive_state(sender, instance: Post, **kwargs):
+    """Запоминаем, как пост учтён в архиве по месяцам до сохранения."""
+    instance._archive_state_before = (
+        None if instance._state.adding else archive.stored_state(instance)
+    )
+
+
+@receiver(post_save, sender=Post)
+def update_post_archive(sender, instance: Post, **kwargs):
+    """Сдвигаем счётчики месяца на разницу состояний."""
+    old = getattr(instance, "_archive_state_before", None)
+    new = archive.current_state(instance)
+    archive.apply_deltas(archive.state_deltas(old, new))
+    instance._archive_state = new
+
+
+@receiver(post_delete, sender=Post)
+def remove_post_archive(sender, instance: Post, **kwargs):
+    archive.apply_deltas(archive.state_deltas(archive.stored_state(instance), None))
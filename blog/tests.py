@@ -1,3 +1,224 @@
-from django.test import TestCase
+import os
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.postgres.search import SearchQuery
+from django.db import DatabaseError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from catalog.models import SEARCH_CONFIG
+from blog import archive, milestones, view_counter
+from blog.models import Post, PostArchiveMonth
+from blog.services import search_posts
+from notifications.models import OutboxEmail
+
+
+class PostSearchVectorTests(TestCase):
+    """Поисковый вектор поста считает сам Postgres — и при записи мимо save()."""
+
+    def setUp(self):
+        self.post = Post.objects.create(title="Обзор самоката", content="Колёса и рама")
+
+    def found(self, query):
+        search_query = SearchQuery(query, config=SEARCH_CONFIG)
+        return list(
+            Post.objects.filter(search_vector=search_query).values_list(
+                "pk", flat=True
+            )
+        )
+
+    def test_vector_follows_save_and_queryset_update(self):
+        self.assertEqual(self.found("самокаты"), [self.post.pk])
+        Post.objects.filter(pk=self.post.pk).update(content="Складной руль")
+        self.assertEqual(self.found("руль"), [self.post.pk])
+        self.assertEqual(self.found("рама"), [])
+
+    def test_counted_save_keeps_vector(self):
+        post = Post.objects.get(pk=self.post.pk)
+        post.views_count += 5
+        post.title = "Обзор велосипеда"
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual(post.views_count, 5)
+        self.assertEqual(self.found("велосипед"), [self.post.pk])
+
+    def test_search_snippet_escapes_html_except_marks(self):
+        Post.objects.create(
+            title="Заметка <b>о самокате</b>",
+            content='Обзор <script>alert("самокат")</script> и складной самокат',
+        )
+        hits, *_ = search_posts("самокат")
+        hit = next(hit for hit in hits if hit.id != self.post.pk)
+        for html in (hit.title, hit.snippet):
+            self.assertIn("<mark>", html)
+            plain = html.replace("<mark>", "").replace("</mark>", "")
+            self.assertNotIn("<", plain)
+        # сами теги ts_headline выбрасывает, остальное экранировано
+        self.assertNotIn("script>", hit.snippet)
+        self.assertIn("alert(&quot;самокат&quot;)", hit.snippet)
+
+
+@override_settings(BLOG_VIEW_MILESTONES=(100, 1000))
+class MilestoneSaveTests(TestCase):
+    def test_save_without_views_delta_sends_nothing(self):
+        post = Post.objects.create(title="Пост", content="Текст")
+        # счётчик уже за рубежом, но save() его не меняет — письма нет
+        Post.objects.filter(pk=post.pk).update(views_count=150)
+        post = Post.objects.get(pk=post.pk)
+        post.title = "Новый заголовок"
+        post.save()
+        self.assertFalse(OutboxEmail.objects.exists())
+
+
+@override_settings(BLOG_VIEW_MILESTONES=(100, 1000))
+class MilestoneConcurrencyTests(TransactionTestCase):
+    """Два воркера одновременно переводят пост через рубеж — письмо одно."""
+
+    def test_concurrent_saves_crossing_threshold_send_one_email(self):
+        post = Post.objects.create(title="Пост", content="Текст")
+        Post.objects.filter(pk=post.pk).update(views_count=90)
+        barrier = threading.Barrier(2)
+        errors = []
+
+        def worker():
+            try:
+                loaded = Post.objects.get(pk=post.pk)
+                loaded.views_count += 10
+                barrier.wait(5)
+                loaded.save()
+            except Exception as exc:  # pragma: no cover - видно в assert ниже
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        post.refresh_from_db()
+        self.assertEqual(post.views_count, 110)
+        self.assertEqual(OutboxEmail.objects.count(), 1)
+
+
+class ViewCounterBufferTests(TestCase):
+    def setUp(self):
+        self.buffer = view_counter.ViewCounterBuffer()
+        # фоновый поток сброса в тестах не нужен — сбрасываем вручную
+        self.buffer._flusher_pid = os.getpid()
+        self.first = Post.objects.create(title="Первый", content="Текст")
+        self.second = Post.objects.create(title="Второй", content="Текст")
+
+    def views(self, post):
+        post.refresh_from_db()
+        return post.views_count
+
+    def test_flush_writes_all_posts_with_one_update(self):
+        for _ in range(3):
+            self.buffer.record(self.first.pk)
+        self.assertEqual(self.buffer.record(self.second.pk), 1)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.buffer.flush(), 2)
+        updates = [q["sql"] for q in queries if q["sql"].lstrip().startswith("WITH")]
+        self.assertEqual(len(updates), 1)
+        self.assertIn("views_count = post.views_count + deltas.delta", updates[0])
+        self.assertEqual((self.views(self.first), self.views(self.second)), (3, 1))
+        self.assertEqual(self.buffer.pending(self.first.pk), 0)
+
+    def test_views_recorded_during_flush_are_not_lost(self):
+        add_views = milestones.add_views
+
+        def racing_add_views(deltas):
+            # просмотры, пришедшие, пока идёт UPDATE, копятся в новом буфере
+            self.buffer.record(self.first.pk)
+            self.buffer.record(self.first.pk)
+            return add_views(deltas)
+
+        self.buffer.record(self.first.pk)
+        with mock.patch("blog.milestones.add_views", side_effect=racing_add_views):
+            self.buffer.flush()
+        self.assertEqual(self.views(self.first), 1)
+        self.assertEqual(self.buffer.pending(self.first.pk), 2)
+        self.buffer.flush()
+        self.assertEqual(self.views(self.first), 3)
+
+    def test_concurrent_records_and_flushes_add_up(self):
+        def record_many():
+            for _ in range(500):
+                self.buffer.record(self.first.pk)
+
+        threads = [threading.Thread(target=record_many) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            self.buffer.flush()
+        for thread in threads:
+            thread.join()
+        self.buffer.flush()
+        self.assertEqual(self.views(self.first), 2000)
+
+    def test_failed_flush_keeps_views(self):
+        self.buffer.record(self.first.pk)
+        with mock.patch("blog.milestones.add_views", side_effect=DatabaseError):
+            with self.assertLogs("blog.view_counter", "WARNING"):
+                self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(self.buffer.pending(self.first.pk), 1)
+        self.buffer.flush()
+        self.assertEqual(self.views(self.first), 1)
+
+
+class ArchiveCountsTests(TestCase):
+    """Счётчики архива по месяцам ведутся сигналами и совпадают с пересчётом."""
+
+    def setUp(self):
+        self.month = archive.month_of(timezone.now())
+
+    def counts(self):
+        return {
+            (month, aud): count
+            for month, aud, count in PostArchiveMonth.objects.filter(
+                count__gt=0
+            ).values_list("month", "audience", "count")
+        }
+
+    def test_publish_unpublish_and_delete_move_counters(self):
+        staff = (self.month, archive.AUDIENCE_STAFF)
+        public = (self.month, archive.AUDIENCE_PUBLIC)
+        post = Post.objects.create(title="Пост", content="Текст", is_published=False)
+        self.assertEqual(self.counts(), {staff: 1})
+
+        post.is_published = True
+        post.save()
+        self.assertEqual(self.counts(), {staff: 1, public: 1})
+
+        post = Post.objects.get(pk=post.pk)
+        post.is_published = False
+        post.save()
+        self.assertEqual(self.counts(), {staff: 1})
+
+        post.delete()
+        self.assertEqual(self.counts(), {})
+
+    def test_incremental_counters_match_rebuild(self):
+        posts = [
+            Post.objects.create(
+                title=f"Пост {i}", content="Текст", is_published=i % 2 == 0
+            )
+            for i in range(5)
+        ]
+        # перенос в прошлый месяц через save() и удаление — тоже сигналами
+        posts[0].created_at -= timedelta(days=40)
+        posts[0].save()
+        posts[1].is_published = True
+        posts[1].save()
+        posts[2].delete()
+        incremental = self.counts()
+
+        archive.rebuild()
+        self.assertEqual(self.counts(), incremental)
+        self.assertEqual(len({month for month, _ in incremental}), 2)
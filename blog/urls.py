@@ -5,12 +5,14 @@ from .views import (
     PostCreateView,
     PostUpdateView,
     PostDeleteView,
+    PostSearchView,
 )
 
 app_name = "blog"
 
 urlpatterns = [
     path("", PostListView.as_view(), name="post_list"),
+    path("search/", PostSearchView.as_view(), name="post_search"),
     path("<int:pk>/", PostDetailView.as_view(), name="post_detail"),
     path("create/", PostCreateView.as_view(), name="post_add"),
     path("<int:pk>/edit/", PostUpdateView.as_view(), name="post_edit"),
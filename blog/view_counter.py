@@ -0,0 +1,90 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections
+
+from blog import milestones
+
+logger = logging.getLogger(__name__)
+
+# ---------- БУФЕР ПРОСМОТРОВ ПОСТОВ ----------
+# Просмотр поста не пишет в БД: +1 копится в памяти процесса, а фоновый поток
+# раз в BLOG_VIEWS_FLUSH_INTERVAL секунд (и при завершении процесса) сбрасывает
+# накопленное одним UPDATE на все посты сразу (blog.milestones.add_views — он же
+# отмечает рубежи просмотров). Если сброс не удался, просмотры возвращаются
+# в буфер и уйдут со следующим.
+# Это сознательный компромисс ради того, чтобы просмотр не стоил записи в БД:
+# - при SIGKILL/OOM процесса теряются просмотры последних
+#   BLOG_VIEWS_FLUSH_INTERVAL секунд (atexit срабатывает только при штатном
+#   завершении, в том числе по SIGTERM от gunicorn);
+# - страница поста показывает число из БД плюс несброшенные просмотры только
+#   своего процесса: соседние воркеры догонят его при следующем сбросе.
+# Для счётчика просмотров оба расхождения допустимы.
+
+
+class ViewCounterBuffer:
+    """Несброшенные просмотры процесса {post_id: n} и их периодический сброс."""
+
+    def __init__(self):
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._flusher_pid = None
+
+    def record(self, post_id) -> int:
+        """+1 просмотр поста; возвращает число ещё не сброшенных просмотров."""
+        self._ensure_flusher()
+        with self._lock:
+            self._pending[post_id] += 1
+            return self._pending[post_id]
+
+    def pending(self, post_id) -> int:
+        with self._lock:
+            return self._pending.get(post_id, 0)
+
+    def flush(self) -> int:
+        """Записывает накопленные просмотры в БД; возвращает число постов."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, Counter()
+            if not batch:
+                return 0
+            try:
+                updated = milestones.add_views(batch)
+            except Exception:
+                logger.warning("Не удалось сбросить просмотры постов", exc_info=True)
+                with self._lock:
+                    self._pending.update(batch)
+                return 0
+        return len(updated)
+
+    def _ensure_flusher(self):
+        """Фоновый поток сброса — один на процесс (после fork — заново)."""
+        if self._flusher_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+            threading.Thread(
+                target=self._run, name="blog-views-flush", daemon=True
+            ).start()
+
+    def _run(self):
+        while True:
+            time.sleep(getattr(settings, "BLOG_VIEWS_FLUSH_INTERVAL", 5))
+            try:
+                self.flush()
+            finally:
+                # у потока своё соединение с БД — не держим его между сбросами
+                connections.close_all()
+
+
+buffer = ViewCounterBuffer()
+atexit.register(buffer.flush)
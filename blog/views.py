@@ -1,3 +1,4 @@
+from django.http import Http404
 from django.urls import reverse, reverse_lazy
 from django.views.generic import (
     ListView,
@@ -13,31 +14,111 @@ from django.contrib.auth.mixins import (
 )
 from django.utils import timezone
 from django.contrib import messages
+from django.utils.cache import patch_cache_control
+from catalog.cache_utils import (
+    POST_IDS_TAG,
+    POSTS_TAG,
+    note_response_tags,
+    post_tag,
+)
+from catalog.degraded import stale_page
+from catalog.id_bitmaps import is_known_id
+from catalog.views import KeysetPaginationMixin
+from . import archive, view_counter
+from catalog.services import SEARCH_ORDERING, normalize_search_query
+from .services import get_post_page, search_posts
 from .models import Post
 from .forms import PostForm
-from django.db.models import F
 
 
-class PostListView(ListView):
-    """Список постов. Для staff — все, для остальных — только опубликованные."""
+class PostListView(KeysetPaginationMixin, ListView):
+    """Список постов. Для staff — все, для остальных — только опубликованные.
+    Страницы листаются курсором по (created_at, id) и кешируются
+    (blog.services.get_post_page); ?month=ГГГГ-ММ — посты месяца из архива."""
 
     model = Post
     template_name = "blog/post_list.html"
     context_object_name = "posts"
     paginate_by = 12
 
+    @staticmethod
+    def page_cache_tags(view_kwargs):
+        """Теги страницы для AnonymousPageCacheMiddleware."""
+        return [POSTS_TAG]
+
+    @staticmethod
+    def degraded_response(request, view_kwargs):
+        """Ответ без БД (catalog.degraded): последняя закешированная страница."""
+        return stale_page(request)
+
+    def get(self, request, *args, **kwargs):
+        user = request.user
+        self.is_staff = user.is_authenticated and user.is_staff
+        self.month = None
+        if request.GET.get("month"):
+            self.month = archive.parse_month(request.GET["month"])
+            if self.month is None:
+                raise Http404("Некорректный месяц архива.")
+        return super().get(request, *args, **kwargs)
+
     def get_queryset(self):
-        qs = Post.objects.all().order_by("-created_at")
-        user = self.request.user
-        return (
-            qs
-            if (user.is_authenticated and user.is_staff)
-            else qs.filter(is_published=True)
+        # строки страницы выбирает сервис, сюда нужен только тип модели
+        return Post.objects.none()
+
+    def get_page_rows(self, queryset, page_size, *, after, before, page):
+        return get_post_page(
+            self.is_staff,
+            month=self.month,
+            page=page,
+            after=after,
+            before=before,
+            page_size=page_size,
         )
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # теги страницы для Surrogate-Key: список постов и каждый пост на странице
+        note_response_tags(
+            POSTS_TAG, *(post_tag(post.pk) for post in context["posts"])
+        )
+        context["archive_months"] = archive.months(self.is_staff)
+        context["current_month"] = self.month
+        return context
+
+
+class PostSearchView(KeysetPaginationMixin, ListView):
+    """Полнотекстовый поиск по опубликованным постам: /blog/search/?q=...
+    Результаты отсортированы по релевантности, фрагменты с подсветкой строит
+    БД (см. blog.services.search_posts)."""
+
+    model = Post
+    template_name = "blog/post_search.html"
+    context_object_name = "hits"
+    paginate_by = 10
+    page_ordering = SEARCH_ORDERING
+    cursor_links = False  # ранг не годится для курсора — только ?page=N
+
+    def get(self, request, *args, **kwargs):
+        self.query = normalize_search_query(request.GET.get("q", ""))
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        # строки страницы выбирает сервис, сюда нужен только тип модели
+        return Post.objects.none()
+
+    def get_page_rows(self, queryset, page_size, *, after, before, page):
+        if not self.query:
+            return [], 1, False, False
+        return search_posts(self.query, page=page, page_size=page_size)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["query"] = self.query
+        return context
+
 
 class PostDetailView(DetailView):
-    """Детальная страница поста с атомарным увеличением счётчика просмотров."""
+    """Детальная страница поста со счётчиком просмотров (буферизованным)."""
 
     model = Post
     template_name = "blog/post_detail.html"
@@ -52,12 +133,37 @@ class PostDetailView(DetailView):
             else qs.filter(is_published=True)
         )
 
+    def dispatch(self, request, *args, **kwargs):
+        # несуществующие и неопубликованные id отсекаем по битовой карте до выборки
+        user = request.user
+        is_staff = user.is_authenticated and user.is_staff
+        queryset = Post.objects.all()
+        if not is_staff:
+            queryset = queryset.filter(is_published=True)
+        if not is_known_id(
+            f"post:{'staff' if is_staff else 'public'}",
+            queryset,
+            POST_IDS_TAG,
+            kwargs["pk"],
+        ):
+            raise Http404("Пост не найден.")
+        return super().dispatch(request, *args, **kwargs)
+
     def get_object(self, queryset=None):
         obj = super().get_object(queryset)
-        Post.objects.filter(pk=obj.pk).update(views_count=F("views_count") + 1)
-        obj.refresh_from_db(fields=["views_count"])
+        # просмотр копится в буфере процесса и уходит в БД пачкой (blog.view_counter);
+        # на странице — число из БД плюс ещё не сброшенные просмотры
+        obj.views_count += view_counter.buffer.record(obj.pk)
+        note_response_tags(post_tag(obj.pk))
         return obj
 
+    def get(self, request, *args, **kwargs):
+        response = super().get(request, *args, **kwargs)
+        # каждый просмотр должен дойти до приложения (счётчик) — прокси не кеширует,
+        # но Surrogate-Key всё равно выводится
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
 
 class PostCreateView(LoginRequiredMixin, CreateView):
     """Создание поста."""
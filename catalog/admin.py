@@ -1,5 +1,14 @@
 from django.contrib import admin
-from .models import Product, Category, Contact
+from . import facets, suggest
+from .cache_utils import (
+    PRODUCT_IDS_TAG,
+    PRODUCTS_TAG,
+    category_tag,
+    invalidate_tags,
+    owner_tag,
+    product_tag,
+)
+from .models import Product, Category, Contact, FacetCount
 
 
 @admin.register(Category)
@@ -32,11 +41,43 @@ class ProductAdmin(admin.ModelAdmin):
 
     @admin.action(description="Опубликовать выбранные")
     def make_published(self, request, queryset):
-        queryset.update(is_published=True)
+        tags = self._cache_tags(queryset)
+        facets.set_published(queryset, True)
+        invalidate_tags(*tags)
+        for pk, name in queryset.values_list("pk", "name"):
+            suggest.record_on_commit("product", pk, name)
 
     @admin.action(description="Снять с публикации выбранные")
     def make_unpublished(self, request, queryset):
-        queryset.update(is_published=False)
+        tags = self._cache_tags(queryset)
+        facets.set_published(queryset, False)
+        invalidate_tags(*tags)
+        for pk in queryset.values_list("pk", flat=True):
+            suggest.record_on_commit("product", pk)
+
+    def _cache_tags(self, queryset):
+        """queryset.update() не шлёт сигналы — теги кеша собираем заранее
+        и сбрасываем вручную после обновления."""
+        tags = [PRODUCTS_TAG, PRODUCT_IDS_TAG]
+        for pk, category_id, owner_id in queryset.values_list(
+            "pk", "category_id", "owner_id"
+        ):
+            tags += [product_tag(pk), category_tag(category_id), owner_tag(owner_id)]
+        return tags
+
+
+@admin.register(FacetCount)
+class FacetCountAdmin(admin.ModelAdmin):
+    """Счётчики фасетов — только для просмотра, их ведут сигналы."""
+
+    list_display = ("facet", "key", "audience", "count")
+    list_filter = ("facet", "audience")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
 
 @admin.register(Contact)
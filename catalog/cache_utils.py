@@ -1,15 +1,516 @@
+import hashlib
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, NamedTuple
+
 from django.conf import settings
-from django.core.cache import cache
+from django.db import connections, transaction
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+from catalog import purge
+from catalog.two_tier_cache import tiered_cache
+
+logger = logging.getLogger(__name__)
 
 HOME_CACHE_KEY_PUBLIC = "home:products:public"
 HOME_CACHE_KEY_STAFF = "home:products:staff"
 
+# Общий тег всех списков товаров: любое создание/удаление/изменение товара
+# может сдвинуть страницы главной, поэтому они зависят от него целиком.
+PRODUCTS_TAG = "products"
+POSTS_TAG = "posts"
+# Видимость объектов (создание, публикация, снятие с публикации, удаление) —
+# отдельный тег: от него зависят только битовые карты id (catalog.id_bitmaps),
+# и обычная правка товара или поста их не перестраивает.
+PRODUCT_IDS_TAG = "product-ids"
+POST_IDS_TAG = "post-ids"
+
+# ---------- ТЕГИ ЗАВИСИМОСТЕЙ ----------
+# Каждое закешированное значение хранится вместе со словарём
+# {тег: версия тега на момент записи}. Версия тега лежит в отдельном ключе
+# tag:<имя>. Инвалидация = запись новых версий для всех затронутых тегов
+# одним set_many; записи, в которых запомнена старая версия, при чтении
+# считаются промахом. Удалять сами записи не нужно — их вытеснит TTL.
+# Записи и версии тегов читаются через tiered_cache (L1 в памяти процесса
+# перед Redis), замки — только напрямую из Redis.
+
+
+def tag_key(tag: str) -> str:
+    return f"tag:{tag}"
+
+
+def product_tag(product_id) -> str:
+    return f"product:{product_id}"
+
+
+def category_tag(category_id) -> str:
+    return f"category:{category_id}"
+
+
+def category_info_tag(category_id) -> str:
+    """Только сама категория (название, описание), без её товаров."""
+    return f"category-info:{category_id}"
+
+
+def owner_tag(owner_id) -> str:
+    return f"owner:{owner_id}"
+
+
+def post_tag(post_id) -> str:
+    return f"post:{post_id}"
+
+
+def tags_for_products(products) -> list[str]:
+    """Теги сущностей, которые видны в списке товаров (сами товары и их категории)."""
+    tags = []
+    for product in products:
+        tags.append(product_tag(product.pk))
+        tags.append(category_tag(product.category_id))
+    return list(dict.fromkeys(tags))
+
+
+def _new_version() -> str:
+    """Версия тега: момент инвалидации + случайный хвост.
+    Время нужно, чтобы посчитать, насколько устарела отданная запись."""
+    return f"{time.time():.3f}:{uuid.uuid4().hex[:8]}"
+
+
+def _version_time(version) -> float:
+    try:
+        return float(str(version).split(":", 1)[0])
+    except ValueError:
+        return 0.0
+
+
+class CacheEntry(NamedTuple):
+    """То, что реально лежит в кеше под ключом записи."""
+
+    value: Any
+    versions: dict  # {тег: версия тега на момент выборки}
+    expires_at: float  # логический срок жизни (time.time())
+    delta: float  # сколько секунд заняло вычисление значения
+
+
+def _read_entry(key: str):
+    """Возвращает (entry, stale_for).
+    stale_for = None — запись свежая; иначе это сколько секунд назад истёк
+    её логический срок или был инвалидирован один из её тегов.
+    Устаревшая запись ещё может пригодиться как «предыдущее значение»."""
+    entry = tiered_cache.get(key)
+    if not isinstance(entry, CacheEntry):
+        return None, None
+    now = time.time()
+    stale_since = entry.expires_at if entry.expires_at <= now else None
+    if entry.versions:
+        current = tiered_cache.get_many([tag_key(tag) for tag in entry.versions])
+        for tag, version in entry.versions.items():
+            new_version = current.get(tag_key(tag))
+            if new_version != version:
+                invalidated_at = _version_time(new_version) if new_version else now
+                stale_since = min(stale_since or now, invalidated_at)
+    if stale_since is None:
+        return entry, None
+    return entry, max(now - stale_since, 0.0)
+
+
+def get_tagged(key: str):
+    """Читает значение, записанное set_tagged. Возвращает None, если ключа нет,
+    его срок истёк или хотя бы один из его тегов был инвалидирован после записи."""
+    entry, stale_for = _read_entry(key)
+    return entry.value if entry is not None and stale_for is None else None
+
+
+def read_stale(key: str):
+    """(значение, на сколько секунд устарело) независимо от свежести записи —
+    срок истёк или теги инвалидированы; (None, None), если записи нет.
+    Для аварийного режима без БД (catalog.degraded), когда лучше
+    показать старую страницу, чем ошибку."""
+    entry, stale_for = _read_entry(key)
+    if entry is None:
+        return None, None
+    return entry.value, stale_for
+
+
+def tag_versions(tags, create=True) -> dict:
+    """Текущие версии тегов; отсутствующие теги заводятся с новой версией.
+    create=False — только чтение: отсутствующих тегов в ответе нет. Нужно там,
+    где тег строится из id в URL ещё до проверки, что объект существует, —
+    иначе каждый случайный id оставлял бы в Redis вечный ключ тега."""
+    tags = list(dict.fromkeys(tags))
+    stored = tiered_cache.get_many([tag_key(tag) for tag in tags])
+    if not create:
+        return {tag: stored[tag_key(tag)] for tag in tags if tag_key(tag) in stored}
+    missing = {
+        tag_key(tag): _new_version() for tag in tags if tag_key(tag) not in stored
+    }
+    if missing:
+        # версии тегов живут без TTL, иначе записи разом «протухнут» вместе с ними
+        tiered_cache.set_many(missing, None)
+        stored.update(missing)
+    return {tag: stored[tag_key(tag)] for tag in tags}
+
+
+def set_tagged(key: str, value, tags, timeout=None, versions=None, delta=0.0):
+    """Кладёт значение в кеш вместе с версиями его тегов.
+    versions — версии, снятые tag_versions() ДО выборки из БД: если между
+    выборкой и записью тег успели инвалидировать, запись сразу окажется
+    устаревшей, а не переживёт инвалидацию.
+    timeout — логический («мягкий») срок жизни. Физически запись живёт дольше:
+    до CACHE_HARD_TTL в режиме stale-while-revalidate или на CACHE_LOCK_TIMEOUT
+    дольше мягкого срока без него — чтобы во время пересчёта было что отдать."""
+    timeout = timeout or _soft_ttl()
+    versions = dict(versions or {})
+    rest = [tag for tag in tags if tag not in versions]
+    if rest:
+        versions.update(tag_versions(rest))
+    entry = CacheEntry(value, versions, time.time() + timeout, delta)
+    physical = timeout + getattr(settings, "CACHE_LOCK_TIMEOUT", 10)
+    if _swr_enabled():
+        physical = max(physical, getattr(settings, "CACHE_HARD_TTL", physical))
+    tiered_cache.set(key, entry, physical)
+
+
+def _soft_ttl() -> int:
+    return getattr(settings, "CACHE_SOFT_TTL", None) or getattr(
+        settings, "CACHE_TTL", 300
+    )
+
+
+def _swr_enabled() -> bool:
+    return getattr(settings, "CACHE_STALE_WHILE_REVALIDATE", False)
+
+
+# ---------- ЗАЩИТА ОТ STAMPEDE ----------
+# Когда популярный ключ инвалидирован, пересчитывать его должен один воркер.
+# Замок — add в L2 (в Redis это SET NX EX), так что он сам снимется
+# через CACHE_LOCK_TIMEOUT, даже если держатель упал. Остальные воркеры
+# отдают предыдущее значение, а если его нет — недолго ждут результата.
+# Горячие ключи пересчитываются чуть раньше срока (вероятностное раннее
+# обновление, XFetch): чем дольше считается значение и чем ближе срок,
+# тем выше шанс, что очередной запрос возьмётся за пересчёт заранее.
+
+
+def _lock_key(key: str) -> str:
+    return f"lock:{key}"
+
+
+def _acquire_lock(key: str):
+    token = _new_version()
+    timeout = getattr(settings, "CACHE_LOCK_TIMEOUT", 10)
+    return token if tiered_cache.l2.add(_lock_key(key), token, timeout) else None
+
+
+def _release_lock(key: str, token: str):
+    # снимаем только свой замок: чужой мог появиться, если наш истёк по таймауту;
+    # проверка и удаление — одна операция, иначе между ними замок могут перехватить
+    tiered_cache.l2.delete_if(_lock_key(key), token)
+
+
+def _should_refresh_early(entry: CacheEntry) -> bool:
+    beta = getattr(settings, "CACHE_EARLY_REFRESH_BETA", 1.0)
+    if entry.delta <= 0 or beta <= 0:
+        return False
+    # 1 - random() лежит в (0, 1], логарифм отрицателен → сдвиг «вперёд во времени»
+    jitter = -entry.delta * beta * math.log(1.0 - random.random())
+    return time.time() + jitter >= entry.expires_at
+
+
+def _wait_for_value(key: str):
+    """Ждёт, пока держатель замка запишет значение, не дольше CACHE_LOCK_WAIT."""
+    deadline = time.monotonic() + getattr(settings, "CACHE_LOCK_WAIT", 0.5)
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        value = get_tagged(key)
+        if value is not None:
+            return value
+    return None
+
+
+# ---------- ТЕГИ ОТВЕТА ДЛЯ ПРОКСИ/CDN ----------
+# Все теги значений, прочитанных через read_through за время запроса, копятся
+# здесь; SurrogateKeyMiddleware выводит их в Surrogate-Key / Cache-Tag, и прокси
+# может сбросить ровно те страницы, где встречался изменившийся товар или пост.
+
+_response_tags: ContextVar = ContextVar("response_tags", default=None)
+
 
-def invalidate_home_products():
-    """Чистит оба ключа кэша списка товаров на главной."""
+def reset_response_tags():
+    _response_tags.set([])
+
+
+@contextmanager
+def untracked_response_tags():
+    """Чтения внутри блока не попадают в Surrogate-Key — для служебных значений,
+    от которых зависит решение view, но не содержимое страницы."""
+    token = _response_tags.set(None)
+    try:
+        yield
+    finally:
+        _response_tags.reset(token)
+
+
+def note_response_tags(*tags):
+    """Отмечает, что страница зависит от тегов (для заголовка Surrogate-Key)."""
+    collected = _response_tags.get()
+    if collected is not None:
+        collected.extend(tags)
+
+
+def response_tags() -> list[str]:
+    return list(dict.fromkeys(_response_tags.get() or ()))
+
+
+def is_anonymous_request(request) -> bool:
+    """Без cookie сессии и сообщений страница одинакова для всех посетителей."""
+    return (
+        settings.SESSION_COOKIE_NAME not in request.COOKIES
+        and "messages" not in request.COOKIES
+    )
+
+
+def patch_page_cache_control(request, response):
+    """Cache-Control для страниц каталога и блога:
+    - анонимным — public: прокси хранит PROXY_CACHE_TTL секунд (s-maxage) и
+      сбрасывает по purge-запросу, браузер каждый раз проверяет ETag (max-age=0);
+    - остальным — private, no-cache: страница персональная."""
+    if is_anonymous_request(request) and not response.cookies:
+        patch_cache_control(
+            response,
+            public=True,
+            max_age=0,
+            s_maxage=getattr(settings, "PROXY_CACHE_TTL", 300),
+        )
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ("Cookie",))
+
+
+# ---------- STALE-WHILE-REVALIDATE ----------
+# В этом режиме устаревшая (но не старше CACHE_HARD_TTL) запись отдаётся сразу,
+# а пересчёт уходит в фоновый поток — запрос не ждёт БД.
+# Насколько устарело отданное значение, копится в served_staleness() и
+# выводится в заголовок ответа CacheStalenessMiddleware.
+
+_served_staleness: ContextVar = ContextVar("served_staleness", default=None)
+
+
+def reset_served_staleness():
+    _served_staleness.set(None)
+
+
+def served_staleness():
+    """Максимальная «несвежесть» (сек) значений, отданных в текущем запросе, или None."""
+    return _served_staleness.get()
+
+
+def _note_staleness(stale_for):
+    if stale_for is None:
+        return
+    current = _served_staleness.get()
+    _served_staleness.set(stale_for if current is None else max(current, stale_for))
+
+
+def _compute_and_store(key, compute, token, *, timeout, tags, value_tags):
+    """Вычисляет значение под уже взятым замком и кладёт его в кеш."""
+    try:
+        versions = tag_versions(tags) if tags else {}
+        started = time.monotonic()
+        value = compute()
+        delta = time.monotonic() - started
+        all_tags = [*tags, *(value_tags(value) if value_tags else ())]
+        set_tagged(key, value, all_tags, timeout, versions=versions, delta=delta)
+        note_response_tags(*all_tags)
+        return value
+    finally:
+        _release_lock(key, token)
+
+
+def _refresh_in_background(key, compute, token, **kwargs):
+    def run():
+        try:
+            _compute_and_store(key, compute, token, **kwargs)
+        except Exception:
+            logger.exception("Фоновое обновление кеша %s не удалось", key)
+        finally:
+            # у потока своё соединение с БД — закрываем, чтобы не копились
+            connections.close_all()
+
+    threading.Thread(target=run, name=f"cache-refresh:{key}", daemon=True).start()
+
+
+def read_through(
+    key: str,
+    compute,
+    *,
+    timeout=None,
+    tags=(),
+    value_tags=None,
+    stale_ok=True,
+    fallback=None,
+):
+    """Читает значение из кеша, при промахе вычисляет compute() и кладёт результат.
+    - tags — теги, известные заранее (их версии снимаются до выборки);
+    - value_tags(value) — теги, которые становятся известны только по результату
+      (например, id товаров на странице).
+    Пересчитывает ключ только один воркер; остальные получают предыдущее
+    значение или ждут его не дольше CACHE_LOCK_WAIT секунд.
+    В режиме CACHE_STALE_WHILE_REVALIDATE устаревшее значение отдаётся сразу,
+    а пересчёт выполняется в фоне.
+    stale_ok=False — устаревшее значение не отдаётся никогда (например, для
+    HTTP-валидаторов: старый ETag дал бы 304 на изменившуюся страницу).
+    fallback() — что вернуть, если держатель замка не успел за CACHE_LOCK_WAIT:
+    по умолчанию воркер считает compute() сам (без записи в кеш), но для
+    дорогих значений дешевле обойтись без них."""
+    if not getattr(settings, "CACHE_ENABLED", False):
+        return _compute_noted(compute, tags, value_tags)
+
+    timeout = timeout or _soft_ttl()
+    options = {"timeout": timeout, "tags": tuple(tags), "value_tags": value_tags}
+    entry, stale_for = _read_entry(key)
+    if entry is not None and stale_for is None and not _should_refresh_early(entry):
+        note_response_tags(*entry.versions)
+        return entry.value
+    if not stale_ok and stale_for is not None:
+        entry = None
+    if entry is not None:
+        note_response_tags(*entry.versions)
+
+    if entry is not None and _swr_enabled():
+        token = _acquire_lock(key)
+        if token is not None:
+            _refresh_in_background(key, compute, token, **options)
+        _note_staleness(stale_for)
+        return entry.value
+
+    token = _acquire_lock(key)
+    if token is None:
+        # ключ уже пересчитывает другой воркер
+        if entry is not None:
+            _note_staleness(stale_for)
+            return entry.value
+        value = _wait_for_value(key)
+        if value is not None:
+            note_response_tags(*tags)
+            return value
+        # держатель замка не успел — считаем сами, но кеш не трогаем
+        if fallback is not None:
+            return fallback()
+        return _compute_noted(compute, tags, value_tags)
+
+    return _compute_and_store(key, compute, token, **options)
+
+
+def _compute_noted(compute, tags, value_tags):
+    value = compute()
+    note_response_tags(*tags, *(value_tags(value) if value_tags else ()))
+    return value
+
+
+# ---------- ОТЛОЖЕННАЯ ИНВАЛИДАЦИЯ ----------
+# invalidate_tags() ничего не отправляет сразу:
+# - внутри транзакции теги ждут transaction.on_commit — кеш не сбрасывается до
+#   коммита (иначе его успеют заполнить старыми данными) и не трогается при откате;
+# - внутри deferred_invalidation() (весь HTTP-запрос — InvalidationBatchMiddleware,
+#   массовые команды) теги копятся без повторов и уходят одним set_many
+#   (в Redis — один pipeline) и одним purge на выходе из блока.
+
+
+_invalidation_batch: ContextVar = ContextVar("invalidation_batch", default=None)
+
+
+@contextmanager
+def deferred_invalidation():
+    """Копит инвалидации внутри блока и отправляет их одним вызовом на выходе.
+    Вложенные блоки копят во внешний. Годится и как декоратор."""
+    if _invalidation_batch.get() is not None:
+        yield
+        return
+    batch = {}  # упорядоченное множество тегов
+    token = _invalidation_batch.set(batch)
+    try:
+        yield
+    finally:
+        _invalidation_batch.reset(token)
+        _flush_invalidation(list(batch))
+
+
+def invalidate_tags(*tags):
+    """Инвалидирует все записи, зависящие от любого из тегов, и отправляет те же
+    теги на purge прокси/CDN (catalog.purge) — после коммита текущей транзакции
+    и вместе с остальными инвалидациями блока deferred_invalidation()."""
+    tags = [tag for tag in dict.fromkeys(tags) if tag]
+    if tags:
+        transaction.on_commit(lambda: _enqueue_invalidation(tags))
+
+
+def _enqueue_invalidation(tags):
+    batch = _invalidation_batch.get()
+    if batch is None:
+        _flush_invalidation(tags)
+    else:
+        batch.update(dict.fromkeys(tags))
+
+
+def _flush_invalidation(tags):
+    if not tags:
+        return
+    purge.purge_tags(tags)
     if getattr(settings, "CACHE_ENABLED", False):
-        cache.delete_many([HOME_CACHE_KEY_PUBLIC, HOME_CACHE_KEY_STAFF])
+        tiered_cache.set_many({tag_key(tag): _new_version() for tag in tags}, None)
+
+
+def tags_stamp(tags):
+    """Штамп версии набора тегов для HTTP-валидаторов (ETag/Last-Modified):
+    (строка версий, время последней инвалидации любого из тегов).
+    Без кеша или пока какой-то тег ещё не заведён — возвращает None
+    (теги здесь только читаются: view вызывает это до своих проверок)."""
+    if not getattr(settings, "CACHE_ENABLED", False):
+        return None
+    tags = list(dict.fromkeys(tags))
+    versions = tag_versions(tags, create=False)
+    if len(versions) < len(tags):
+        return None
+    stamp = "|".join(f"{tag}={versions[tag]}" for tag in sorted(versions))
+    return stamp, max(_version_time(version) for version in versions.values())
+
+
+def product_invalidation_tags(product) -> list[str]:
+    """Все теги, которые затрагивает сохранение или удаление товара:
+    сам товар, его владелец, его категория (и прежняя, если товар переехал)
+    и общий список товаров."""
+    tags = [
+        PRODUCTS_TAG,
+        product_tag(product.pk),
+        category_tag(product.category_id),
+        owner_tag(product.owner_id),
+    ]
+    loaded = getattr(product, "_loaded_values", {})
+    old_category_id = loaded.get("category_id")
+    if old_category_id is not None and old_category_id != product.category_id:
+        tags.append(category_tag(old_category_id))
+    return tags
+
+
+def product_detail_key(product_id, is_staff: bool) -> str:
+    """Ключ фрагмента страницы товара: товар + видимость (staff видит и черновики)."""
+    return f"product:detail:{product_id}:{'staff' if is_staff else 'public'}"
+
+
+def page_cache_key(full_path: str) -> str:
+    """Ключ целой страницы для анонимных посетителей (путь + query string)."""
+    return f"page:anon:{hashlib.sha1(full_path.encode()).hexdigest()}"
 
 
 def home_key(is_staff: bool) -> str:
     return HOME_CACHE_KEY_STAFF if is_staff else HOME_CACHE_KEY_PUBLIC
+
+
+def home_page_key(is_staff: bool, page_token: str) -> str:
+    """Ключ одной страницы главной: роль + позиция страницы."""
+    return f"{home_key(is_staff)}:{page_token}"
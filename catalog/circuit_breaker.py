@@ -0,0 +1,84 @@
+import threading
+import time
+
+# ---------- ПРЕДОХРАНИТЕЛЬ (CIRCUIT BREAKER) ----------
+# Считает подряд идущие ошибки обращений к внешней системе (Redis, БД).
+# После failure_threshold ошибок «размыкается» (open): обращения не делаются
+# вовсе, вызывающий код сразу идёт по запасному пути и не ждёт таймаутов.
+# Через reset_timeout секунд один вызов пропускается пробным (half_open):
+# успех замыкает предохранитель, ошибка размыкает его снова.
+# Состояние своё у каждого процесса.
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    # числовое значение состояния для метрик
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name, *, failure_threshold=3, reset_timeout=10.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+        self.counters = {"failures": 0, "trips": 0, "rejected": 0}
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def allow(self) -> bool:
+        """Можно ли сейчас обращаться к системе. В состоянии half_open
+        пропускает только один пробный вызов (повторно — если проба
+        не вернулась за reset_timeout)."""
+        if self._state == self.CLOSED:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            if self._state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._probe_started = now
+                return True
+            if (
+                self._state == self.HALF_OPEN
+                and now - self._probe_started >= self.reset_timeout
+            ):
+                self._probe_started = now
+                return True
+        self.counters["rejected"] += 1
+        return False
+
+    def record_success(self) -> bool:
+        """Отмечает успешный вызов. True — предохранитель только что замкнулся
+        после сбоя (можно догнать то, что копилось во время отказа)."""
+        if self._state == self.CLOSED and not self._failures:
+            return False
+        with self._lock:
+            recovered = self._state != self.CLOSED
+            self._state = self.CLOSED
+            self._failures = 0
+        return recovered
+
+    def record_failure(self):
+        with self._lock:
+            self.counters["failures"] += 1
+            self._failures += 1
+            if self._state == self.HALF_OPEN or (
+                self._state == self.CLOSED and self._failures >= self.failure_threshold
+            ):
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self.counters["trips"] += 1
+
+    def stats(self) -> dict:
+        return {
+            "state": self._state,
+            "state_value": self.STATE_VALUES[self._state],
+            **self.counters,
+        }
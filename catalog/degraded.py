@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import InterfaceError, OperationalError
+from django.http import HttpResponse
+
+from catalog.cache_utils import page_cache_key, read_stale
+from catalog.circuit_breaker import CircuitBreaker
+from catalog.fragments import fill_holes
+
+# ---------- АВАРИЙНЫЙ РЕЖИМ БЕЗ БД ----------
+# Если БД не отвечает, страницы каталога и блога отдаются из кеша — последней
+# записанной версией, даже устаревшей, с заголовками Warning и X-Degraded-Mode.
+# Какие view так умеют, решают они сами: статический метод
+# degraded_response(request, view_kwargs) возвращает ответ без обращений к БД
+# или None (в кеше ничего нет). Остальные запросы, в том числе все изменения
+# данных, сразу получают 503 — воркер не ждёт таймаута соединения.
+# Здоровье БД отслеживает предохранитель (catalog.circuit_breaker): после
+# DB_BREAKER_FAILURES ошибок подряд запросы к БД не делаются вовсе, пока
+# раз в DB_BREAKER_RESET секунд пробный запрос не пройдёт успешно.
+# Вся логика — в catalog.middleware.DegradedModeMiddleware.
+
+DB_ERRORS = (OperationalError, InterfaceError)
+DEGRADED_HEADER = "X-Degraded-Mode"
+
+_breaker = None
+
+
+def db_breaker() -> CircuitBreaker:
+    global _breaker
+    if _breaker is None:
+        _breaker = CircuitBreaker(
+            "db",
+            failure_threshold=getattr(settings, "DB_BREAKER_FAILURES", 3),
+            reset_timeout=getattr(settings, "DB_BREAKER_RESET", 5.0),
+        )
+    return _breaker
+
+
+def as_anonymous(request):
+    """В аварийном режиме все — анонимы: сессия и пользователь живут в БД."""
+    request.user = AnonymousUser()
+
+
+def stale_page(request):
+    """Страница из кеша анонимных страниц (AnonymousPageCacheMiddleware),
+    даже устаревшая, с заново отрендеренными «дырками»; None — её там нет."""
+    if not getattr(settings, "CACHE_ENABLED", False):
+        return None
+    cached, stale_for = read_stale(page_cache_key(request.get_full_path()))
+    if cached is None:
+        return None
+    response = HttpResponse(fill_holes(cached["content"], request))
+    for name, value in cached["headers"]:
+        response[name] = value
+    return mark_degraded(response, stale_for)
+
+
+def mark_degraded(response, stale_for=None):
+    # ETag и Last-Modified описывают страницу, которую сейчас нельзя проверить
+    for name in ("ETag", "Last-Modified", "Surrogate-Key", "Cache-Tag"):
+        if response.has_header(name):
+            del response[name]
+    response["Warning"] = '111 - "Revalidation Failed"'
+    response[DEGRADED_HEADER] = "db-unavailable"
+    response["Cache-Control"] = "no-cache"
+    if stale_for is not None:
+        response["X-Cache-Staleness"] = f"{stale_for:.1f}"
+    return response
+
+
+def unavailable_response():
+    response = HttpResponse(
+        "Сервис временно работает только на чтение. Попробуйте позже.",
+        status=503,
+        content_type="text/plain; charset=utf-8",
+    )
+    response["Retry-After"] = str(int(getattr(settings, "DB_BREAKER_RESET", 5)))
+    response[DEGRADED_HEADER] = "db-unavailable"
+    response["Cache-Control"] = "no-store"
+    return response
@@ -0,0 +1,247 @@
+import json
+import zlib
+from datetime import datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from django.utils.safestring import mark_safe
+from django.utils.text import Truncator
+
+try:  # lz4 быстрее zlib на распаковке, но это необязательная зависимость
+    import lz4.frame as lz4_frame
+except ImportError:  # pragma: no cover
+    lz4_frame = None
+
+# Формат блоба: 1 байт версии формата + 1 байт кодека + полезная нагрузка.
+# Нагрузка — JSON «структуры массивов»: по одному массиву на поле карточки,
+# так имена полей не повторяются для каждой строки.
+FORMAT_VERSION = 2  # 2: добавлено updated_at (ключ фрагмента карточки)
+CODEC_RAW = 0
+CODEC_ZLIB = 1
+CODEC_LZ4 = 2
+
+CARD_FIELDS = (
+    "id",
+    "name",
+    "description",
+    "price",
+    "image",
+    "category_id",
+    "category_name",
+    "created_at",
+    "updated_at",
+)
+DESCRIPTION_CHARS = 100  # как truncatechars:100 в шаблонах карточек
+
+
+class UnsupportedCardFormat(ValueError):
+    """Блоб записан другой (например, более новой) версией формата."""
+
+
+class ImageRef:
+    """Замена FieldFile для шаблонов: {% if product.image %} и product.image.url."""
+
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name or ""
+
+    def __bool__(self):
+        return bool(self.name)
+
+    @property
+    def url(self):
+        return default_storage.url(self.name)
+
+
+class CategoryRef:
+    __slots__ = ("id", "name")
+
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+    @property
+    def pk(self):
+        return self.id
+
+
+class ProductCard:
+    """Лёгкая карточка товара для списков — ровно то, что выводят шаблоны
+    home.html / category_products.html, плюс поля для курсора пагинации."""
+
+    __slots__ = (
+        "id",
+        "name",
+        "description",
+        "price",
+        "image",
+        "category_id",
+        "category",
+        "created_at",
+        "updated_at",
+    )
+
+    def __init__(
+        self,
+        id,
+        name,
+        description,
+        price,
+        image,
+        category_id,
+        category_name,
+        created_at,
+        updated_at,
+    ):
+        self.id = id
+        self.name = name
+        self.description = description
+        self.price = price
+        self.image = ImageRef(image)
+        self.category_id = category_id
+        self.category = CategoryRef(category_id, category_name)
+        self.created_at = created_at
+        self.updated_at = updated_at
+
+    @property
+    def pk(self):
+        return self.id
+
+    def get_absolute_url(self):
+        return reverse("catalog:product_detail", kwargs={"pk": self.id})
+
+    @classmethod
+    def from_product(cls, product):
+        """Карточка из Product (категория должна быть подгружена select_related)."""
+        return cls(
+            product.pk,
+            product.name,
+            Truncator(product.description or "").chars(DESCRIPTION_CHARS),
+            product.price,
+            product.image.name if product.image else "",
+            product.category_id,
+            product.category.name,
+            product.created_at,
+            product.updated_at,
+        )
+
+    def __repr__(self):
+        return f"<ProductCard {self.id}: {self.name}>"
+
+
+class ProductDetail:
+    """Закешированная страница товара: готовый HTML карточки (body) и поля,
+    нужные вне кешируемой части — заголовку и персональным кнопкам."""
+
+    __slots__ = ("id", "name", "is_published", "owner_id", "category_id", "body")
+
+    def __init__(self, id, name, is_published, owner_id, category_id, body):
+        self.id = id
+        self.name = name
+        self.is_published = is_published
+        self.owner_id = owner_id
+        self.category_id = category_id
+        self.body = mark_safe(body)
+
+    @property
+    def pk(self):
+        return self.id
+
+    def get_absolute_url(self):
+        return reverse("catalog:product_detail", kwargs={"pk": self.id})
+
+    @classmethod
+    def from_product(cls, product, body):
+        return cls(
+            product.pk,
+            product.name,
+            product.is_published,
+            product.owner_id,
+            product.category_id,
+            body,
+        )
+
+    def to_dict(self) -> dict:
+        """Значение для кеша: простой dict без ссылок на классы проекта."""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "is_published": self.is_published,
+            "owner_id": self.owner_id,
+            "category_id": self.category_id,
+            "body": str(self.body),
+        }
+
+    def __repr__(self):
+        return f"<ProductDetail {self.id}: {self.name}>"
+
+
+def encode_cards(cards) -> bytes:
+    """Упаковывает карточки в компактный версионированный блоб.
+    Нагрузка больше CACHE_COMPRESS_MIN_BYTES сжимается lz4 (если установлен) или zlib."""
+    columns = {
+        "id": [c.id for c in cards],
+        "name": [c.name for c in cards],
+        "description": [c.description for c in cards],
+        "price": [str(c.price) for c in cards],
+        "image": [c.image.name for c in cards],
+        "category_id": [c.category_id for c in cards],
+        "category_name": [c.category.name for c in cards],
+        "created_at": [c.created_at.isoformat() for c in cards],
+        "updated_at": [c.updated_at.isoformat() for c in cards],
+    }
+    payload = json.dumps(
+        [columns[name] for name in CARD_FIELDS],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode()
+
+    codec = CODEC_RAW
+    if len(payload) >= getattr(settings, "CACHE_COMPRESS_MIN_BYTES", 1024):
+        if lz4_frame is not None:
+            codec, payload = CODEC_LZ4, lz4_frame.compress(payload)
+        else:
+            codec, payload = CODEC_ZLIB, zlib.compress(payload)
+    return bytes((FORMAT_VERSION, codec)) + payload
+
+
+def decode_cards(blob: bytes) -> list[ProductCard]:
+    """Распаковывает блоб encode_cards обратно в список ProductCard."""
+    version, codec, payload = blob[0], blob[1], blob[2:]
+    if version != FORMAT_VERSION:
+        raise UnsupportedCardFormat(version)
+    if codec == CODEC_ZLIB:
+        payload = zlib.decompress(payload)
+    elif codec == CODEC_LZ4:
+        if lz4_frame is None:
+            raise UnsupportedCardFormat("lz4")
+        payload = lz4_frame.decompress(payload)
+
+    (
+        ids,
+        names,
+        descriptions,
+        prices,
+        images,
+        cat_ids,
+        cat_names,
+        created,
+        updated,
+    ) = json.loads(payload)
+    return [
+        ProductCard(
+            ids[i],
+            names[i],
+            descriptions[i],
+            Decimal(prices[i]),
+            images[i],
+            cat_ids[i],
+            cat_names[i],
+            datetime.fromisoformat(created[i]),
+            datetime.fromisoformat(updated[i]),
+        )
+        for i in range(len(ids))
+    ]
@@ -0,0 +1,231 @@
+import bisect
+from collections import Counter
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, Count, IntegerField, Value, When
+from django.utils.http import urlencode
+
+from catalog.models import FacetCount, Product
+
+# ---------- ФАСЕТЫ КАТАЛОГА ----------
+# Число товаров по категориям и по ценовым диапазонам внутри категории
+# хранится в таблице FacetCount и меняется на ±1 при каждом изменении товара,
+# поэтому страницы списков читают готовые числа вместо COUNT(*) GROUP BY
+# по всей catalog_product. Счётчики ведутся отдельно для staff (все товары)
+# и для публичной выдачи (только опубликованные).
+# Если счётчики разошлись с данными (правка мимо ORM, смена PRICE_FACET_BUCKETS),
+# их пересчитывает manage.py rebuild_facets.
+
+FACET_CATEGORY = "category"
+FACET_CATEGORY_PRICE = "category_price"
+
+# аудитории объявлены в модели (там же choices для админки)
+AUDIENCE_PUBLIC = FacetCount.AUDIENCE_PUBLIC
+AUDIENCE_STAFF = FacetCount.AUDIENCE_STAFF
+
+_STATE_FIELDS = ("category_id", "price", "is_published")
+
+
+def price_bounds() -> list[Decimal]:
+    """Нижние границы ценовых диапазонов: [b0, b1), [b1, b2), ..., [bN, ∞)."""
+    return [Decimal(str(b)) for b in getattr(settings, "PRICE_FACET_BUCKETS", (0,))]
+
+
+def price_bucket(price) -> int:
+    return max(bisect.bisect_right(price_bounds(), Decimal(price)) - 1, 0)
+
+
+def audience(is_staff: bool) -> str:
+    return AUDIENCE_STAFF if is_staff else AUDIENCE_PUBLIC
+
+
+def _contributions(state):
+    """Ключи (facet, key, audience), в которые товар с таким состоянием даёт +1."""
+    if state is None:
+        return []
+    category_id, price, is_published = state
+    keys = [
+        (FACET_CATEGORY, str(category_id)),
+        (FACET_CATEGORY_PRICE, f"{category_id}:{price_bucket(price)}"),
+    ]
+    audiences = [AUDIENCE_STAFF] + ([AUDIENCE_PUBLIC] if is_published else [])
+    return [(facet, key, aud) for facet, key in keys for aud in audiences]
+
+
+def state_deltas(old, new) -> Counter:
+    """Изменения счётчиков при переходе товара из состояния old в new
+    (состояние — кортеж (category_id, price, is_published), None — товара нет)."""
+    deltas = Counter()
+    for item in _contributions(old):
+        deltas[item] -= 1
+    for item in _contributions(new):
+        deltas[item] += 1
+    return deltas
+
+
+def apply_deltas(deltas):
+    """Применяет изменения счётчиков одним INSERT ... ON CONFLICT DO UPDATE.
+    Строки идут в одном порядке, чтобы параллельные запросы не взаимоблокировались."""
+    rows = sorted((item, n) for item, n in deltas.items() if n)
+    if not rows:
+        return
+    values = ", ".join(["(%s, %s, %s, %s)"] * len(rows))
+    params = [value for (facet, key, aud), n in rows for value in (facet, key, aud, n)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO catalog_facetcount (facet, key, audience, count)
+            VALUES {values}
+            ON CONFLICT (facet, key, audience)
+            DO UPDATE SET count = catalog_facetcount.count + EXCLUDED.count
+            """,
+            params,
+        )
+
+
+# ---------- СОСТОЯНИЕ ТОВАРА ДЛЯ СИГНАЛОВ ----------
+
+
+def current_state(product):
+    return product.category_id, product.price, product.is_published
+
+
+def stored_state(product):
+    """Состояние товара, которое сейчас учтено в счётчиках, — строка из БД,
+    заблокированная до конца транзакции сохранения, как в set_published:
+    параллельная правка того же товара ждёт и считает разницу уже от
+    зафиксированного результата. Вызывается внутри transaction.atomic()."""
+    if product.pk is None:
+        return None
+    return (
+        type(product)
+        ._base_manager.select_for_update()
+        .filter(pk=product.pk)
+        .values_list(*_STATE_FIELDS)
+        .first()
+    )
+
+
+def set_published(queryset, published: bool) -> int:
+    """Массово (снимает с) публикует товары и поправляет счётчики фасетов.
+    queryset.update() не шлёт сигналы, поэтому изменившиеся строки
+    блокируются и выбираются заранее — в той же транзакции, что и UPDATE."""
+    with transaction.atomic():
+        rows = list(
+            queryset.filter(is_published=not published)
+            .select_for_update()
+            .values_list("pk", *_STATE_FIELDS)
+        )
+        if not rows:
+            return 0
+        queryset.model._base_manager.filter(pk__in=[row[0] for row in rows]).update(
+            is_published=published
+        )
+        # Counter «+=» выбрасывает отрицательные значения — собираем через update
+        deltas = Counter()
+        for _, category_id, price, is_published in rows:
+            deltas.update(
+                state_deltas(
+                    (category_id, price, is_published), (category_id, price, published)
+                )
+            )
+        apply_deltas(deltas)
+    return len(rows)
+
+
+# ---------- ЧТЕНИЕ ----------
+
+
+def category_counts(is_staff: bool) -> dict:
+    """{category_id: число товаров} для выдачи нужной роли."""
+    return {
+        int(key): count
+        for key, count in FacetCount.objects.filter(
+            facet=FACET_CATEGORY, audience=audience(is_staff)
+        ).values_list("key", "count")
+    }
+
+
+def price_facets(category_id, *, is_staff=False, selected=None, extra_query=None):
+    """Ценовые диапазоны категории с числом товаров в каждом.
+    Каждый диапазон — словарь с подписью, числом и query-строкой для ссылки,
+    которая сужает выдачу до этого диапазона (min_price/max_price формы фильтров).
+    selected — пара (min_price, max_price) текущего фильтра."""
+    bounds = price_bounds()
+    keys = [f"{category_id}:{i}" for i in range(len(bounds))]
+    counts = dict(
+        FacetCount.objects.filter(
+            facet=FACET_CATEGORY_PRICE, audience=audience(is_staff), key__in=keys
+        ).values_list("key", "count")
+    )
+    facets = []
+    for i, low in enumerate(bounds):
+        count = counts.get(keys[i], 0)
+        if count <= 0:
+            continue
+        # фильтр формы включает max_price — верхнюю границу берём на копейку ниже
+        high = bounds[i + 1] - Decimal("0.01") if i + 1 < len(bounds) else None
+        query = {**(extra_query or {}), "min_price": low}
+        if high is not None:
+            query["max_price"] = high
+        facets.append(
+            {
+                "label": f"{low:g}–{bounds[i + 1]:g} ₽"
+                if high is not None
+                else f"от {low:g} ₽",
+                "count": count,
+                "query": urlencode(query),
+                "selected": selected == (low, high),
+            }
+        )
+    return facets
+
+
+# ---------- ПЕРЕСЧЁТ ----------
+
+
+def compute_counts(products) -> Counter:
+    """Полный пересчёт счётчиков по QuerySet товаров — один GROUP BY."""
+    bounds = price_bounds()
+    bucket = Case(
+        *[
+            When(price__lt=bounds[i + 1], then=Value(i))
+            for i in range(len(bounds) - 1)
+        ],
+        default=Value(len(bounds) - 1),
+        output_field=IntegerField(),
+    )
+    counts = Counter()
+    grouped = (
+        products.order_by()
+        .annotate(bucket=bucket)
+        .values("category_id", "is_published", "bucket")
+        .annotate(n=Count("pk"))
+    )
+    for row in grouped:
+        keys = [
+            (FACET_CATEGORY, str(row["category_id"])),
+            (FACET_CATEGORY_PRICE, f"{row['category_id']}:{row['bucket']}"),
+        ]
+        audiences = [AUDIENCE_STAFF] + ([AUDIENCE_PUBLIC] if row["is_published"] else [])
+        for facet, key in keys:
+            for aud in audiences:
+                counts[(facet, key, aud)] += row["n"]
+    return counts
+
+
+def rebuild(product_model=None, facet_model=None) -> int:
+    """Перезаписывает таблицу счётчиков пересчитанными значениями.
+    Модели можно передать явно (исторические модели в миграции)."""
+    if product_model is None or facet_model is None:
+        product_model, facet_model = Product, FacetCount
+    with transaction.atomic():
+        counts = compute_counts(product_model._base_manager.all())
+        facet_model._base_manager.all().delete()
+        facet_model._base_manager.bulk_create(
+            facet_model(facet=facet, key=key, audience=aud, count=n)
+            for (facet, key, aud), n in counts.items()
+        )
+    return len(counts)
@@ -118,6 +118,47 @@ class ContactForm(forms.Form, BootstrapFormMixin):
         self._init_bootstrap_widgets()
 
 
+class CategoryFilterForm(forms.Form, BootstrapFormMixin):
+    """GET-форма фильтров на странице категории: диапазон цены и сортировка.
+    Все поля необязательны — пустая форма означает «все товары, новые сверху»."""
+
+    SORT_CHOICES = (
+        ("newest", "Сначала новые"),
+        ("price_asc", "Сначала дешёвые"),
+        ("price_desc", "Сначала дорогие"),
+    )
+
+    min_price = forms.DecimalField(
+        label="Цена от",
+        required=False,
+        min_value=0,
+        max_digits=10,
+        decimal_places=2,
+        widget=forms.NumberInput(attrs={"step": "0.01", "placeholder": "от"}),
+    )
+    max_price = forms.DecimalField(
+        label="Цена до",
+        required=False,
+        min_value=0,
+        max_digits=10,
+        decimal_places=2,
+        widget=forms.NumberInput(attrs={"step": "0.01", "placeholder": "до"}),
+    )
+    sort = forms.ChoiceField(label="Сортировка", required=False, choices=SORT_CHOICES)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._init_bootstrap_widgets()
+
+    def clean(self):
+        cleaned = super().clean()
+        min_price, max_price = cleaned.get("min_price"), cleaned.get("max_price")
+        if min_price is not None and max_price is not None and min_price > max_price:
+            raise ValidationError("Минимальная цена больше максимальной.")
+        cleaned["sort"] = cleaned.get("sort") or "newest"
+        return cleaned
+
+
 class ProductForm(forms.ModelForm, BootstrapFormMixin):
     """Форма для создания и редактирования продуктов.
     Особенности:
@@ -0,0 +1,90 @@
+import re
+import zlib
+
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from catalog.two_tier_cache import tiered_cache
+
+# ---------- ФРАГМЕНТЫ КАРТОЧЕК ТОВАРОВ ----------
+# Отрендеренная карточка (catalog/includes/product_card.html) кешируется
+# по id товара и updated_at: правка товара меняет ключ, и перерисовывается
+# только его карточка. Название категории в ключе — отпечатком, чтобы
+# переименование категории тоже давало новый ключ. Старые ключи не удаляются,
+# их вытесняет TTL. Страница списка собирает все карточки одним get_many.
+
+CARD_TEMPLATE = "catalog/includes/product_card.html"
+# поднять при изменении шаблона карточки — старые фрагменты перестанут читаться
+CARD_TEMPLATE_VERSION = 1
+
+
+def card_key(card) -> str:
+    category = zlib.crc32(card.category.name.encode())
+    return (
+        f"card:v{CARD_TEMPLATE_VERSION}:{card.id}:"
+        f"{card.updated_at.timestamp():.6f}:{category:x}"
+    )
+
+
+def render_product_cards(cards) -> list:
+    """HTML карточек в том же порядке, что и cards (ProductCard или Product)."""
+    if not getattr(settings, "CACHE_ENABLED", False):
+        return [_render(card) for card in cards]
+
+    keys = [card_key(card) for card in cards]
+    found = tiered_cache.get_many(keys)
+    missing = {}
+    for key, card in zip(keys, cards):
+        if key not in found:
+            missing[key] = found[key] = _render(card)
+    if missing:
+        # фрагмент по ключу не меняется — живёт столько же, сколько записи SWR
+        timeout = getattr(settings, "CACHE_HARD_TTL", None) or settings.CACHE_TTL
+        tiered_cache.set_many(missing, timeout)
+    return [mark_safe(found[key]) for key in keys]
+
+
+def _render(card) -> str:
+    return render_to_string(CARD_TEMPLATE, {"product": card})
+
+
+# ---------- «ДЫРКИ» В КЕШИРОВАННЫХ СТРАНИЦАХ ----------
+# Персональные части страницы выводятся тегом {% hole "имя" %}: он рендерит
+# шаблон из HOLES и обрамляет результат маркерами. Перед записью страницы
+# в кеш (AnonymousPageCacheMiddleware) содержимое между маркерами
+# вырезается, а при отдаче из кеша на его место рендерятся те же шаблоны
+# для текущего запроса. Шаблоны «дырок» должны обходиться без БД для
+# анонимного пользователя: user, perms и messages из контекст-процессоров.
+
+HOLES = {
+    "navbar_user": "includes/holes/navbar_user.html",
+    "messages": "includes/holes/messages.html",
+    "add_product": "catalog/includes/add_product_button.html",
+    "add_post": "blog/includes/add_post_button.html",
+}
+
+_HOLE_RE = re.compile(r"<!--hole:(\w+)-->.*?<!--/hole:\1-->", re.S)
+_PLACEHOLDER_RE = re.compile(r"<!--hole:(\w+)-->")
+
+
+def wrap_hole(name, html) -> str:
+    return mark_safe(f"<!--hole:{name}-->{html}<!--/hole:{name}-->")
+
+
+def punch_holes(content: str) -> str:
+    """Заменяет отрендеренные «дырки» пустыми метками <!--hole:имя-->."""
+    return _HOLE_RE.sub(lambda m: f"<!--hole:{m.group(1)}-->", content)
+
+
+def fill_holes(content: str, request) -> str:
+    """Рендерит «дырки» для текущего запроса на месте меток."""
+    rendered = {}
+
+    def render(match):
+        name = match.group(1)
+        if name not in rendered:
+            rendered[name] = render_to_string(HOLES[name], request=request)
+        return rendered[name]
+
+    return _PLACEHOLDER_RE.sub(render, content)
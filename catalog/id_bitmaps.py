@@ -0,0 +1,71 @@
+from django.conf import settings
+
+from catalog.cache_utils import read_through, untracked_response_tags
+
+# ---------- БИТОВЫЕ КАРТЫ ВИДИМЫХ ID ----------
+# Роботы перебирают /product/<id>/ и /blog/<id>/ подряд, и каждый
+# несуществующий или неопубликованный id стоил запроса к БД, заканчивающегося 404.
+# Теперь на каждую пару (модель, аудитория) в кеше лежит битовая карта id,
+# которые эта аудитория может открыть: бит id выставлен — объект есть и виден.
+# Карта зависит от тега видимости (product-ids / post-ids), который сдвигают
+# только создание, публикация, снятие с публикации и удаление, — обычная правка
+# текста или цены карту не трогает. После сдвига карту строит заново одним
+# запросом id один воркер (read_through), остальные тем временем работают
+# с прежней картой; если карты ещё нет вовсе и строитель не успел, воркер
+# обходится без неё, а не запускает второй полный перебор id.
+# Карта может отставать (прежняя карта, версии тегов в L1), поэтому «нет»
+# по ней подтверждается одним запросом по первичному ключу — только что
+# опубликованный товар не получит 404, а мусорный id не доходит до выборки
+# страницы с её JOIN и записями кеша. «Есть» проверять не нужно: такой id
+# всё равно выбирает сама страница и сама отдаёт 404.
+
+
+class IdBitmap:
+    """Неизменяемое множество неотрицательных id в виде битовой карты."""
+
+    __slots__ = ("data",)
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    @classmethod
+    def from_ids(cls, ids):
+        ids = list(ids)
+        bits = bytearray((max(ids) >> 3) + 1 if ids else 0)
+        for pk in ids:
+            bits[pk >> 3] |= 1 << (pk & 7)
+        return cls(bytes(bits))
+
+    def __contains__(self, pk) -> bool:
+        index = pk >> 3
+        return 0 <= index < len(self.data) and bool(self.data[index] & (1 << (pk & 7)))
+
+
+def visible_ids(name: str, queryset, tag: str, *, stale_ok=True):
+    """IdBitmap id из queryset (строится по тегу tag) или None, если кеш выключен
+    или карта сейчас строится другим воркером и её ещё нет.
+    name различает карты, например "product:public" и "product:staff"."""
+    if not getattr(settings, "CACHE_ENABLED", False):
+        return None
+
+    def compute():
+        return IdBitmap.from_ids(queryset.values_list("pk", flat=True)).data
+
+    # тег видимости — не содержимое страницы, в Surrogate-Key ему делать нечего
+    with untracked_response_tags():
+        data = read_through(
+            f"ids:{name}",
+            compute,
+            tags=[tag],
+            stale_ok=stale_ok,
+            fallback=lambda: None,
+        )
+    return None if data is None else IdBitmap(data)
+
+
+def is_known_id(name: str, queryset, tag: str, pk) -> bool:
+    """False — объекта с таким id точно нет для этой аудитории (можно отдать 404)."""
+    bitmap = visible_ids(name, queryset, tag)
+    if bitmap is None or int(pk) in bitmap:
+        return True
+    return queryset.filter(pk=pk).exists()
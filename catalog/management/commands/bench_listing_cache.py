@@ -0,0 +1,100 @@
+import pickle
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from catalog.dto import ProductCard, decode_cards, encode_cards
+from catalog.models import Category, Product
+
+
+class Command(BaseCommand):
+    """
+    Сравнивает два формата значения кеша для страницы списка товаров:
+    - старый: pickle списка Product с подгруженной Category (так кешировали раньше);
+    - новый: компактный блоб карточек catalog.dto.
+    Показывает размер значения в байтах (столько и уходит в Redis —
+    RedisCache пиклирует значение, для bytes это почти без накладных расходов)
+    и среднее время декодирования одного значения.
+    По умолчанию берёт товары из БД; с --synthetic генерирует их в памяти.
+    """
+
+    help = "Бенчмарк: pickle Product против компактных карточек для кеша списков."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows",
+            type=int,
+            action="append",
+            help="Размер страницы (можно повторять). По умолчанию: 8, 100, 1000.",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=200, help="Сколько раз декодировать."
+        )
+        parser.add_argument(
+            "--synthetic",
+            action="store_true",
+            help="Не ходить в БД, сгенерировать товары в памяти.",
+        )
+
+    def handle(self, *args, **options):
+        sizes = options["rows"] or [8, 100, 1000]
+        repeat = options["repeat"]
+
+        self.stdout.write(
+            f"{'rows':>6} | {'pickle, B':>10} | {'cards, B':>9} | "
+            f"{'pickle, µs':>11} | {'cards, µs':>10}"
+        )
+        for size in sizes:
+            products = self._products(size, options["synthetic"])
+            if not products:
+                self.stderr.write("В БД нет товаров — запустите с --synthetic.")
+                return
+
+            pickled = pickle.dumps(products, pickle.HIGHEST_PROTOCOL)
+            blob = pickle.dumps(
+                encode_cards([ProductCard.from_product(p) for p in products]),
+                pickle.HIGHEST_PROTOCOL,
+            )
+
+            pickle_us = self._timeit(lambda: pickle.loads(pickled), repeat)
+            cards_us = self._timeit(
+                lambda: decode_cards(pickle.loads(blob)), repeat
+            )
+            self.stdout.write(
+                f"{len(products):>6} | {len(pickled):>10} | {len(blob):>9} | "
+                f"{pickle_us:>11.1f} | {cards_us:>10.1f}"
+            )
+
+    def _timeit(self, func, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        return (time.perf_counter() - started) / repeat * 1_000_000
+
+    def _products(self, size, synthetic):
+        if not synthetic:
+            return list(
+                Product.objects.select_related("category").order_by(
+                    "-created_at", "-pk"
+                )[:size]
+            )
+        category = Category(pk=1, name="Электроника", description="Гаджеты и техника")
+        now = timezone.now()
+        products = []
+        for i in range(size):
+            product = Product(
+                pk=i + 1,
+                name=f"Товар №{i + 1}",
+                description="Подробное описание товара. " * 20,
+                price=Decimal("1999.90") + i,
+                category=category,
+                owner_id=1,
+                is_published=True,
+                image=f"products/prod_{i + 1}.jpg",
+            )
+            product.created_at = product.updated_at = now - timedelta(minutes=i)
+            products.append(product)
+        return products
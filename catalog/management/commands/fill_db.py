@@ -12,6 +12,7 @@ from django.core.management import call_command
 
 from faker import Faker
 
+from catalog.cache_utils import deferred_invalidation
 from catalog.models import Category, Product
 
 
@@ -89,6 +90,7 @@ class Command(BaseCommand):
 
     # ---------- main ----------
 
+    @deferred_invalidation()  # тысячи сохранений — одна инвалидация в конце
     def handle(self, *args, **options):
         fake = Faker("ru_RU")
 
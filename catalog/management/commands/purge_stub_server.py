@@ -0,0 +1,52 @@
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """
+    Заглушка purge API прокси/CDN для разработки и ручной проверки:
+    принимает POST с {"surrogate_keys": [...]} (как шлёт catalog.purge)
+    и печатает полученные ключи. Запуск:
+        python manage.py purge_stub_server --port 8089
+    и в .env: CACHE_PURGE_URL=http://127.0.0.1:8089/purge
+    """
+
+    help = "Локальная заглушка purge API для проверки Surrogate-Key."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8089)
+
+    def handle(self, *args, **options):
+        stdout = self.stdout
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    keys = json.loads(self.rfile.read(length))["surrogate_keys"]
+                except (ValueError, KeyError, TypeError):
+                    self.send_response(400)
+                    self.end_headers()
+                    return
+                stdout.write(f"PURGE {len(keys)}: {' '.join(keys)}")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(json.dumps({"status": "ok"}).encode())
+
+            def log_message(self, format, *args):
+                pass  # печатаем только сами purge
+
+        server = ThreadingHTTPServer((options["host"], options["port"]), Handler)
+        self.stdout.write(
+            f"Purge-заглушка слушает http://{options['host']}:{options['port']}/"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from catalog import facets
+
+
+class Command(BaseCommand):
+    """
+    Пересчитывает счётчики фасетов (категории и ценовые диапазоны) с нуля
+    одним GROUP BY по catalog_product. Обычно счётчики ведутся инкрементально
+    сигналами; команда нужна после изменения PRICE_FACET_BUCKETS или правок
+    товаров мимо ORM.
+    """
+
+    help = "Пересчитать счётчики фасетов каталога."
+
+    def handle(self, *args, **options):
+        rows = facets.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Счётчиков фасетов: {rows}"))
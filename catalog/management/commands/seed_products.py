@@ -1,6 +1,7 @@
 import requests
 from django.core.files.base import ContentFile
 from django.core.management.base import BaseCommand
+from catalog.cache_utils import deferred_invalidation
 from catalog.models import Category, Product
 
 
@@ -20,6 +21,7 @@ class Command(BaseCommand):
             self.stderr.write(f"Ошибка скачивания изображения {url}: {e}")
             return None
 
+    @deferred_invalidation()  # тысячи сохранений — одна инвалидация в конце
     def handle(self, *args, **options):
         # Очистка старых данных
         Product.objects.all().delete()
@@ -0,0 +1,204 @@
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from catalog.cache_utils import PRODUCT_IDS_TAG, home_page_key, product_detail_key
+from catalog.fragments import card_key, render_product_cards
+from catalog.id_bitmaps import visible_ids
+from catalog.models import Category, Product
+from catalog.pagination import DEFAULT_ORDERING, encode_cursor, page_token
+from catalog.services import (
+    CATEGORY_SORT_ORDERINGS,
+    category_products_key,
+    get_home_products,
+    get_products_by_category,
+    product_detail,
+    product_meta,
+    product_page_key,
+)
+from catalog.two_tier_cache import record_writes
+
+FAMILIES = ("home", "category", "card", "detail", "meta", "ids")
+
+
+class Command(BaseCommand):
+    """
+    Прогревает кеш после деплоя или сброса Redis, чтобы первые посетители
+    не ждали пересчёта. Ключи перечисляются по БД:
+    - первые страницы главной (публичная выдача и staff);
+    - первые страницы каждой категории (для каждой выбранной сортировки);
+    - фрагменты карточек товаров с этих страниц;
+    - страницы товаров и их HTTP-валидаторы (последние изменённые товары —
+      счётчика просмотров у товаров нет, свежие правки смотрят чаще всего);
+    - карты id для быстрых 404.
+    Значения строятся теми же функциями, что и в view (get_home_products,
+    get_products_by_category, product_detail, ...), поэтому ключи совпадают.
+    Работа идёт в пуле из --workers потоков; в конце печатается число ключей,
+    суммарное время построения и объём записанного по каждому семейству ключей
+    (свежие записи не перезаписываются и в объём не входят).
+    Устаревшие записи пересчитываются сразу, а не в фоне: все чтения идут
+    с stale_ok=False.
+    """
+
+    help = "Прогреть кеш главной, категорий и страниц товаров."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=4, help="Размер пула потоков (4)."
+        )
+        parser.add_argument(
+            "--pages",
+            type=int,
+            default=1,
+            help="Сколько страниц главной и каждой категории прогреть (1).",
+        )
+        parser.add_argument(
+            "--products",
+            type=int,
+            default=100,
+            help="Сколько страниц товаров прогреть (100 последних изменённых).",
+        )
+        parser.add_argument(
+            "--sort",
+            action="append",
+            choices=sorted(CATEGORY_SORT_ORDERINGS),
+            help="Сортировка страниц категорий (можно повторять). По умолчанию: newest.",
+        )
+
+    def handle(self, *args, **options):
+        if not getattr(settings, "CACHE_ENABLED", False):
+            self.stderr.write("Кеш выключен (CACHE_ENABLED=False) — прогревать нечего.")
+            return
+
+        self.pages = max(options["pages"], 1)
+        self.keys = defaultdict(set)
+        self.seconds = defaultdict(float)
+        self.written = {}
+        self._lock = threading.Lock()
+
+        tasks = [(self._warm_home, (is_staff,)) for is_staff in (False, True)]
+        tasks += [(self._warm_ids, (is_staff,)) for is_staff in (False, True)]
+        for category_id in Category.objects.values_list("pk", flat=True):
+            for sort in options["sort"] or ["newest"]:
+                tasks.append((self._warm_category, (category_id, sort)))
+        product_ids = Product.objects.order_by("-updated_at").values_list(
+            "pk", flat=True
+        )[: options["products"]]
+        tasks += [(self._warm_product, (pk,)) for pk in product_ids]
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(options["workers"], 1)) as pool:
+            futures = [pool.submit(self._run, func, *args) for func, args in tasks]
+            for future in as_completed(futures):
+                future.result()
+        elapsed = time.perf_counter() - started
+
+        self._report(elapsed)
+
+    # ---------- ЗАДАЧИ ----------
+
+    def _run(self, func, *args):
+        try:
+            with record_writes() as written:
+                func(*args)
+            with self._lock:
+                self.written.update(written)
+        finally:
+            # у каждого потока пула своё соединение с БД
+            connections.close_all()
+
+    def _record(self, family, keys, started):
+        with self._lock:
+            self.keys[family].update(keys)
+            self.seconds[family] += time.perf_counter() - started
+
+    def _warm_cards(self, cards):
+        started = time.perf_counter()
+        render_product_cards(cards)
+        self._record("card", [card_key(card) for card in cards], started)
+
+    def _warm_home(self, is_staff):
+        after, page = None, 1
+        while page <= self.pages:
+            started = time.perf_counter()
+            cards, _, has_next, _ = get_home_products(
+                is_staff, page=page, after=after, stale_ok=False
+            )
+            token = page_token(after, None, page)
+            self._record(
+                "home", [product_page_key(home_page_key(is_staff, token))], started
+            )
+            self._warm_cards(cards)
+            if not has_next or not cards:
+                break
+            # ссылка «→» страницы: page=N+1 и курсор последней карточки
+            after, page = encode_cursor(cards[-1], DEFAULT_ORDERING), page + 1
+
+    def _warm_category(self, category_id, sort):
+        after, page = None, 1
+        while page <= self.pages:
+            started = time.perf_counter()
+            cards, _, has_next, _ = get_products_by_category(
+                category_id, sort=sort, page=page, after=after, stale_ok=False
+            )
+            key = category_products_key(
+                category_id, sort=sort, token=page_token(after, None, page)
+            )
+            self._record("category", [product_page_key(key)], started)
+            self._warm_cards(cards)
+            if not has_next or not cards:
+                break
+            after = encode_cursor(cards[-1], CATEGORY_SORT_ORDERINGS[sort])
+            page += 1
+
+    def _warm_product(self, product_id):
+        started = time.perf_counter()
+        product_meta(product_id)
+        self._record("meta", [f"product:meta:{product_id}"], started)
+        for is_staff in (False, True):
+            started = time.perf_counter()
+            product_detail(product_id, is_staff=is_staff)
+            self._record("detail", [product_detail_key(product_id, is_staff)], started)
+
+    def _warm_ids(self, is_staff):
+        # тот же queryset, что и в ProductDetailView.dispatch
+        started = time.perf_counter()
+        queryset = Product.objects.all()
+        if not is_staff:
+            queryset = queryset.filter(is_published=True)
+        name = f"product:{'staff' if is_staff else 'public'}"
+        visible_ids(name, queryset, PRODUCT_IDS_TAG, stale_ok=False)
+        self._record("ids", [f"ids:{name}"], started)
+
+    # ---------- ОТЧЁТ ----------
+
+    def _report(self, elapsed):
+        self.stdout.write(
+            f"{'family':<10} | {'keys':>6} | {'build, s':>9} | {'bytes':>10}"
+        )
+        total_keys = total_bytes = 0
+        for family in FAMILIES:
+            keys = sorted(self.keys.get(family, ()))
+            if not keys:
+                continue
+            size = self._size(keys)
+            total_keys += len(keys)
+            total_bytes += size
+            self.stdout.write(
+                f"{family:<10} | {len(keys):>6} | "
+                f"{self.seconds[family]:>9.2f} | {size:>10}"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Прогрето ключей: {total_keys}, {total_bytes} Б за {elapsed:.2f} с"
+            )
+        )
+
+    def _size(self, keys) -> int:
+        """Сколько байт команда записала под этими ключами."""
+        return sum(self.written.get(key, 0) for key in keys)
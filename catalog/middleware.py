@@ -0,0 +1,228 @@
+from django.conf import settings
+from django.contrib import messages
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.db import connection
+from django.urls import Resolver404, resolve
+from django.utils.http import parse_http_date_safe
+
+from catalog import degraded
+
+from catalog.cache_utils import (
+    deferred_invalidation,
+    get_tagged,
+    page_cache_key,
+    patch_page_cache_control,
+    reset_response_tags,
+    reset_served_staleness,
+    response_tags,
+    served_staleness,
+    set_tagged,
+    tag_versions,
+)
+from catalog.fragments import fill_holes, punch_holes
+
+
+class CacheStalenessMiddleware:
+    """Если при обработке запроса из кеша было отдано устаревшее значение
+    (режим stale-while-revalidate), сообщает в заголовке X-Cache-Staleness,
+    на сколько секунд оно устарело."""
+
+    header = "X-Cache-Staleness"
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        reset_served_staleness()
+        response = self.get_response(request)
+        staleness = served_staleness()
+        if staleness is not None:
+            response[self.header] = f"{staleness:.1f}"
+        return response
+
+
+class AnonymousPageCacheMiddleware:
+    """Кеш целых страниц для анонимных посетителей.
+    Работает для view, у которых есть статический метод page_cache_tags(view_kwargs)
+    (теги, от которых зависит страница). Запрос считается анонимным, если у него
+    нет cookie сессии — тогда страница отдаётся из кеша без обращения к сессии
+    и ORM, а персональные «дырки» ({% hole %}) рендерятся заново для запроса.
+    Промах: страница рендерится как обычно и, если ответ 200 без Set-Cookie,
+    записывается в кеш с вырезанными «дырками».
+    Должен стоять после MessageMiddleware — «дырка» сообщений читает их хранилище."""
+
+    header = "X-Page-Cache"
+    # заголовки, которые относятся к конкретному ответу, а не к странице
+    skip_headers = {header, "Content-Length", CacheStalenessMiddleware.header}
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        pending = getattr(request, "_page_cache", None)
+        if pending is not None and self._storable(response):
+            key, tags, versions = pending
+            if len(versions) < len(tags):
+                # тега не было до рендеринга — заводим его, а страницу запишем
+                # со следующего запроса, когда будет с чем сверять версию
+                tag_versions(tags)
+                return response
+            content = punch_holes(response.content.decode(response.charset))
+            headers = [
+                (name, value)
+                for name, value in response.items()
+                if name not in self.skip_headers
+            ]
+            set_tagged(
+                key,
+                {"content": content, "headers": headers},
+                tags,
+                getattr(settings, "PAGE_CACHE_TTL", None),
+                versions=versions,
+            )
+            response[self.header] = "MISS"
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, "view_class", None)
+        page_cache_tags = getattr(view_class, "page_cache_tags", None)
+        if (
+            page_cache_tags is None
+            or request.method not in ("GET", "HEAD")
+            or settings.SESSION_COOKIE_NAME in request.COOKIES
+            or not getattr(settings, "CACHE_ENABLED", False)
+            or not getattr(settings, "PAGE_CACHE_ENABLED", False)
+        ):
+            return None
+
+        key = page_cache_key(request.get_full_path())
+        cached = get_tagged(key)
+        if cached is None:
+            tags = list(dict.fromkeys(page_cache_tags(view_kwargs)))
+            # версии тегов снимаем до рендеринга — как в read_through; только
+            # читаем: страница может оказаться 404 для несуществующего id
+            request._page_cache = (key, tags, tag_versions(tags, create=False))
+            return None
+        return self._from_cache(request, cached)
+
+    def _from_cache(self, request, cached):
+        content = fill_holes(cached["content"], request)
+        headers = dict(cached["headers"])
+        if len(messages.get_messages(request)) == 0:
+            # без сообщений страница совпадает с записанной — валидаторы в силе
+            not_modified = get_conditional_response(
+                request,
+                etag=headers.get("ETag"),
+                last_modified=parse_http_date_safe(headers.get("Last-Modified", "")),
+            )
+            if not_modified is not None:
+                return not_modified
+        else:
+            headers.pop("ETag", None)
+            headers.pop("Last-Modified", None)
+        response = HttpResponse(content)
+        for name, value in headers.items():
+            response[name] = value
+        response[self.header] = "HIT"
+        return response
+
+    def _storable(self, response):
+        # страницу, собранную из устаревших (SWR) данных или отданную
+        # в аварийном режиме без БД, не закрепляем в кеше
+        return (
+            served_staleness() is None
+            and not response.has_header(degraded.DEGRADED_HEADER)
+            and response.status_code == 200
+            and not response.streaming
+            and not response.cookies
+            and not response.has_header("Set-Cookie")
+        )
+
+
+class SurrogateKeyMiddleware:
+    """Помечает страницы тегами для прокси/CDN: Surrogate-Key (через пробел)
+    и Cache-Tag (через запятую) — товары, категории и посты, из которых
+    собрана страница (cache_utils.note_response_tags), — и выставляет
+    Cache-Control/Vary (cache_utils.patch_page_cache_control).
+    Должен стоять после AnonymousPageCacheMiddleware: тогда заголовки попадают
+    в закешированную страницу и отдаются вместе с ней."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        reset_response_tags()
+        response = self.get_response(request)
+        tags = response_tags()
+        if (
+            not tags
+            or request.method not in ("GET", "HEAD")
+            or response.status_code not in (200, 304)
+            or response.has_header("Surrogate-Key")
+        ):
+            return response
+        response["Surrogate-Key"] = " ".join(tags)
+        response["Cache-Tag"] = ",".join(tags)
+        if not response.has_header("Cache-Control"):
+            # view мог решить сам (например, private для счётчика просмотров)
+            patch_page_cache_control(request, response)
+        return response
+
+
+class InvalidationBatchMiddleware:
+    """Собирает все инвалидации кеша за запрос и отправляет их один раз
+    в конце (cache_utils.deferred_invalidation)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with deferred_invalidation():
+            return self.get_response(request)
+
+
+class DegradedModeMiddleware:
+    """Аварийный режим «только чтение», когда БД недоступна (catalog.degraded).
+    - предохранитель БД разомкнут — запрос вообще не доходит до сессии и ORM:
+      view с degraded_response отвечают из кеша, остальные получают 503;
+    - предохранитель замкнут — запрос идёт как обычно; успешные SQL-запросы
+      замыкают его, а ошибка соединения в view (process_exception) считается
+      отказом, и ответ строится так же, как при разомкнутом.
+    Должен стоять сразу после SecurityMiddleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not degraded.db_breaker().allow():
+            return self._degraded(request)
+        with connection.execute_wrapper(self._track_queries):
+            return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        if not isinstance(exception, degraded.DB_ERRORS):
+            return None
+        degraded.db_breaker().record_failure()
+        return self._degraded(request)
+
+    @staticmethod
+    def _track_queries(execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        degraded.db_breaker().record_success()
+        return result
+
+    def _degraded(self, request):
+        if request.method not in ("GET", "HEAD"):
+            return degraded.unavailable_response()
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return degraded.unavailable_response()
+        view_class = getattr(match.func, "view_class", None)
+        degraded_response = getattr(view_class, "degraded_response", None)
+        if degraded_response is None:
+            return degraded.unavailable_response()
+        degraded.as_anonymous(request)
+        return degraded_response(request, match.kwargs) or degraded.unavailable_response()
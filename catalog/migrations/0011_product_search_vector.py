@@ -0,0 +1,39 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+from django.db.models import Q
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0010_alter_product_owner"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True, verbose_name="Поисковый вектор"
+            ),
+        ),
+        # заполняем вектор для уже существующих товаров тем же выражением,
+        # что и Product.save (PRODUCT_SEARCH_VECTOR)
+        migrations.RunSQL(
+            sql="""
+                UPDATE catalog_product SET search_vector =
+                    setweight(to_tsvector('russian', coalesce(name, '')), 'A')
+                    || setweight(to_tsvector('russian', coalesce(description, '')), 'B');
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=django.contrib.postgres.indexes.GinIndex(
+                condition=Q(("is_published", True)),
+                fields=["search_vector"],
+                name="catalog_product_search_gin",
+            ),
+        ),
+    ]
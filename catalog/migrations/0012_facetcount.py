@@ -0,0 +1,65 @@
+from django.db import migrations, models
+
+
+def fill_facet_counts(apps, schema_editor):
+    """Начальные значения счётчиков — тем же пересчётом, что и rebuild_facets."""
+    from catalog import facets
+
+    facets.rebuild(
+        product_model=apps.get_model("catalog", "Product"),
+        facet_model=apps.get_model("catalog", "FacetCount"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0011_product_search_vector"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FacetCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("facet", models.CharField(max_length=32, verbose_name="Фасет")),
+                ("key", models.CharField(max_length=64, verbose_name="Значение")),
+                (
+                    "audience",
+                    models.CharField(
+                        choices=[
+                            ("public", "Публичные"),
+                            ("staff", "Для сотрудников"),
+                        ],
+                        max_length=8,
+                        verbose_name="Аудитория",
+                    ),
+                ),
+                (
+                    "count",
+                    models.IntegerField(
+                        default=0, verbose_name="Количество товаров"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Счётчик фасета",
+                "verbose_name_plural": "Счётчики фасетов",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("facet", "key", "audience"),
+                        name="catalog_facetcount_unique",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(fill_facet_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,88 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0012_facetcount"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OutboxEmail",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("subject", models.CharField(max_length=255, verbose_name="Тема")),
+                ("body", models.TextField(verbose_name="Текст")),
+                (
+                    "from_email",
+                    models.CharField(
+                        blank=True, max_length=254, verbose_name="Отправитель"
+                    ),
+                ),
+                (
+                    "recipients",
+                    models.JSONField(default=list, verbose_name="Получатели"),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "В очереди"),
+                            ("sent", "Отправлено"),
+                            ("failed", "Не удалось отправить"),
+                        ],
+                        default="pending",
+                        max_length=8,
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "attempts",
+                    models.PositiveIntegerField(default=0, verbose_name="Попыток"),
+                ),
+                (
+                    "next_attempt_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        verbose_name="Следующая попытка",
+                    ),
+                ),
+                (
+                    "last_error",
+                    models.TextField(blank=True, verbose_name="Последняя ошибка"),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Создано"),
+                ),
+                (
+                    "sent_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Отправлено"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Письмо в очереди",
+                "verbose_name_plural": "Очередь писем",
+                "ordering": ["-created_at"],
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("status", "pending")),
+                        fields=["next_attempt_at"],
+                        name="catalog_outbox_pending_idx",
+                    )
+                ],
+            },
+        ),
+    ]
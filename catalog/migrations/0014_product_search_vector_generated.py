@@ -0,0 +1,48 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+from django.db.models import Q
+
+
+class Migration(migrations.Migration):
+    """Поисковый вектор — генерируемый столбец вместо UPDATE из Product.save:
+    обычное поле нельзя превратить в генерируемое, поэтому пересоздаём его
+    вместе с GIN-индексом (значения Postgres посчитает сам)."""
+
+    dependencies = [
+        ("catalog", "0013_outboxemail"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="product",
+            name="catalog_product_search_gin",
+        ),
+        migrations.RemoveField(
+            model_name="product",
+            name="search_vector",
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="search_vector",
+            field=models.GeneratedField(
+                db_persist=True,
+                expression=django.contrib.postgres.search.SearchVector(
+                    "name", weight="A", config="russian"
+                )
+                + django.contrib.postgres.search.SearchVector(
+                    "description", weight="B", config="russian"
+                ),
+                output_field=django.contrib.postgres.search.SearchVectorField(),
+                verbose_name="Поисковый вектор",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=django.contrib.postgres.indexes.GinIndex(
+                condition=Q(("is_published", True)),
+                fields=["search_vector"],
+                name="catalog_product_search_gin",
+            ),
+        ),
+    ]
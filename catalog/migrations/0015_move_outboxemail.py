@@ -0,0 +1,20 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """OutboxEmail переехал в приложение notifications: из состояния catalog
+    модель убираем, таблицу не трогаем — ей теперь владеет notifications."""
+
+    dependencies = [
+        ("catalog", "0014_product_search_vector_generated"),
+        ("notifications", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.DeleteModel(name="OutboxEmail"),
+            ],
+            database_operations=[],
+        ),
+    ]
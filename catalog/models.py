@@ -1,7 +1,10 @@
 from django.core.exceptions import ValidationError
 from django.urls import reverse_lazy, reverse
 from django.conf import settings
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db import models, transaction
+from django.db.models import Q
 
 # 🚫 Запрещённые слова (проверяются без учёта регистра)
 BANNED_WORDS = (
@@ -16,6 +19,14 @@ BANNED_WORDS = (
     "радар",
 )
 
+# 🔎 Полнотекстовый поиск: русская морфология, название весомее описания.
+# Вектор — генерируемый столбец: Postgres сам пересчитывает его при любой записи
+# строки (save, QuerySet.update, loaddata, правка в psql)
+SEARCH_CONFIG = "russian"
+PRODUCT_SEARCH_VECTOR = SearchVector(
+    "name", weight="A", config=SEARCH_CONFIG
+) + SearchVector("description", weight="B", config=SEARCH_CONFIG)
+
 
 class Category(models.Model):
     """Модель категории товара."""
@@ -75,6 +86,12 @@ class Product(models.Model):
     created_at = models.DateTimeField(
         auto_now_add=True, db_index=True, verbose_name="Дата создания"
     )
+    search_vector = models.GeneratedField(
+        expression=PRODUCT_SEARCH_VECTOR,
+        output_field=SearchVectorField(),
+        db_persist=True,
+        verbose_name="Поисковый вектор",
+    )
 
     class Meta:
         verbose_name = "Товар"
@@ -83,6 +100,23 @@ class Product(models.Model):
         permissions = [
             ("can_unpublish_product", "Может отменять публикацию продукта"),
         ]
+        indexes = [
+            # ищем только среди опубликованных — частичный индекс меньше и быстрее
+            GinIndex(
+                fields=["search_vector"],
+                name="catalog_product_search_gin",
+                condition=Q(is_published=True),
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Запоминаем значения, прочитанные из БД, — по ним сигналы понимают,
+        что именно изменилось при сохранении (например, переезд в другую категорию),
+        не делая лишний SELECT."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
 
     def get_absolute_url(self):
         return reverse("catalog:product_detail", kwargs={"pk": self.pk})
@@ -122,9 +156,12 @@ class Product(models.Model):
             raise ValidationError(errors)
 
     def save(self, *args, **kwargs):
-        """Гарантируем запуск валидации модели перед сохранением."""
+        """Гарантируем запуск валидации модели перед сохранением.
+        Сохранение идёт в транзакции: pre_save блокирует строку товара, чтобы
+        посчитать разницу счётчиков фасетов (см. catalog.signals)."""
         self.full_clean()  # запускает clean() и field-level проверки
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
 
 class Contact(models.Model):
@@ -144,3 +181,38 @@ class Contact(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class FacetCount(models.Model):
+    """Предрасчитанное число товаров в фасете (см. catalog.facets).
+    - facet="category",       key="<category_id>"
+    - facet="category_price", key="<category_id>:<номер ценового диапазона>"
+    audience разделяет счётчики для обычных пользователей (только опубликованные)
+    и для staff (все товары). Счётчики меняются инкрементально при сохранении,
+    удалении и (снятии с) публикации товара, без COUNT(*) на каждой странице."""
+
+    AUDIENCE_PUBLIC = "public"
+    AUDIENCE_STAFF = "staff"
+    AUDIENCE_CHOICES = (
+        (AUDIENCE_PUBLIC, "Публичные"),
+        (AUDIENCE_STAFF, "Для сотрудников"),
+    )
+
+    facet = models.CharField(max_length=32, verbose_name="Фасет")
+    key = models.CharField(max_length=64, verbose_name="Значение")
+    audience = models.CharField(
+        max_length=8, choices=AUDIENCE_CHOICES, verbose_name="Аудитория"
+    )
+    count = models.IntegerField(default=0, verbose_name="Количество товаров")
+
+    class Meta:
+        verbose_name = "Счётчик фасета"
+        verbose_name_plural = "Счётчики фасетов"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["facet", "key", "audience"], name="catalog_facetcount_unique"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.facet}={self.key} ({self.audience}): {self.count}"
@@ -0,0 +1,196 @@
+import base64
+from urllib.parse import urlencode
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+# Порядок по умолчанию: новые сверху, id — разрыв «ничьих» по created_at
+DEFAULT_ORDERING = ("-created_at", "-pk")
+
+
+class InvalidCursor(ValueError):
+    """Курсор из query-параметра не удалось разобрать."""
+
+
+def _field_names(ordering):
+    return [name.lstrip("-") for name in ordering]
+
+
+def encode_cursor(obj, ordering=DEFAULT_ORDERING) -> str:
+    """Кодирует позицию объекта в порядке ordering в короткую url-safe строку."""
+    values = []
+    for name in _field_names(ordering):
+        value = getattr(obj, name)
+        values.append(value.isoformat() if hasattr(value, "isoformat") else str(value))
+    raw = "|".join(values).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str, model, ordering=DEFAULT_ORDERING) -> list:
+    """Обратная операция к encode_cursor: значения приводятся к типам полей
+    модели через Field.to_python и проверяются валидаторами поля (например,
+    диапазон целого для БД). Бросает InvalidCursor на мусоре."""
+    names = _field_names(ordering)
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        raw_values = base64.urlsafe_b64decode(padded).decode().split("|")
+        if len(raw_values) != len(names):
+            raise ValueError(token)
+        values = []
+        for name, raw in zip(names, raw_values):
+            field = _get_field(model, name)
+            value = field.to_python(raw)
+            field.run_validators(value)
+            values.append(value)
+        return values
+    except (ValueError, UnicodeDecodeError, ValidationError, FieldDoesNotExist) as e:
+        raise InvalidCursor(token) from e
+
+
+def _get_field(model, name):
+    return model._meta.pk if name == "pk" else model._meta.get_field(name)
+
+
+def _seek_filter(ordering, values, forward=True) -> Q:
+    """Строит условие «строго после позиции values» для составного порядка.
+    Для ("-created_at", "-pk") получится
+    created_at < c OR (created_at = c AND pk < id)."""
+    condition = Q()
+    equal_prefix = {}
+    for name, value in zip(ordering, values):
+        descending = name.startswith("-")
+        field = name.lstrip("-")
+        lookup = "lt" if descending == forward else "gt"
+        condition |= Q(**equal_prefix, **{f"{field}__{lookup}": value})
+        equal_prefix[field] = value
+    return condition
+
+
+def _reverse_ordering(ordering):
+    return [name[1:] if name.startswith("-") else f"-{name}" for name in ordering]
+
+
+class KeysetPage:
+    """Страница keyset-пагинации.
+    Повторяет интерфейс django.core.paginator.Page, которым пользуются шаблоны
+    (has_next, number, next_page_number ...), но не требует COUNT(*).
+    next_query / previous_query — готовые query-строки для ссылок «→» / «←»;
+    base_query — остальные параметры запроса (фильтры, сортировка),
+    которые нужно сохранить при переходе; cursor_links=False — ссылки
+    только с ?page=N (для порядков, которые нельзя выразить курсором,
+    например по рангу поиска)."""
+
+    def __init__(
+        self,
+        object_list,
+        number,
+        has_next,
+        has_previous,
+        ordering=DEFAULT_ORDERING,
+        base_query="",
+        cursor_links=True,
+    ):
+        self.object_list = list(object_list)
+        self.number = number
+        self.ordering = ordering
+        self.base_query = base_query
+        self.cursor_links = cursor_links
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __repr__(self):
+        return f"<KeysetPage {self.number}>"
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+    def _query(self, **params) -> str:
+        query = urlencode(params)
+        return f"{self.base_query}&{query}" if self.base_query else query
+
+    @property
+    def next_query(self) -> str:
+        if not self.cursor_links:
+            return self._query(page=self.number + 1)
+        last = self.object_list[-1]
+        return self._query(
+            page=self.number + 1, after=encode_cursor(last, self.ordering)
+        )
+
+    @property
+    def previous_query(self) -> str:
+        if self.number <= 2 or not self.cursor_links:
+            return self._query(page=self.number - 1)
+        first = self.object_list[0]
+        return self._query(
+            page=self.number - 1, before=encode_cursor(first, self.ordering)
+        )
+
+
+def page_token(after=None, before=None, page=1) -> str:
+    """Часть ключа кеша, однозначно описывающая позицию страницы."""
+    if after:
+        return f"after:{after}"
+    if before:
+        return f"before:{before}"
+    return f"page:{page}"
+
+
+def keyset_page_rows(
+    queryset, page_size, *, ordering=DEFAULT_ORDERING, after=None, before=None, page=1
+):
+    """Выбирает строки одной страницы в порядке ordering (последним полем
+    должен идти уникальный pk, иначе позиция неоднозначна).
+    - after  — курсор последней строки предыдущей страницы (движение вперёд);
+    - before — курсор первой строки следующей страницы (движение назад);
+    - без курсора работает старый режим ?page=N через OFFSET.
+    Читается максимум page_size + 1 строк — лишняя строка только сигнализирует,
+    что в этом направлении есть продолжение.
+    Возвращает (rows, number, has_next, has_previous)."""
+    model = queryset.model
+
+    if after:
+        values = decode_cursor(after, model, ordering)
+        rows = list(
+            queryset.filter(_seek_filter(ordering, values)).order_by(*ordering)[
+                : page_size + 1
+            ]
+        )
+        has_next = len(rows) > page_size
+        return rows[:page_size], max(page, 2), has_next, True
+
+    if before:
+        values = decode_cursor(before, model, ordering)
+        rows = list(
+            queryset.filter(_seek_filter(ordering, values, forward=False)).order_by(
+                *_reverse_ordering(ordering)
+            )[: page_size + 1]
+        )
+        has_previous = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        number = max(page, 2) if has_previous else 1
+        return rows, number, True, has_previous
+
+    page = max(page, 1)
+    offset = (page - 1) * page_size
+    rows = list(queryset.order_by(*ordering)[offset : offset + page_size + 1])
+    has_next = len(rows) > page_size
+    return rows[:page_size], page, has_next, page > 1
@@ -0,0 +1,55 @@
+import logging
+import threading
+
+import requests
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# ---------- PURGE НА ПРОКСИ/CDN ----------
+# Страницы, закешированные прокси перед приложением, помечены заголовком
+# Surrogate-Key (SurrogateKeyMiddleware) теми же тегами, что и записи нашего
+# кеша. При инвалидации тегов те же теги уходят POST-запросом на
+# CACHE_PURGE_URL пачками по CACHE_PURGE_BATCH штук:
+#   {"surrogate_keys": ["product:12", "category:3", ...]}
+# плюс заголовок Surrogate-Key (ключи через пробел) — так понимают и
+# Fastly-подобные API, и простые самописные прокси.
+# Запросы уходят из фонового потока: сохранение товара не ждёт прокси.
+# Для разработки есть заглушка: manage.py purge_stub_server.
+
+
+def _batches(tags, size):
+    for i in range(0, len(tags), size):
+        yield tags[i : i + size]
+
+
+def purge_tags(tags):
+    """Отправляет purge для тегов; без CACHE_PURGE_URL ничего не делает."""
+    url = getattr(settings, "CACHE_PURGE_URL", "")
+    tags = list(dict.fromkeys(tags))
+    if not url or not tags:
+        return
+    batches = list(_batches(tags, max(getattr(settings, "CACHE_PURGE_BATCH", 256), 1)))
+    threading.Thread(
+        target=_send_batches, args=(url, batches), name="cache-purge", daemon=True
+    ).start()
+
+
+def _send_batches(url, batches):
+    headers = {}
+    token = getattr(settings, "CACHE_PURGE_TOKEN", "")
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    timeout = getattr(settings, "CACHE_PURGE_TIMEOUT", 2.0)
+    with requests.Session() as session:
+        for batch in batches:
+            try:
+                response = session.post(
+                    url,
+                    json={"surrogate_keys": batch},
+                    headers={**headers, "Surrogate-Key": " ".join(batch)},
+                    timeout=timeout,
+                )
+                response.raise_for_status()
+            except requests.RequestException:
+                logger.warning("Purge %d ключей не удался", len(batch), exc_info=True)
@@ -1,26 +1,244 @@
-from django.core.cache import cache
-from django.conf import settings
-from catalog.models import Product
-
-
-def get_products_by_category(category_id):
-    """Возвращает список всех продуктов в указанной категории.
-    Если включён кэш, то кэширует результат на CACHE_TTL секунд."""
-    cache_key = f"category_products:{category_id}"
-    cache_ttl = getattr(settings, "CACHE_TTL", 300)
-
-    if getattr(settings, "CACHE_ENABLED", False):
-        products = cache.get(cache_key)
-        if products is not None:
-            return products
-
-    products = list(
-        Product.objects.filter(category_id=category_id, is_published=True)
-        .select_related("category")
-        .order_by("-created_at")
+import hashlib
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F
+from django.template.loader import render_to_string
+
+from catalog.cache_utils import (
+    PRODUCTS_TAG,
+    category_info_tag,
+    category_tag,
+    home_page_key,
+    product_detail_key,
+    product_tag,
+    read_through,
+    tags_for_products,
+)
+from catalog.dto import (
+    FORMAT_VERSION,
+    ProductCard,
+    ProductDetail,
+    decode_cards,
+    encode_cards,
+)
+from catalog.models import SEARCH_CONFIG, Product
+from catalog.pagination import DEFAULT_ORDERING, keyset_page_rows, page_token
+
+# Допустимые сортировки страницы категории → порядок для keyset-пагинации
+CATEGORY_SORT_ORDERINGS = {
+    "newest": ("-created_at", "-pk"),
+    "price_asc": ("price", "pk"),
+    "price_desc": ("-price", "-pk"),
+}
+
+
+def product_page_key(cache_key) -> str:
+    """Полный ключ записи cached_product_page: версия формата карточек в ключе —
+    после смены формата старые блобы просто не читаются."""
+    return f"{cache_key}:v{FORMAT_VERSION}"
+
+
+def cached_product_page(cache_key, compute, *, tags, stale_ok=True):
+    """read_through для страницы товаров.
+    compute() возвращает (rows, number, has_next, has_previous) из keyset_page_rows;
+    в кеш вместо пиклов Product уходит компактный блоб карточек (catalog.dto),
+    наружу — список ProductCard. stale_ok — как у read_through."""
+
+    def compute_encoded():
+        rows, number, has_next, has_previous = compute()
+        cards = [ProductCard.from_product(product) for product in rows]
+        return encode_cards(cards), number, has_next, has_previous
+
+    blob, number, has_next, has_previous = read_through(
+        product_page_key(cache_key),
+        compute_encoded,
+        tags=tags,
+        value_tags=lambda result: tags_for_products(decode_cards(result[0])),
+        stale_ok=stale_ok,
+    )
+    return decode_cards(blob), number, has_next, has_previous
+
+
+def get_home_products(
+    is_staff, *, page=1, after=None, before=None, page_size=8, stale_ok=True
+):
+    """Одна страница главной: (cards, number, has_next, has_previous).
+    staff видит все товары, остальные — только опубликованные; у каждой роли
+    свой ключ кеша. Через эту функцию страницы получают и HomeView,
+    и прогрев кеша (warm_cache), поэтому ключи у них совпадают.
+    stale_ok=False — устаревшая страница пересчитывается сразу (прогрев)."""
+
+    def compute():
+        qs = Product.objects.select_related("category")
+        if not is_staff:
+            qs = qs.filter(is_published=True)
+        return keyset_page_rows(
+            qs,
+            page_size,
+            ordering=DEFAULT_ORDERING,
+            after=after,
+            before=before,
+            page=page,
+        )
+
+    return cached_product_page(
+        home_page_key(is_staff, page_token(after, before, page)),
+        compute,
+        tags=[PRODUCTS_TAG],
+        stale_ok=stale_ok,
+    )
+
+
+def product_meta(product_id):
+    """Кортеж (updated_at, is_published, category_id, category_name) или None.
+    Нужен для HTTP-валидаторов страницы товара: читается из кеша (тег товара
+    и его категории), а при промахе — одной узкой выборкой без самой строки товара."""
+
+    def compute():
+        return (
+            Product.objects.filter(pk=product_id)
+            .values_list("updated_at", "is_published", "category_id", "category__name")
+            .first()
+        )
+
+    return read_through(
+        f"product:meta:{product_id}",
+        compute,
+        tags=[product_tag(product_id)],
+        value_tags=lambda meta: [category_info_tag(meta[2])] if meta else [],
+        stale_ok=False,
+    )
+
+
+def product_detail(product_id, *, is_staff=False):
+    """Страница товара без персональной части: ProductDetail или None (404).
+    В кеше лежит отрендеренный фрагмент карточки (catalog/includes/
+    product_detail_body.html) и несколько полей для кнопок и заголовка —
+    отдельно для staff и публичной выдачи. Запись зависит только от тегов
+    самого товара и его категории (category-info), так что правка соседнего
+    товара её не сбрасывает. Устаревшие записи не отдаются (stale_ok=False):
+    фрагмент должен совпадать с ETag страницы."""
+
+    def compute():
+        qs = Product.objects.select_related("category")
+        if not is_staff:
+            qs = qs.filter(is_published=True)
+        product = qs.filter(pk=product_id).first()
+        if product is None:
+            return None
+        return ProductDetail.from_product(
+            product,
+            render_to_string(
+                "catalog/includes/product_detail_body.html", {"product": product}
+            ),
+        ).to_dict()
+
+    data = read_through(
+        product_detail_key(product_id, is_staff),
+        compute,
+        tags=[product_tag(product_id)],
+        value_tags=lambda data: [category_info_tag(data["category_id"])] if data else [],
+        stale_ok=False,
+    )
+    return ProductDetail(**data) if data else None
+
+
+def category_products_key(
+    category_id,
+    *,
+    is_staff=False,
+    min_price=None,
+    max_price=None,
+    sort="newest",
+    token="page:1",
+):
+    """Ключ кеша одной страницы категории: категория + роль + фильтры
+    + сортировка + позиция."""
+    audience = "staff" if is_staff else "public"
+    return (
+        f"category_products:{category_id}:{audience}:"
+        f"{min_price or ''}-{max_price or ''}:{sort}:{token}"
+    )
+
+
+def get_products_by_category(
+    category_id,
+    *,
+    is_staff=False,
+    min_price=None,
+    max_price=None,
+    sort="newest",
+    page=1,
+    after=None,
+    before=None,
+    page_size=8,
+    stale_ok=True,
+):
+    """Возвращает одну страницу товаров категории (staff видит и неопубликованные,
+    как на главной): кортеж (cards, number, has_next, has_previous),
+    где cards — ProductCard.
+    Каждая комбинация (категория, фильтр, сортировка, страница) кешируется
+    отдельным ключом через cached_product_page — в Redis уходит не больше
+    page_size карточек, а сам запрос читает page_size + 1 строк независимо
+    от размера категории. stale_ok=False — устаревшая страница пересчитывается
+    сразу (прогрев)."""
+    ordering = CATEGORY_SORT_ORDERINGS.get(sort, CATEGORY_SORT_ORDERINGS["newest"])
+    cache_key = category_products_key(
+        category_id,
+        is_staff=is_staff,
+        min_price=min_price,
+        max_price=max_price,
+        sort=sort,
+        token=page_token(after, before, page),
     )
 
-    if getattr(settings, "CACHE_ENABLED", False):
-        cache.set(cache_key, products, cache_ttl)
+    def compute():
+        qs = Product.objects.filter(category_id=category_id).select_related(
+            "category"
+        )
+        if not is_staff:
+            qs = qs.filter(is_published=True)
+        if min_price is not None:
+            qs = qs.filter(price__gte=min_price)
+        if max_price is not None:
+            qs = qs.filter(price__lte=max_price)
+        return keyset_page_rows(
+            qs, page_size, ordering=ordering, after=after, before=before, page=page
+        )
+
+    return cached_product_page(
+        cache_key, compute, tags=[category_tag(category_id)], stale_ok=stale_ok
+    )
+
+
+# ---------- ПОИСК ----------
+
+SEARCH_ORDERING = ("-rank", "-pk")
+SEARCH_QUERY_MAX_LENGTH = 100
+
+
+def normalize_search_query(query: str) -> str:
+    """Приводит запрос к каноническому виду: регистр, лишние пробелы, длина.
+    «  iPhone   PRO » и «iphone pro» попадают в один ключ кеша."""
+    return " ".join(query.lower().split())[:SEARCH_QUERY_MAX_LENGTH]
+
+
+def search_products(query, *, page=1, page_size=12):
+    """Одна страница результатов полнотекстового поиска по опубликованным товарам.
+    Запрос разбирается как websearch (кавычки, «-слово», OR) с русской морфологией,
+    выдача сортируется по SearchRank. Поиск идёт по GIN-индексу
+    catalog_product_search_gin, а страница кешируется по нормализованному запросу."""
+    query = normalize_search_query(query)
+    digest = hashlib.sha1(query.encode()).hexdigest()
+    cache_key = f"search:products:{digest}:{page_token(page=page)}"
+
+    def compute():
+        search_query = SearchQuery(query, search_type="websearch", config=SEARCH_CONFIG)
+        qs = (
+            Product.objects.filter(is_published=True, search_vector=search_query)
+            .annotate(rank=SearchRank(F("search_vector"), search_query))
+            .select_related("category")
+        )
+        return keyset_page_rows(qs, page_size, ordering=SEARCH_ORDERING, page=page)
 
-    return products
\ No newline at end of file
+    return cached_product_page(cache_key, compute, tags=[PRODUCTS_TAG])
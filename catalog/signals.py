@@ -1,25 +1,81 @@
-from django.conf import settings
-from django.core.cache import cache
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
 from django.dispatch import receiver
-from catalog.models import Product
-from catalog.cache_utils import invalidate_home_products
+from catalog import facets, suggest
+from catalog.models import Product, Category
+from catalog.cache_utils import (
+    category_info_tag,
+    category_tag,
+    invalidate_tags,
+    product_invalidation_tags,
+    PRODUCT_IDS_TAG,
+    PRODUCTS_TAG,
+)
 
 
 @receiver([post_save, post_delete], sender=Product)
-def invalidate_product_cache(sender, **kwargs):
-    """Сброс кеша списка продуктов при изменении или удалении."""
-    if settings.CACHE_ENABLED:
-        cache.delete("catalog:products:list")
+def invalidate_product_cache(sender, instance: Product, signal, **kwargs):
+    """Любое создание/редактирование/удаление товара сбрасывает ровно те записи кеша,
+    которые от него зависят: сам товар, его категорию, владельца и списки товаров.
+    Битовые карты id — только если товар появился, исчез или сменил публикацию
+    (состояние до сохранения запомнил remember_product_facet_state)."""
+    tags = product_invalidation_tags(instance)
+    before = getattr(instance, "_facet_state_before", None)
+    if signal is post_delete or before is None or before[2] != instance.is_published:
+        tags.append(PRODUCT_IDS_TAG)
+    invalidate_tags(*tags)
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_cache(sender, instance: Category, **kwargs):
+    """Название категории выводится в карточках товаров — сбрасываем страницу
+    категории и все списки, где она встречается."""
+    invalidate_tags(
+        category_tag(instance.pk), category_info_tag(instance.pk), PRODUCTS_TAG
+    )
+
+
+@receiver(post_save, sender=Product)
+def update_product_suggest(sender, instance: Product, **kwargs):
+    """В подсказках только опубликованные товары."""
+    suggest.record_on_commit(
+        "product", instance.pk, instance.name if instance.is_published else None
+    )
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_suggest(sender, instance: Product, **kwargs):
+    suggest.record_on_commit("product", instance.pk)
+
+
+@receiver(post_save, sender=Category)
+def update_category_suggest(sender, instance: Category, **kwargs):
+    suggest.record_on_commit("category", instance.pk, instance.name)
+
+
+@receiver(post_delete, sender=Category)
+def remove_category_suggest(sender, instance: Category, **kwargs):
+    suggest.record_on_commit("category", instance.pk)
+
+
+@receiver([pre_save, pre_delete], sender=Product)
+def remember_product_facet_state(sender, instance: Product, signal, **kwargs):
+    """Запоминаем, как товар учтён в счётчиках фасетов до сохранения/удаления.
+    Строка блокируется до конца транзакции (Product.save, удаление через
+    Collector), поэтому параллельные правки не считают разницу от одного
+    и того же старого состояния."""
+    adding = signal is pre_save and instance._state.adding
+    instance._facet_state_before = None if adding else facets.stored_state(instance)
 
 
 @receiver(post_save, sender=Product)
-def product_saved_invalidate_cache(sender, instance: Product, **kwargs):
-    # Любое создание/редактирование товара
-    invalidate_home_products()
+def update_product_facets(sender, instance: Product, **kwargs):
+    """Сдвигаем счётчики категории/ценового диапазона на разницу состояний."""
+    old = getattr(instance, "_facet_state_before", None)
+    new = facets.current_state(instance)
+    facets.apply_deltas(facets.state_deltas(old, new))
 
 
 @receiver(post_delete, sender=Product)
-def product_deleted_invalidate_cache(sender, instance: Product, **kwargs):
-    # Удаление товара
-    invalidate_home_products()
+def remove_product_facets(sender, instance: Product, **kwargs):
+    old = getattr(instance, "_facet_state_before", None)
+    facets.apply_deltas(facets.state_deltas(old, None))
@@ -0,0 +1,353 @@
+import fcntl
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import threading
+from bisect import bisect_left, insort
+from contextlib import contextmanager
+from functools import partial
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+MIN_QUERY_LENGTH = 2
+MAX_PREFIX_LENGTH = 12
+TRIGRAM_THRESHOLD = 0.3
+# сколько лучших записей хранится у каждого префикса (не меньше SuggestView.max_limit)
+PREFIX_TOP_K = 20
+# запрос из нескольких слов: полный список префикса перебираем, только если он короче
+PREFIX_SCAN_LIMIT = 500
+# сколько записей доходит до подсчёта сходства по триграммам
+MAX_TRIGRAM_CANDIDATES = 200
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize(text: str) -> str:
+    return " ".join(_NON_WORD.sub(" ", text.lower().replace("ё", "е")).split())
+
+
+def trigrams(text: str) -> set:
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class SuggestIndex:
+    """Индекс подсказок в памяти процесса.
+    - префиксный: префикс слова (до MAX_PREFIX_LENGTH символов) → ключи записей
+      и отсортированная верхушка из PREFIX_TOP_K лучших записей;
+    - триграммный: для опечаток, когда по префиксам набралось меньше limit.
+    Ключ записи — (kind, id), где kind = "product" или "category".
+    Порядок выдачи — короткие и алфавитно первые выше. Запрос из одного слова
+    отвечается срезом верхушки, без перебора списка префикса."""
+
+    def __init__(self):
+        self.entries = {}  # key -> (name, normalized, число триграмм)
+        self.prefixes = {}  # prefix -> set(key)
+        self.top = {}  # prefix -> отсортированный список rank, не длиннее PREFIX_TOP_K
+        self.grams = {}  # trigram -> set(key)
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def _rank(key, normalized):
+        return (len(normalized), normalized, key[0], key[1])
+
+    def add(self, kind, pk, name):
+        key = (kind, pk)
+        self.remove(kind, pk)
+        normalized = normalize(name)
+        if not normalized:
+            return
+        grams = trigrams(normalized)
+        self.entries[key] = (name, normalized, len(grams))
+        rank = self._rank(key, normalized)
+        for prefix in self._prefixes_of(normalized):
+            self.prefixes.setdefault(prefix, set()).add(key)
+            top = self.top.setdefault(prefix, [])
+            if len(top) < PREFIX_TOP_K or rank < top[-1]:
+                insort(top, rank)
+                del top[PREFIX_TOP_K:]
+        for gram in grams:
+            self.grams.setdefault(gram, set()).add(key)
+
+    def remove(self, kind, pk):
+        key = (kind, pk)
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        normalized = entry[1]
+        rank = self._rank(key, normalized)
+        for prefix in self._prefixes_of(normalized):
+            self._discard(self.prefixes, prefix, key)
+            top = self.top.get(prefix)
+            if top is None:
+                continue
+            i = bisect_left(top, rank)
+            if i < len(top) and top[i] == rank:
+                # освободившееся место дозаполнит _top при следующем запросе
+                del top[i]
+            if prefix not in self.prefixes:
+                del self.top[prefix]
+        for gram in trigrams(normalized):
+            self._discard(self.grams, gram, key)
+
+    @staticmethod
+    def _prefixes_of(normalized):
+        prefixes = set()
+        for word in normalized.split():
+            for i in range(1, min(len(word), MAX_PREFIX_LENGTH) + 1):
+                prefixes.add(word[:i])
+        return prefixes
+
+    @staticmethod
+    def _discard(postings, token, key):
+        keys = postings.get(token)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del postings[token]
+
+    def search(self, query, limit=8):
+        """Возвращает до limit троек (kind, id, name): сначала совпадения
+        по префиксам всех слов запроса, затем — похожие по триграммам."""
+        normalized = normalize(query)
+        if len(normalized) < MIN_QUERY_LENGTH:
+            return []
+
+        found = self._by_prefix(normalized, limit)
+        if len(found) < limit and len(normalized) >= 3:
+            seen = set(found)
+            found += [
+                key
+                for key in self._by_trigram(normalized, limit + len(found))
+                if key not in seen
+            ][: limit - len(found)]
+        return [(kind, pk, self.entries[(kind, pk)][0]) for kind, pk in found]
+
+    def _top(self, prefix):
+        """Верхушка префикса. После удаления из неё записи список короче
+        PREFIX_TOP_K — тогда один раз пересчитываем его по полному списку."""
+        top = self.top.get(prefix, [])
+        keys = self.prefixes.get(prefix, ())
+        if len(top) < min(PREFIX_TOP_K, len(keys)):
+            top = heapq.nsmallest(
+                PREFIX_TOP_K, (self._rank(key, self.entries[key][1]) for key in keys)
+            )
+            self.top[prefix] = top
+        return top
+
+    def _by_prefix(self, normalized, limit):
+        """limit не больше PREFIX_TOP_K: запрос из одного слова — срез верхушки."""
+        words = {word[:MAX_PREFIX_LENGTH] for word in normalized.split()}
+        postings = []
+        for word in words:
+            keys = self.prefixes.get(word)
+            if not keys:
+                return []
+            postings.append((len(keys), word, keys))
+        postings.sort(key=lambda posting: posting[0])
+        _, prefix, smallest = postings[0]
+        others = [keys for _, _, keys in postings[1:]]
+
+        # верхушка упорядочена по rank: первые limit подошедших — лучшие из всех
+        found = []
+        for rank in self._top(prefix):
+            key = rank[2:]
+            if all(key in keys for keys in others):
+                found.append(key)
+                if len(found) == limit:
+                    return found
+        if not others:
+            return found
+        # запрос из нескольких слов, и верхушки не хватило: проверяем не больше
+        # PREFIX_SCAN_LIMIT записей самого короткого списка. Если он короче —
+        # выдача точная, иначе — лучшие из просмотренных
+        scanned = (
+            key
+            for key in islice(smallest, PREFIX_SCAN_LIMIT)
+            if all(key in keys for keys in others)
+        )
+        return heapq.nsmallest(
+            limit,
+            set(found).union(scanned),
+            key=lambda key: self._rank(key, self.entries[key][1]),
+        )
+
+    def _by_trigram(self, normalized, limit):
+        query_grams = trigrams(normalized)
+        postings = sorted(
+            (self.grams.get(gram, ()) for gram in query_grams), key=len
+        )
+        # сходство common / (|запрос| + |запись| - common) не больше
+        # common / |запрос| — записи с меньшим числом общих триграмм порог не пройдут
+        min_common = max(math.ceil(TRIGRAM_THRESHOLD * len(query_grams)), 1)
+        # у такой записи хотя бы одна из len - min_common + 1 самых редких триграмм
+        # запроса общая, поэтому кандидатов берём только из их списков
+        rarest = postings[: len(postings) - min_common + 1]
+        candidates = set()
+        for keys in rarest:
+            candidates.update(islice(keys, MAX_TRIGRAM_CANDIDATES - len(candidates)))
+            if len(candidates) >= MAX_TRIGRAM_CANDIDATES:
+                break
+        scored = []
+        for key in candidates:
+            common = sum(key in keys for keys in postings)
+            _, entry_normalized, entry_grams = self.entries[key]
+            score = common / (len(query_grams) + entry_grams - common)
+            if score >= TRIGRAM_THRESHOLD:
+                scored.append((-score, self._rank(key, entry_normalized), key))
+        return [key for _, _, key in heapq.nsmallest(limit, scored)]
+
+
+# ---------- ОБЩИЙ СНИМОК ДЛЯ ВСЕХ ВОРКЕРОВ ----------
+# Снимок (SUGGEST_INDEX_PATH) — полный список записей в JSON, журнал
+# (<путь>.journal) — дописываемые строки операций ["+", kind, id, name] /
+# ["-", kind, id]. Сигналы только дописывают строку в журнал; каждый воркер
+# перед ответом делает os.stat и догружает новые строки, а при смене снимка
+# (перестройка командой build_suggest_index) перечитывает его целиком.
+# Запись в журнал и перестройка снимка идут под flock на файле журнала.
+
+
+def _snapshot_path():
+    return getattr(
+        settings,
+        "SUGGEST_INDEX_PATH",
+        os.path.join(settings.BASE_DIR, "var", "suggest_index.json"),
+    )
+
+
+def _journal_path():
+    return _snapshot_path() + ".journal"
+
+
+@contextmanager
+def journal_lock():
+    os.makedirs(os.path.dirname(_journal_path()), exist_ok=True)
+    with open(_journal_path(), "a") as journal:
+        fcntl.flock(journal, fcntl.LOCK_EX)
+        try:
+            yield journal
+        finally:
+            fcntl.flock(journal, fcntl.LOCK_UN)
+
+
+class SharedSuggestIndex:
+    """SuggestIndex процесса, синхронизированный со снимком и журналом на диске."""
+
+    def __init__(self):
+        self.index = SuggestIndex()
+        self._snapshot_mtime = None
+        self._journal_offset = 0
+        self._lock = threading.Lock()
+
+    def search(self, query, limit=8):
+        self.refresh()
+        # поиск идёт вне замка: потоки воркера не ждут друг друга на каждом
+        # нажатии клавиши. Замок берём, только если журнал в этот момент
+        # правит тот же индекс и перебор наткнулся на изменённое множество.
+        index = self.index
+        try:
+            return index.search(query, limit)
+        except (RuntimeError, KeyError):
+            with self._lock:
+                return self.index.search(query, limit)
+
+    def refresh(self):
+        """Подтягивает изменения с диска. В обычном случае это два os.stat
+        без замка."""
+        try:
+            snapshot_mtime = os.stat(_snapshot_path()).st_mtime_ns
+        except FileNotFoundError:
+            return
+        try:
+            journal_size = os.stat(_journal_path()).st_size
+        except FileNotFoundError:
+            journal_size = 0
+        if (
+            snapshot_mtime == self._snapshot_mtime
+            and journal_size == self._journal_offset
+        ):
+            return
+
+        with self._lock:
+            if (
+                snapshot_mtime != self._snapshot_mtime
+                or journal_size < self._journal_offset
+            ):
+                self._load_snapshot(snapshot_mtime)
+            if journal_size > self._journal_offset:
+                self._apply_journal()
+
+    def _load_snapshot(self, mtime):
+        index = SuggestIndex()
+        with open(_snapshot_path(), encoding="utf-8") as f:
+            for kind, pk, name in json.load(f):
+                index.add(kind, pk, name)
+        self.index = index
+        self._snapshot_mtime = mtime
+        self._journal_offset = 0
+
+    def _apply_journal(self):
+        with open(_journal_path(), "rb") as f:
+            f.seek(self._journal_offset)
+            data = f.read()
+        # недописанную последнюю строку оставляем на следующий раз
+        complete = data[: data.rfind(b"\n") + 1]
+        for line in complete.splitlines():
+            try:
+                op = json.loads(line)
+            except ValueError:
+                continue
+            if op[0] == "+":
+                self.index.add(op[1], op[2], op[3])
+            else:
+                self.index.remove(op[1], op[2])
+        self._journal_offset += len(complete)
+
+
+shared_index = SharedSuggestIndex()
+
+
+def record(kind, pk, name=None):
+    """Дописывает изменение в журнал: name=None — удалить запись из подсказок.
+    Пока снимка нет (индекс ещё не построен), журнал не ведём — его
+    целиком создаст build_suggest_index."""
+    if not os.path.exists(_snapshot_path()):
+        return
+    op = ["-", kind, pk] if name is None else ["+", kind, pk, name]
+    try:
+        with journal_lock() as journal:
+            journal.write(json.dumps(op, ensure_ascii=False) + "\n")
+    except OSError:
+        logger.warning("Не удалось обновить журнал подсказок", exc_info=True)
+
+
+def record_on_commit(kind, pk, name=None):
+    """record после фиксации транзакции: откатившееся сохранение не должно
+    попасть в журнал, который сразу читают остальные воркеры."""
+    transaction.on_commit(partial(record, kind, pk, name))
+
+
+def rebuild(entries):
+    """Записывает новый снимок из entries [(kind, id, name), ...] и очищает журнал.
+    Вызывается из build_suggest_index; entries лучше выбирать уже под замком,
+    чтобы не потерять изменения, пришедшие во время выборки."""
+    path = _snapshot_path()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump([list(entry) for entry in entries], f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    with open(_journal_path(), "w"):
+        pass
+
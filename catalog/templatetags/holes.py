@@ -0,0 +1,13 @@
+from django import template
+from django.template.loader import render_to_string
+
+from catalog.fragments import HOLES, wrap_hole
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, name):
+    """{% hole "имя" %} — персональный фрагмент страницы (см. catalog.fragments).
+    Рендерится как обычно, но помечается, чтобы кеш страницы мог его вырезать."""
+    return wrap_hole(name, render_to_string(HOLES[name], context.flatten()))
@@ -1,3 +1,1047 @@
-from django.test import TestCase
+import threading
+import time
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.contrib.postgres.search import SearchQuery
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.db import transaction
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from catalog import degraded, facets, purge, suggest
+from catalog.cache_utils import (
+    PRODUCT_IDS_TAG,
+    PRODUCTS_TAG,
+    CacheEntry,
+    _flush_invalidation,
+    _lock_key,
+    _should_refresh_early,
+    category_tag,
+    deferred_invalidation,
+    get_tagged,
+    home_page_key,
+    page_cache_key,
+    product_tag,
+    read_through,
+    tag_key,
+)
+from catalog.circuit_breaker import CircuitBreaker
+from catalog.fragments import fill_holes, punch_holes
+from catalog.id_bitmaps import is_known_id, visible_ids
+from catalog.middleware import CacheStalenessMiddleware
+from catalog.models import SEARCH_CONFIG, Category, FacetCount, Product
+from catalog.pagination import encode_cursor, page_token
+from catalog.services import product_page_key
+from catalog.two_tier_cache import (
+    _MISSING,
+    LocalLRU,
+    ResilientCache,
+    TwoTierCache,
+    compare_and_delete,
+    tiered_cache,
+)
+
+try:  # локальный «Redis» в памяти — необязательная зависимость для тестов
+    import fakeredis
+    from django.core.cache.backends.redis import RedisCache
+except ImportError:  # pragma: no cover
+    fakeredis = None
+
+
+def fake_redis_cache(server):
+    """RedisCache Django поверх fakeredis: настоящий клиент, сервер в памяти."""
+    return RedisCache(
+        "redis://fake:6379/0",
+        {"OPTIONS": {"connection_class": fakeredis.FakeConnection, "server": server}},
+    )
+
+
+def clear_caches():
+    """Общий кеш и L1 этого процесса — тесты не должны видеть чужие записи."""
+    cache.clear()
+    if tiered_cache.l1 is not None:
+        tiered_cache.l1.clear()
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+class LocalLRUTests(SimpleTestCase):
+    """L1: вытеснение по числу записей, по размеру и по времени жизни."""
+
+    def test_evicts_least_recently_used_by_count(self):
+        lru = LocalLRU(max_items=2)
+        lru.set("a", 1)
+        lru.set("b", 2)
+        lru.get("a")  # «a» свежее «b»
+        lru.set("c", 3)
+        self.assertIs(lru.get("b"), _MISSING)
+        self.assertEqual((lru.get("a"), lru.get("c")), (1, 3))
+        self.assertEqual(len(lru), 2)
+
+    def test_evicts_by_bytes(self):
+        lru = LocalLRU(max_items=100, max_bytes=250)
+        lru.set("a", "x" * 100)
+        lru.set("b", "y" * 100)
+        lru.set("c", "z" * 100)
+        self.assertIs(lru.get("a"), _MISSING)
+        self.assertLessEqual(lru.size_bytes, 250)
+        # значение больше всего L1 не кладётся вовсе
+        lru.set("huge", "h" * 1000)
+        self.assertIs(lru.get("huge"), _MISSING)
+
+    def test_size_is_estimated_without_pickling(self):
+        lru = LocalLRU(max_bytes=10_000)
+        entry = CacheEntry(b"x" * 1000, {"products": 3}, 0.0, 0.1)
+        with mock.patch("catalog.two_tier_cache.pickle.dumps") as dumps:
+            lru.set("page", entry)
+        dumps.assert_not_called()
+        self.assertGreater(lru.size_bytes, 1000)
+        self.assertLess(lru.size_bytes, 1200)
+
+    def test_expires_by_ttl(self):
+        lru = LocalLRU(ttl=60)
+        with mock.patch("catalog.two_tier_cache.time.monotonic", return_value=1000.0):
+            lru.set("a", 1)
+            lru.set("short", 2, timeout=5)  # таймаут записи короче TTL L1
+        with mock.patch("catalog.two_tier_cache.time.monotonic", return_value=1010.0):
+            self.assertEqual(lru.get("a"), 1)
+            self.assertIs(lru.get("short"), _MISSING)
+        with mock.patch("catalog.two_tier_cache.time.monotonic", return_value=1061.0):
+            self.assertIs(lru.get("a"), _MISSING)
+        self.assertEqual(lru.size_bytes, 0)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch("catalog.circuit_breaker.time.monotonic")
+        self.clock = patcher.start()
+        self.clock.return_value = 100.0
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=10)
+
+    def test_trips_after_threshold_and_rejects(self):
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.counters["trips"], 1)
+        self.assertEqual(self.breaker.counters["rejected"], 1)
+
+    def test_half_open_probe_closes_or_reopens(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.clock.return_value = 111.0
+        self.assertTrue(self.breaker.allow())  # одна пробная операция
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+        self.clock.return_value = 122.0
+        self.assertTrue(self.breaker.allow())
+        self.assertTrue(self.breaker.record_success())
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertFalse(self.breaker.record_success())
+
+
+@skipUnless(fakeredis, "нужен fakeredis")
+@override_settings(CACHE_BREAKER_FAILURES=2, CACHE_BREAKER_RESET=0)
+class ResilientCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.server = fakeredis.FakeServer()
+        self.primary = fake_redis_cache(self.server)
+        self.cache = ResilientCache(self.primary, LocMemCache("test-fallback", {}))
+
+    def test_falls_back_and_replays_tag_versions_on_recovery(self):
+        self.cache.set("tag:products", "v1", None)
+        self.cache.set("page", "old", None)
+
+        self.server.connected = False
+        self.cache.get("page")
+        self.cache.get("page")
+        self.assertEqual(self.cache.breaker.state, CircuitBreaker.OPEN)
+        # инвалидация во время отказа пишется только в кеш процесса
+        self.cache.set("tag:products", "v2", None)
+        self.cache.set("page", "during-outage", None)
+        self.assertEqual(self.cache.get("tag:products"), "v2")
+
+        self.server.connected = True
+        self.cache.get("page")  # пробная операция замыкает предохранитель
+        self.assertEqual(self.cache.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(self.primary.get("tag:products"), "v2")
+        # прочее из кеша процесса в Redis не переносится, сам он очищен
+        self.assertEqual(self.primary.get("page"), "old")
+        self.assertIsNone(self.cache.fallback.get("tag:products"))
+        self.assertGreater(self.cache.stats()["fallback_ops"], 0)
+
+    def test_delete_if_removes_only_own_value(self):
+        self.cache.set("lock:k", "mine", 10)
+        self.assertFalse(self.cache.delete_if("lock:k", "theirs"))
+        self.assertEqual(self.primary.get("lock:k"), "mine")
+        self.assertTrue(compare_and_delete(self.primary, "lock:k", "mine"))
+        self.assertIsNone(self.primary.get("lock:k"))
+
+
+@override_settings(
+    CACHE_ENABLED=True,
+    CACHE_STALE_WHILE_REVALIDATE=False,
+    CACHE_EARLY_REFRESH_BETA=0,
+    CACHE_LOCK_WAIT=2,
+)
+class ReadThroughTests(SimpleTestCase):
+    """Промах по ключу пересчитывает один воркер, замок не переживает ошибку."""
+
+    def setUp(self):
+        clear_caches()
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+        barrier = threading.Barrier(6)
+        results = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return "значение"
+
+        def reader():
+            barrier.wait(5)
+            results.append(read_through("stampede", compute, tags=["t"]))
+
+        threads = [threading.Thread(target=reader) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["значение"] * 6)
+
+    def test_lock_is_released_when_compute_raises(self):
+        def broken():
+            raise RuntimeError("БД недоступна")
+
+        with self.assertRaises(RuntimeError):
+            read_through("broken", broken)
+        self.assertIsNone(tiered_cache.l2.get(_lock_key("broken")))
+        self.assertEqual(read_through("broken", lambda: "ok"), "ok")
+
+    @override_settings(CACHE_EARLY_REFRESH_BETA=1.0)
+    def test_early_refresh_grows_closer_to_expiry(self):
+        now = time.time()
+        far = CacheEntry("v", {}, now + 100, delta=1.0)
+        near = CacheEntry("v", {}, now + 1, delta=1.0)
+        with mock.patch("catalog.cache_utils.random.random", return_value=0.9):
+            # сдвиг -delta·ln(0.1) ≈ 2.3 с
+            self.assertFalse(_should_refresh_early(far))
+            self.assertTrue(_should_refresh_early(near))
+        self.assertFalse(_should_refresh_early(near._replace(delta=0)))
+
+
+@override_settings(
+    CACHE_ENABLED=True, CACHE_STALE_WHILE_REVALIDATE=True, CACHE_EARLY_REFRESH_BETA=0
+)
+class StaleWhileRevalidateTests(SimpleTestCase):
+    """Устаревшее значение отдаётся сразу, пересчёт — один, в фоне."""
+
+    def setUp(self):
+        clear_caches()
+        read_through("listing", lambda: "старое", tags=["t"])
+        _flush_invalidation(["t"])
+
+    def test_stale_value_is_served_with_one_background_refresh(self):
+        calls = []
+        release = threading.Event()
+
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            return "новое"
+
+        def view(request):
+            return HttpResponse(read_through("listing", compute, tags=["t"]))
+
+        middleware = CacheStalenessMiddleware(view)
+        for _ in range(3):
+            response = middleware(RequestFactory().get("/"))
+            self.assertEqual(response.content.decode(), "старое")
+            self.assertIn("X-Cache-Staleness", response)
+        release.set()
+        self.assertTrue(wait_until(lambda: get_tagged("listing") == "новое"))
+        self.assertEqual(len(calls), 1)
+        response = middleware(RequestFactory().get("/"))
+        self.assertEqual(response.content.decode(), "новое")
+        self.assertNotIn("X-Cache-Staleness", response)
+
+
+@skipUnless(fakeredis, "нужен fakeredis")
+@override_settings(CACHE_L1_ENABLED=True, CACHE_L1_TTL=60)
+class TwoTierInvalidationTests(SimpleTestCase):
+    """Два «процесса» с общим L2 и общим каналом pub/sub."""
+
+    def setUp(self):
+        server = fakeredis.FakeServer()
+        self.redis = fakeredis.FakeRedis(server=server)
+        l2 = fake_redis_cache(server)
+        self.workers = []
+        for _ in range(2):
+            worker = TwoTierCache(l2=l2)
+            worker._redis = fakeredis.FakeRedis(server=server)
+            worker._enabled()  # запускает поток-подписчик
+            self.workers.append(worker)
+        # подписавшись, поток очищает L1 — дожидаемся этого до начала теста
+        self.assertTrue(
+            wait_until(lambda: self.redis.pubsub_numsub(self._channel())[0][1] >= 2)
+        )
+
+    def _channel(self):
+        return self.workers[0]._channel()
+
+    def test_write_in_one_process_drops_l1_key_in_another(self):
+        writer, reader = self.workers
+        writer.set("product:1", "v1")
+        self.assertEqual(reader.get("product:1"), "v1")  # теперь и в L1 читателя
+        self.assertEqual(reader.l1.get("product:1"), "v1")
+
+        writer.set("product:1", "v2")
+        self.assertTrue(wait_until(lambda: reader.l1.get("product:1") is _MISSING))
+        self.assertEqual(reader.get("product:1"), "v2")
+
+    def test_own_messages_are_ignored(self):
+        writer, _ = self.workers
+        writer.set("k", "v")
+        writer._on_message('{"sender": "%s", "keys": ["k"]}' % writer.sender_id)
+        self.assertEqual(writer.l1.get("k"), "v")
+
+    def test_listener_is_not_started_without_redis_l2(self):
+        worker = TwoTierCache(l2=LocMemCache("test-l2", {}))
+        worker._redis = self.redis
+        with mock.patch("catalog.two_tier_cache.threading.Thread") as thread:
+            worker._enabled()
+        thread.assert_not_called()
+
+    def test_repeated_listener_failures_warn_once(self):
+        worker = self.workers[0]
+        client = mock.Mock()
+        client.pubsub.side_effect = [OSError, OSError, OSError, SystemExit]
+        with mock.patch.object(
+            worker, "_redis_client", return_value=client
+        ), mock.patch("catalog.two_tier_cache.time.sleep"):
+            with self.assertLogs("catalog.two_tier_cache", "DEBUG") as logs:
+                with self.assertRaises(SystemExit):
+                    worker._listen()
+        levels = [record.levelname for record in logs.records]
+        self.assertEqual(levels, ["WARNING", "DEBUG", "DEBUG"])
+
+
+class ProductSearchVectorTests(TestCase):
+    """Поисковый вектор считает сам Postgres — и при записи мимо save()."""
+
+    def setUp(self):
+        owner = get_user_model().objects.create_user("owner@example.com", "pass")
+        self.product = Product.objects.create(
+            name="Смартфон",
+            description="Большой экран",
+            price=100,
+            category=Category.objects.create(name="Телефоны"),
+            owner=owner,
+            is_published=True,
+        )
+
+    def found(self, query):
+        search_query = SearchQuery(query, config=SEARCH_CONFIG)
+        return list(
+            Product.objects.filter(search_vector=search_query).values_list(
+                "pk", flat=True
+            )
+        )
+
+    def test_vector_follows_save_and_queryset_update(self):
+        self.assertEqual(self.found("смартфоны"), [self.product.pk])
+        Product.objects.filter(pk=self.product.pk).update(description="Складной корпус")
+        self.assertEqual(self.found("корпус"), [self.product.pk])
+        self.assertEqual(self.found("экран"), [])
+
+
+class SuggestIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = suggest.SuggestIndex()
+        for pk in range(500):
+            self.index.add("product", pk, f"Чехол {pk:03d}")
+        self.index.add("product", 1000, "Наушники Sony")
+        self.index.add("category", 1, "Наушники")
+
+    def test_prefix_matches_come_short_and_alphabetical_first(self):
+        found = self.index.search("чех 01", limit=3)
+        self.assertEqual(
+            [name for _, _, name in found], ["Чехол 010", "Чехол 011", "Чехол 012"]
+        )
+        self.assertEqual(
+            [name for _, _, name in self.index.search("наушн")],
+            ["Наушники", "Наушники Sony"],
+        )
+
+    def test_typo_falls_back_to_trigrams_and_remove_forgets_entry(self):
+        self.assertEqual(self.index.search("наушнки")[0], ("category", 1, "Наушники"))
+        self.index.remove("category", 1)
+        self.assertEqual(
+            self.index.search("наушнки"), [("product", 1000, "Наушники Sony")]
+        )
+        self.assertNotIn(("category", 1), self.index.entries)
+
+    def test_removing_top_entry_refills_prefix_top(self):
+        for pk in range(5):
+            self.index.remove("product", pk)
+        found = self.index.search("чехол", limit=suggest.PREFIX_TOP_K)
+        self.assertEqual(found[0], ("product", 5, "Чехол 005"))
+        self.assertEqual(len(found), suggest.PREFIX_TOP_K)
+
+
+class SuggestLatencyTests(SimpleTestCase):
+    """Подсказка на каждое нажатие клавиши: даже на большом индексе
+    запрос не должен перебирать списки префиксов и триграмм целиком."""
+
+    WORDS = [
+        "чехол", "наушники", "смартфон", "зарядка", "кабель", "планшет",
+        "колонка", "часы", "ноутбук", "мышь", "клавиатура", "монитор",
+    ]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.index = suggest.SuggestIndex()
+        words = cls.WORDS
+        for pk in range(100_000):
+            name = (
+                f"{words[pk % 12]} {words[pk // 12 % 12]} "
+                f"{words[pk // 144 % 12]} модель {pk}"
+            )
+            cls.index.add("product", pk, name)
+
+    def test_queries_stay_fast(self):
+        queries = ["че", "чех", "чехол", "чехол на", "чехол наушники мышь", "смартфн"]
+        self.assertEqual(len(self.index.search("чехол на", limit=20)), 20)
+        started = time.perf_counter()
+        for _ in range(20):
+            for query in queries:
+                self.index.search(query, limit=20)
+        per_query = (time.perf_counter() - started) / (20 * len(queries))
+        self.assertLess(per_query, 0.002)
+
+
+class SuggestSignalsTests(TestCase):
+    def test_journal_is_written_only_after_commit(self):
+        owner = get_user_model().objects.create_user("owner@example.com", "pass")
+        with mock.patch("catalog.suggest.record") as record:
+            with self.captureOnCommitCallbacks(execute=True):
+                category = Category.objects.create(name="Телефоны")
+                Product.objects.create(
+                    name="Смартфон",
+                    price=100,
+                    category=category,
+                    owner=owner,
+                    is_published=True,
+                )
+                record.assert_not_called()
+        record.assert_any_call("category", category.pk, "Телефоны")
+        record.assert_any_call("product", mock.ANY, "Смартфон")
+
+
+@override_settings(CACHE_ENABLED=True, PAGE_CACHE_ENABLED=False)
+class HomeViewPaginationTests(TestCase):
+    """Главная: курсоры «→»/«←», испорченный курсор и ключи кеша по ролям."""
+
+    def setUp(self):
+        clear_caches()
+        self.owner = get_user_model().objects.create_user("owner@example.com", "pass")
+        category = Category.objects.create(name="Телефоны")
+        Product.objects.bulk_create(
+            Product(
+                name=f"Товар {i}",
+                price=100,
+                category=category,
+                owner=self.owner,
+                is_published=True,
+            )
+            for i in range(20)
+        )
+        self.draft = Product.objects.create(
+            name="Черновик", price=100, category=category, owner=self.owner
+        )
+        self.url = reverse("catalog:home")
+
+    def page(self, query=""):
+        response = self.client.get(f"{self.url}?{query}")
+        self.assertEqual(response.status_code, 200)
+        ids = [card.id for card in response.context["products"]]
+        return response.context["page_obj"], ids
+
+    def test_next_and_previous_cursors_round_trip(self):
+        first, first_ids = self.page()
+        second, second_ids = self.page(first.next_query)
+        third, third_ids = self.page(second.next_query)
+        self.assertEqual((len(first_ids), len(second_ids), len(third_ids)), (8, 8, 4))
+        self.assertIn("after=", second.next_query)
+        self.assertFalse(third.has_next())
+
+        self.assertIn("before=", third.previous_query)
+        back, back_ids = self.page(third.previous_query)
+        self.assertEqual(back_ids, second_ids)
+        self.assertEqual(back.number, 2)
+        self.assertEqual(self.page(back.previous_query)[1], first_ids)
+
+        expected = list(
+            Product.objects.filter(is_published=True)
+            .order_by("-created_at", "-id")
+            .values_list("pk", flat=True)
+        )
+        self.assertEqual(first_ids + second_ids + third_ids, expected)
+
+    def test_tampered_cursor_falls_back_to_first_page(self):
+        _, first_ids = self.page()
+        product = Product.objects.get(pk=first_ids[0])
+        huge_pk = SimpleNamespace(created_at=product.created_at, pk=10**30)
+        for cursor in ("мусор", "!!!", encode_cursor(huge_pk)):
+            with self.subTest(cursor=cursor):
+                page, ids = self.page(urlencode({"page": 2, "after": cursor}))
+                self.assertEqual((page.number, ids), (1, first_ids))
+
+    def test_staff_and_public_pages_use_separate_cache_keys(self):
+        staff = get_user_model().objects.create_user(
+            "staff@example.com", "pass", is_staff=True
+        )
+        _, public_ids = self.page()
+        self.client.force_login(staff)
+        _, staff_ids = self.page()
+        self.assertNotIn(self.draft.pk, public_ids)
+        self.assertIn(self.draft.pk, staff_ids)
+
+        public_key, staff_key = (
+            product_page_key(home_page_key(is_staff, page_token()))
+            for is_staff in (False, True)
+        )
+        self.assertNotEqual(public_key, staff_key)
+        self.assertIsNotNone(get_tagged(public_key))
+        self.assertIsNotNone(get_tagged(staff_key))
+
+
+class CategoryProductsViewTests(TestCase):
+    """Страница категории: список и счётчики — для одной и той же роли."""
+
+    def setUp(self):
+        clear_caches()
+        owner = get_user_model().objects.create_user("owner@example.com", "pass")
+        self.category = Category.objects.create(name="Телефоны")
+        for name, published in (("Смартфон", True), ("Черновик", False)):
+            Product.objects.create(
+                name=name,
+                price=100,
+                category=self.category,
+                owner=owner,
+                is_published=published,
+            )
+        self.url = reverse("catalog:category_products", args=[self.category.pk])
+
+    def test_public_sees_only_published(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.context["products_count"], 1)
+        self.assertEqual(
+            [card.name for card in response.context["products"]], ["Смартфон"]
+        )
+        self.assertEqual(sum(f["count"] for f in response.context["price_facets"]), 1)
+
+    def test_staff_sees_drafts_in_list_and_counts(self):
+        staff = get_user_model().objects.create_user(
+            "staff@example.com", "pass", is_staff=True
+        )
+        self.client.force_login(staff)
+        response = self.client.get(self.url)
+        self.assertEqual(response.context["products_count"], 2)
+        self.assertEqual(len(response.context["products"]), 2)
+        self.assertEqual(sum(f["count"] for f in response.context["price_facets"]), 2)
+
+    @override_settings(CACHE_ENABLED=True, PAGE_CACHE_ENABLED=True)
+    def test_unknown_category_leaves_no_tag_key(self):
+        missing_id = self.category.pk + 1000
+        response = self.client.get(
+            reverse("catalog:category_products", args=[missing_id])
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertIsNone(tiered_cache.get(tag_key(category_tag(missing_id))))
+
+    @override_settings(CACHE_ENABLED=True)
+    def test_known_category_gets_etag(self):
+        self.client.get(self.url)  # первый рендер заводит тег категории
+        response = self.client.get(self.url)
+        self.assertIn("ETag", response)
+        again = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(again.status_code, 304)
+
+
+class FacetCountTests(TestCase):
+    """Счётчики фасетов меняются на разницу состояний и сходятся с пересчётом."""
+
+    def setUp(self):
+        self.owner = get_user_model().objects.create_user("owner@example.com", "pass")
+        self.phones = Category.objects.create(name="Телефоны")
+        self.tablets = Category.objects.create(name="Планшеты")
+
+    def create(self, price=100, category=None, published=True):
+        return Product.objects.create(
+            name="Товар",
+            price=price,
+            category=category or self.phones,
+            owner=self.owner,
+            is_published=published,
+        )
+
+    def counts(self):
+        return {
+            (row.facet, row.key, row.audience): row.count
+            for row in FacetCount.objects.exclude(count=0)
+        }
+
+    @staticmethod
+    def category_counts(is_staff):
+        # после переезда товара в счётчике старой категории остаётся 0
+        counts = facets.category_counts(is_staff)
+        return {category_id: n for category_id, n in counts.items() if n}
+
+    def assertMatchesRebuild(self):
+        incremental = self.counts()
+        facets.rebuild()
+        self.assertEqual(self.counts(), incremental)
+
+    def test_create_edit_publish_and_delete(self):
+        product = self.create(published=False)
+        self.assertEqual(self.category_counts(True), {self.phones.pk: 1})
+        self.assertEqual(self.category_counts(False), {})
+
+        product.category = self.tablets
+        product.price = 2000
+        product.save()
+        self.assertEqual(self.category_counts(True), {self.tablets.pk: 1})
+        self.assertEqual(
+            [f["count"] for f in facets.price_facets(self.tablets.pk, is_staff=True)],
+            [1],
+        )
+
+        facets.set_published(Product.objects.filter(pk=product.pk), True)
+        self.assertEqual(self.category_counts(False), {self.tablets.pk: 1})
+        self.assertMatchesRebuild()
+
+        self.create(price=50000)
+        Product.objects.get(pk=product.pk).delete()
+        self.assertEqual(self.category_counts(False), {self.phones.pk: 1})
+        self.assertEqual(self.category_counts(True), {self.phones.pk: 1})
+        self.assertMatchesRebuild()
+
+    def test_stale_instance_counts_from_stored_row(self):
+        product = self.create()
+        first = Product.objects.get(pk=product.pk)
+        second = Product.objects.get(pk=product.pk)
+        first.category = self.tablets
+        first.save()
+        # второй экземпляр прочитан до правки — разница считается от строки в БД
+        second.is_published = False
+        second.save()
+        self.assertEqual(self.category_counts(False), {})
+        self.assertEqual(self.category_counts(True), {self.phones.pk: 1})
+        self.assertMatchesRebuild()
+
+
+@override_settings(CACHE_ENABLED=True)
+class DeferredInvalidationTests(TestCase):
+    """Сохранения в блоке deferred_invalidation() уходят одним пакетом."""
+
+    def setUp(self):
+        clear_caches()
+        owner = get_user_model().objects.create_user("owner@example.com", "pass")
+        category = Category.objects.create(name="Телефоны")
+        self.products = [
+            Product.objects.create(
+                name=f"Смартфон {i}",
+                price=100,
+                category=category,
+                owner=owner,
+                is_published=True,
+            )
+            for i in range(5)
+        ]
+
+    def save_all(self, fail=False):
+        with transaction.atomic():
+            for product in self.products:
+                product.price += 1
+                product.save()
+            if fail:
+                raise RuntimeError
+
+    def test_saves_are_flushed_once_after_commit(self):
+        with mock.patch.object(
+            tiered_cache, "set_many", wraps=tiered_cache.set_many
+        ) as set_many, mock.patch("catalog.purge.purge_tags") as purge_tags:
+            with deferred_invalidation():
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.save_all()
+                set_many.assert_not_called()
+                purge_tags.assert_not_called()
+        set_many.assert_called_once()
+        purge_tags.assert_called_once()
+        (tags,) = purge_tags.call_args.args
+        self.assertEqual(len(tags), len(set(tags)))
+        for product in self.products:
+            self.assertIn(product_tag(product.pk), tags)
+        self.assertEqual(
+            set(set_many.call_args.args[0]), {tag_key(tag) for tag in tags}
+        )
+
+    def test_rollback_sends_nothing(self):
+        with mock.patch.object(tiered_cache, "set_many") as set_many, mock.patch(
+            "catalog.purge.purge_tags"
+        ) as purge_tags:
+            with deferred_invalidation():
+                with self.captureOnCommitCallbacks(execute=True):
+                    with self.assertRaises(RuntimeError):
+                        self.save_all(fail=True)
+        set_many.assert_not_called()
+        purge_tags.assert_not_called()
+
+
+class InlineThread:
+    """Вместо фонового потока purge — выполнить сразу, чтобы проверить запросы."""
+
+    def __init__(self, target, args=(), **kwargs):
+        self.target, self.args = target, args
+
+    def start(self):
+        self.target(*self.args)
+
+
+@override_settings(
+    CACHE_ENABLED=True, PAGE_CACHE_ENABLED=True, CACHE_STALE_WHILE_REVALIDATE=False
+)
+class AnonymousPageCacheTests(TestCase):
+    """Страница для анонимов отдаётся из кеша без БД, «дырки» — свои у запроса."""
+
+    def setUp(self):
+        clear_caches()
+        self.owner = get_user_model().objects.create_user("owner@example.com", "pass")
+        Product.objects.create(
+            name="Смартфон",
+            price=100,
+            category=Category.objects.create(name="Телефоны"),
+            owner=self.owner,
+            is_published=True,
+        )
+        self.url = reverse("catalog:home")
+
+    def warm(self):
+        # первый запрос заводит тег, второй записывает страницу
+        self.client.get(self.url)
+        self.assertEqual(self.client.get(self.url)["X-Page-Cache"], "MISS")
+
+    def test_anonymous_hit_needs_no_queries(self):
+        self.warm()
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response["X-Page-Cache"], "HIT")
+        self.assertContains(response, "Смартфон")
+
+    def test_session_cookie_bypasses_cache(self):
+        self.warm()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = "no-such-session"
+        response = self.client.get(self.url)
+        self.assertNotIn("X-Page-Cache", response)
+
+    def test_holes_are_stored_empty_and_filled_per_request(self):
+        self.warm()
+        cached = get_tagged(page_cache_key(self.url))
+        self.assertIn("<!--hole:navbar_user-->", cached["content"])
+        self.assertNotIn("<!--/hole:navbar_user-->", cached["content"])
+
+        request = RequestFactory().get(self.url)
+        request.user = self.owner
+        request._messages = CookieStorage(request)
+        messages.success(request, "Товар сохранён")
+        page = fill_holes(cached["content"], request)
+        self.assertIn("owner@example.com", page)
+        self.assertIn("Товар сохранён", page)
+
+        anonymous = RequestFactory().get(self.url)
+        anonymous.user = AnonymousUser()
+        anonymous._messages = CookieStorage(anonymous)
+        page = fill_holes(cached["content"], anonymous)
+        self.assertNotIn("owner@example.com", page)
+        self.assertNotIn("Товар сохранён", page)
+
+    def test_invalidation_during_render_keeps_stale_page_out(self):
+        self.client.get(self.url)  # заводит тег
+
+        def invalidated_meanwhile(content):
+            # товар сохранили, пока страница рендерилась по старым данным
+            _flush_invalidation([PRODUCTS_TAG])
+            return punch_holes(content)
+
+        with mock.patch(
+            "catalog.middleware.punch_holes", side_effect=invalidated_meanwhile
+        ):
+            self.assertEqual(self.client.get(self.url)["X-Page-Cache"], "MISS")
+        self.assertIsNone(get_tagged(page_cache_key(self.url)))
+        self.assertEqual(self.client.get(self.url)["X-Page-Cache"], "MISS")
+
+
+@override_settings(
+    CACHE_ENABLED=True,
+    PAGE_CACHE_ENABLED=True,
+    CACHE_STALE_WHILE_REVALIDATE=False,
+    DB_BREAKER_RESET=7,
+)
+class DegradedModeTests(TestCase):
+    """Предохранитель БД разомкнут — страницы из кеша, остальное — 503."""
+
+    def setUp(self):
+        clear_caches()
+        owner = get_user_model().objects.create_user("owner@example.com", "pass")
+        self.product = Product.objects.create(
+            name="Смартфон",
+            price=100,
+            category=Category.objects.create(name="Телефоны"),
+            owner=owner,
+            is_published=True,
+        )
+        self.home = reverse("catalog:home")
+        self.detail = reverse("catalog:product_detail", args=[self.product.pk])
+
+    def db_down(self):
+        breaker = mock.Mock()
+        breaker.allow.return_value = False
+        return mock.patch("catalog.degraded.db_breaker", return_value=breaker)
+
+    def assertDegraded(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response[degraded.DEGRADED_HEADER], "db-unavailable")
+        self.assertNotIn("ETag", response)
+        self.assertContains(response, "Смартфон")
+
+    def test_listing_and_detail_are_served_from_cache(self):
+        for url in (self.home, self.home, self.detail):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        with self.db_down(), self.assertNumQueries(0):
+            self.assertDegraded(self.client.get(self.home))
+            self.assertDegraded(self.client.get(self.detail))
+
+    def test_without_cached_page_responds_503(self):
+        with self.db_down(), self.assertNumQueries(0):
+            for response in (
+                self.client.get(self.home),
+                self.client.post(reverse("catalog:contacts")),
+            ):
+                self.assertEqual(response.status_code, 503)
+                self.assertEqual(response["Retry-After"], "7")
+                self.assertEqual(response[degraded.DEGRADED_HEADER], "db-unavailable")
+
+
+@override_settings(CACHE_ENABLED=True, PAGE_CACHE_ENABLED=True, PROXY_CACHE_TTL=120)
+class SurrogateKeyTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.owner = get_user_model().objects.create_user("owner@example.com", "pass")
+        self.category = Category.objects.create(name="Телефоны")
+        self.product = Product.objects.create(
+            name="Смартфон",
+            price=100,
+            category=self.category,
+            owner=self.owner,
+            is_published=True,
+        )
+        self.url = reverse("catalog:product_detail", args=[self.product.pk])
+
+    def test_anonymous_page_is_public_and_tagged(self):
+        for _ in range(2):  # промах и попадание в кеш страниц — заголовки те же
+            response = self.client.get(self.url)
+            keys = response["Surrogate-Key"].split()
+            self.assertIn(f"product:{self.product.pk}", keys)
+            self.assertEqual(response["Cache-Tag"], ",".join(keys))
+            self.assertIn("public", response["Cache-Control"])
+            self.assertIn("s-maxage=120", response["Cache-Control"])
+            self.assertIn("Cookie", response["Vary"])
+
+    def test_logged_in_page_is_private_and_still_tagged(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(self.url)
+        self.assertIn(f"product:{self.product.pk}", response["Surrogate-Key"].split())
+        self.assertIn("private", response["Cache-Control"])
+        self.assertNotIn("s-maxage", response["Cache-Control"])
+
+    @override_settings(
+        CACHE_PURGE_URL="http://proxy.test/purge",
+        CACHE_PURGE_BATCH=2,
+        CACHE_PURGE_TOKEN="secret",
+    )
+    def test_save_purges_tags_in_batches_after_commit(self):
+        with mock.patch.object(purge.threading, "Thread", InlineThread), mock.patch(
+            "catalog.purge.requests.Session.post"
+        ) as post:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.product.price = 90
+                self.product.save()
+                post.assert_not_called()
+
+        sent = [call.kwargs["json"]["surrogate_keys"] for call in post.call_args_list]
+        self.assertTrue(all(len(batch) <= 2 for batch in sent))
+        self.assertCountEqual(
+            [tag for batch in sent for tag in batch],
+            [
+                "products",
+                f"product:{self.product.pk}",
+                f"category:{self.category.pk}",
+                f"owner:{self.owner.pk}",
+            ],
+        )
+        first = post.call_args_list[0]
+        self.assertEqual(first.args, ("http://proxy.test/purge",))
+        self.assertEqual(first.kwargs["headers"]["Surrogate-Key"], " ".join(sent[0]))
+        self.assertEqual(first.kwargs["headers"]["Authorization"], "Bearer secret")
+
+    def test_no_purge_without_url(self):
+        with mock.patch.object(purge.threading, "Thread") as thread:
+            purge.purge_tags(["products"])
+        thread.assert_not_called()
+
+
+@override_settings(CACHE_ENABLED=True)
+@override_settings(CACHE_STALE_WHILE_REVALIDATE=False)
+class IdBitmapTests(TestCase):
+    """Карта видимых id перестраивается только при смене видимости."""
+
+    def setUp(self):
+        clear_caches()
+        owner = get_user_model().objects.create_user("owner@example.com", "pass")
+        self.product = Product.objects.create(
+            name="Смартфон",
+            price=100,
+            category=Category.objects.create(name="Телефоны"),
+            owner=owner,
+            is_published=True,
+        )
+
+    def public_ids(self):
+        return visible_ids(
+            "product:public", Product.objects.filter(is_published=True), PRODUCT_IDS_TAG
+        )
+
+    def save(self, **changes):
+        with self.captureOnCommitCallbacks(execute=True):
+            for field, value in changes.items():
+                setattr(self.product, field, value)
+            self.product.save()
+
+    def test_edit_keeps_bitmap_and_visibility_change_rebuilds_it(self):
+        with self.assertNumQueries(1):
+            self.assertIn(self.product.pk, self.public_ids())
+
+        self.save(price=90, name="Смартфон Pro")
+        with self.assertNumQueries(0):
+            self.assertIn(self.product.pk, self.public_ids())
+
+        self.save(is_published=False)
+        with self.assertNumQueries(1):
+            self.assertNotIn(self.product.pk, self.public_ids())
+
+    def test_stale_bitmap_is_served_and_absent_id_is_confirmed(self):
+        self.public_ids()
+        with self.captureOnCommitCallbacks(execute=True):
+            fresh = Product.objects.create(
+                name="Планшет",
+                price=100,
+                category=self.product.category,
+                owner=self.product.owner,
+                is_published=True,
+            )
+        # карту перестраивает другой воркер — отдаём прежнюю, без перебора id
+        with mock.patch("catalog.cache_utils._acquire_lock", return_value=None):
+            with self.assertNumQueries(0):
+                self.assertNotIn(fresh.pk, self.public_ids())
+            with self.assertNumQueries(1):
+                self.assertTrue(
+                    is_known_id(
+                        "product:public",
+                        Product.objects.filter(is_published=True),
+                        PRODUCT_IDS_TAG,
+                        fresh.pk,
+                    )
+                )
+
+    def test_lost_lock_without_bitmap_skips_the_scan(self):
+        with mock.patch(
+            "catalog.cache_utils._acquire_lock", return_value=None
+        ), mock.patch("catalog.cache_utils._wait_for_value", return_value=None):
+            with self.assertNumQueries(0):
+                self.assertIsNone(self.public_ids())
+
+    def test_detail_page_is_not_tagged_with_bitmap_tag(self):
+        url = reverse("catalog:product_detail", args=[self.product.pk])
+        response = self.client.get(url)
+        self.assertNotIn(PRODUCT_IDS_TAG, response["Surrogate-Key"].split())
+        missing = reverse("catalog:product_detail", args=[self.product.pk + 1])
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+
+@override_settings(CACHE_ENABLED=True, CACHE_STALE_WHILE_REVALIDATE=True)
+class WarmCacheTests(TransactionTestCase):
+    """warm_cache: отчёт считает записанное, устаревшее пересчитывается сразу."""
+
+    def setUp(self):
+        clear_caches()
+        owner = get_user_model().objects.create_user("owner@example.com", "pass")
+        self.product = Product.objects.create(
+            name="Смартфон",
+            price=100,
+            category=Category.objects.create(name="Телефоны"),
+            owner=owner,
+            is_published=True,
+        )
+
+    def written(self):
+        """{семейство: байт} из отчёта команды."""
+        out = StringIO()
+        call_command("warm_cache", "--workers", "2", stdout=out)
+        rows = [line.split("|") for line in out.getvalue().splitlines()[1:-1]]
+        return {row[0].strip(): int(row[3]) for row in rows}
+
+    def test_second_run_writes_nothing_and_stale_page_is_rebuilt(self):
+        first = self.written()
+        self.assertGreater(first["home"], 0)
+        self.assertGreater(first["card"], 0)
+        self.assertEqual(set(self.written().values()), {0})
+
+        # вне транзакции инвалидация срабатывает сразу после save()
+        self.product.name = "Смартфон Pro"
+        self.product.save()
+        with mock.patch("catalog.cache_utils._refresh_in_background") as background:
+            self.assertGreater(self.written()["home"], 0)
+        background.assert_not_called()
@@ -0,0 +1,490 @@
+import json
+import logging
+import os
+import pickle
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+
+from catalog.circuit_breaker import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+_SCALAR_SIZE = 8
+
+
+def estimate_size(value, depth=3) -> int:
+    """Примерный размер значения в байтах — без сериализации: длина строк
+    и байтов плюс обход контейнеров на depth уровней (глубже — sys.getsizeof).
+    Для записей кеша (CacheEntry с блобом карточек, словари версий тегов)
+    оценка близка к размеру pickle, а стоит в разы меньше."""
+    if isinstance(value, (bytes, bytearray, memoryview, str)):
+        return len(value) + _SCALAR_SIZE
+    if value is None or isinstance(value, (bool, int, float)):
+        return _SCALAR_SIZE
+    if depth <= 0:
+        return sys.getsizeof(value)
+    if isinstance(value, (tuple, list, set, frozenset)):
+        return _SCALAR_SIZE + sum(estimate_size(item, depth - 1) for item in value)
+    if isinstance(value, dict):
+        return _SCALAR_SIZE + sum(
+            estimate_size(k, depth - 1) + estimate_size(v, depth - 1)
+            for k, v in value.items()
+        )
+    fields = getattr(value, "__dict__", None)
+    if fields is not None:
+        return _SCALAR_SIZE + estimate_size(fields, depth - 1)
+    return sys.getsizeof(value)
+
+
+class LocalLRU:
+    """Потокобезопасный LRU-кеш процесса с ограничением по числу записей,
+    суммарному размеру (оценка estimate_size) и времени жизни записи.
+    В L1 попадают только значения, уже записанные в L2 или прочитанные
+    из него, поэтому проверять их на сериализуемость не нужно."""
+
+    def __init__(self, max_items=1000, max_bytes=16 * 1024 * 1024, ttl=60):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (value, size, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def size_bytes(self):
+        return self._bytes
+
+    def get(self, key, default=_MISSING):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, size, expires_at = item
+            if expires_at <= time.monotonic():
+                self._pop(key)
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            self.delete(key)
+            return
+        ttl = self.ttl if timeout is None else min(self.ttl, timeout)
+        with self._lock:
+            self._pop(key)
+            self._data[key] = (value, size, time.monotonic() + ttl)
+            self._bytes += size
+            while len(self._data) > self.max_items or self._bytes > self.max_bytes:
+                self._pop(next(iter(self._data)))
+
+    def delete(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _pop(self, key):
+        item = self._data.pop(key, None)
+        if item is not None:
+            self._bytes -= item[1]
+
+
+def _backend_errors() -> tuple:
+    """Исключения, которые означают недоступность кеш-сервера, а не ошибку в коде."""
+    errors = [OSError]
+    try:
+        from redis.exceptions import RedisError
+    except ImportError:  # pragma: no cover
+        pass
+    else:
+        errors.append(RedisError)
+    return tuple(errors)
+
+
+# удалить ключ, только если в нём всё ещё наше значение — одной командой Redis
+_COMPARE_AND_DELETE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+_local_delete_lock = threading.Lock()
+
+
+def compare_and_delete(backend, key, value) -> bool:
+    """Атомарно удаляет key из кеша Django, если там лежит value.
+    Для RedisCache — Lua-скриптом (значение сериализуется так же, как при
+    записи); для кешей процесса (LocMemCache) хватает замка."""
+    redis_cache = getattr(backend, "_cache", None)
+    if hasattr(redis_cache, "get_client") and hasattr(redis_cache, "_serializer"):
+        redis_key = backend.make_and_validate_key(key)
+        client = redis_cache.get_client(redis_key, write=True)
+        raw = redis_cache._serializer.dumps(value)
+        return bool(client.eval(_COMPARE_AND_DELETE, 1, redis_key, raw))
+    with _local_delete_lock:
+        if backend.get(key) != value:
+            return False
+        return bool(backend.delete(key))
+
+
+class ResilientCache:
+    """L2 за предохранителем (catalog.circuit_breaker).
+    Соединение с Redis не открывается при старте: RedisCache подключается
+    при первом обращении, а таймауты сокета (CACHE_REDIS_TIMEOUT) не дают
+    зависнуть на медленном сервере. После CACHE_BREAKER_FAILURES ошибок подряд
+    все операции идут в кеш процесса (LocMemCache) — сайт работает, только
+    без общего кеша; раз в CACHE_BREAKER_RESET секунд одна операция пробует Redis.
+    После восстановления в Redis дописываются версии тегов, инвалидированных
+    во время отказа (иначе старые записи там снова стали бы «свежими»),
+    а запасной кеш очищается — при следующем отказе он не отдаст того,
+    что успело устареть."""
+
+    REPLAY_PREFIX = "tag:"
+
+    def __init__(self, primary, fallback=None):
+        self.primary = primary
+        self.fallback = fallback or LocMemCache(
+            "l2-fallback",
+            {"OPTIONS": {"MAX_ENTRIES": getattr(settings, "CACHE_FALLBACK_MAX_ENTRIES", 5000)}},
+        )
+        self.counters = {"fallback_ops": 0}
+        self._breaker = None
+        self._errors = _backend_errors()
+        self._dirty = set()
+        self._dirty_lock = threading.Lock()
+
+    @property
+    def breaker(self) -> CircuitBreaker:
+        if self._breaker is None:
+            self._breaker = CircuitBreaker(
+                "cache",
+                failure_threshold=getattr(settings, "CACHE_BREAKER_FAILURES", 3),
+                reset_timeout=getattr(settings, "CACHE_BREAKER_RESET", 10.0),
+            )
+        return self._breaker
+
+    @property
+    def available(self) -> bool:
+        return self.breaker.state == CircuitBreaker.CLOSED
+
+    def _call(self, method, *args, written=()):
+        breaker = self.breaker
+        if breaker.allow():
+            try:
+                result = self._invoke(self.primary, method, args)
+            except self._errors:
+                breaker.record_failure()
+                if breaker.state == CircuitBreaker.OPEN:
+                    logger.warning(
+                        "Кеш-сервер недоступен — работаем на кеше процесса",
+                        exc_info=True,
+                    )
+            else:
+                if breaker.record_success():
+                    logger.warning("Кеш-сервер снова доступен")
+                    self._recover()
+                return result
+
+        self.counters["fallback_ops"] += 1
+        dirty = [key for key in written if key.startswith(self.REPLAY_PREFIX)]
+        if dirty:
+            with self._dirty_lock:
+                self._dirty.update(dirty)
+        return self._invoke(self.fallback, method, args)
+
+    @staticmethod
+    def _invoke(backend, method, args):
+        # method — имя метода кеша Django или функция (backend, *args)
+        if callable(method):
+            return method(backend, *args)
+        return getattr(backend, method)(*args)
+
+    def _recover(self):
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, set()
+        try:
+            if dirty:
+                # версии тегов живут без TTL — как в tag_versions()
+                self.primary.set_many(self.fallback.get_many(dirty), None)
+        except self._errors:
+            with self._dirty_lock:
+                self._dirty.update(dirty)
+            self.breaker.record_failure()
+            return
+        self.fallback.clear()
+
+    # ---------- API кеша Django ----------
+
+    def get(self, key, default=None):
+        return self._call("get", key, default)
+
+    def get_many(self, keys):
+        return self._call("get_many", keys)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        return self._call("set", key, value, timeout, written=[key])
+
+    def set_many(self, mapping, timeout=DEFAULT_TIMEOUT):
+        return self._call("set_many", mapping, timeout, written=list(mapping))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT):
+        return self._call("add", key, value, timeout)
+
+    def delete(self, key):
+        return self._call("delete", key, written=[key])
+
+    def delete_if(self, key, value) -> bool:
+        """Удаляет key, только если там лежит value (снятие своего замка)."""
+        return self._call(compare_and_delete, key, value)
+
+    def stats(self) -> dict:
+        return {
+            **{f"breaker_{name}": value for name, value in self.breaker.stats().items()},
+            **self.counters,
+        }
+
+
+# ---------- УЧЁТ ЗАПИСЕЙ ----------
+# Для отчёта warm_cache: какие ключи записаны в блоке record_writes() и сколько
+# байт занимает каждое значение так, как его хранит Redis (RedisCache пиклирует
+# значения). Вне блока запись ничего лишнего не делает.
+
+_written: ContextVar = ContextVar("cache_written", default=None)
+
+
+@contextmanager
+def record_writes():
+    """Собирает {ключ: байт} записей TwoTierCache.set/set_many внутри блока
+    (в текущем потоке)."""
+    written = {}
+    token = _written.set(written)
+    try:
+        yield written
+    finally:
+        _written.reset(token)
+
+
+def _note_written(mapping):
+    written = _written.get()
+    if written is None:
+        return
+    for key, value in mapping.items():
+        written[key] = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+
+class TwoTierCache:
+    """L1 (LocalLRU в памяти процесса) перед L2 (CACHES["default"], Redis).
+    Чтение: L1 → L2 → запись в L1. Запись: L2 + L1 и широковещательное
+    сообщение в канал Redis pub/sub, по которому остальные воркеры и узлы
+    выбрасывают эти ключи из своего L1. Без Redis (например, locmem в
+    разработке) рассылка не нужна — процесс один.
+    Атомарные операции (add для замков) в L1 не попадают никогда.
+    L2 по умолчанию — ResilientCache: при отказе Redis L2 временно
+    заменяется кешем процесса, а рассылка инвалидаций приостанавливается."""
+
+    def __init__(self, l2=None):
+        self.l2 = l2 if l2 is not None else ResilientCache(cache)
+        self.l1 = None
+        self.sender_id = uuid.uuid4().hex
+        self.counters = {"l1_hits": 0, "l1_misses": 0, "l2_hits": 0, "l2_misses": 0}
+        self._listener_pid = None
+        self._redis = None
+        self._start_lock = threading.Lock()
+
+    # ---------- служебное ----------
+
+    def _enabled(self):
+        if not getattr(settings, "CACHE_L1_ENABLED", False):
+            return False
+        if self.l1 is None:
+            self.l1 = LocalLRU(
+                max_items=getattr(settings, "CACHE_L1_MAX_ITEMS", 1000),
+                max_bytes=getattr(settings, "CACHE_L1_MAX_BYTES", 16 * 1024 * 1024),
+                ttl=getattr(settings, "CACHE_L1_TTL", 60),
+            )
+        self._ensure_listener()
+        return True
+
+    def _count(self, name, n=1):
+        # без замка: точность счётчиков не критична, а GIL не даст их сломать
+        self.counters[name] += n
+
+    def _l2_is_redis(self):
+        """L2 (под ResilientCache — его основной кеш) — RedisCache Django.
+        Только тогда у процессов есть общий канал pub/sub."""
+        return isinstance(getattr(self.l2, "primary", self.l2), RedisCache)
+
+    def _redis_client(self):
+        if self._redis is None:
+            if not self._l2_is_redis():
+                return None
+            location = settings.CACHES["default"].get("LOCATION")
+            try:
+                import redis
+            except ImportError:
+                return None
+            # только таймаут подключения: listen() ждёт сообщений без ограничения
+            self._redis = redis.Redis.from_url(
+                location,
+                socket_connect_timeout=getattr(settings, "CACHE_REDIS_TIMEOUT", None),
+            )
+        return self._redis
+
+    def _channel(self):
+        return getattr(settings, "CACHE_INVALIDATION_CHANNEL", "cache:invalidate")
+
+    def _ensure_listener(self):
+        """Запускает поток-подписчик (один на процесс; после fork — заново)."""
+        if self._listener_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+            # L2 не Redis (locmem, файловый кеш) — процесс один, слушать нечего
+            if not self._l2_is_redis() or self._redis_client() is None:
+                return
+            threading.Thread(
+                target=self._listen, name="cache-l1-invalidation", daemon=True
+            ).start()
+
+    def _listen(self):
+        backoff = 0.5
+        failures = 0
+        while True:
+            try:
+                pubsub = self._redis_client().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self._channel())
+                # пока не были подписаны, могли пропустить сообщения — L1 под подозрением
+                self.l1.clear()
+                backoff = 0.5
+                failures = 0
+                for message in pubsub.listen():
+                    self._on_message(message.get("data"))
+            except Exception:
+                # о сбое пишем один раз, повторные попытки — только в debug
+                failures += 1
+                log = logger.warning if failures == 1 else logger.debug
+                log("Подписка на инвалидации L1 прервалась", exc_info=True)
+                self.l1.clear()
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+    def _on_message(self, data):
+        try:
+            payload = json.loads(data)
+        except (TypeError, ValueError):
+            return
+        if payload.get("sender") == self.sender_id:
+            return
+        for key in payload.get("keys", ()):
+            self.l1.delete(key)
+
+    def _broadcast(self, keys):
+        if not keys or not getattr(self.l2, "available", True):
+            return
+        client = self._redis_client()
+        if client is None:
+            return
+        try:
+            client.publish(
+                self._channel(),
+                json.dumps({"sender": self.sender_id, "keys": list(keys)}),
+            )
+        except Exception:
+            logger.warning("Не удалось разослать инвалидацию L1", exc_info=True)
+
+    # ---------- API кеша ----------
+
+    def get(self, key, default=None):
+        if not self._enabled():
+            return self.l2.get(key, default)
+        value = self.l1.get(key)
+        if value is not _MISSING:
+            self._count("l1_hits")
+            return value
+        self._count("l1_misses")
+        value = self.l2.get(key, _MISSING)
+        if value is _MISSING:
+            self._count("l2_misses")
+            return default
+        self._count("l2_hits")
+        self.l1.set(key, value)
+        return value
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not self._enabled():
+            return self.l2.get_many(keys)
+        found, rest = {}, []
+        for key in keys:
+            value = self.l1.get(key)
+            if value is _MISSING:
+                rest.append(key)
+            else:
+                found[key] = value
+        self._count("l1_hits", len(found))
+        self._count("l1_misses", len(rest))
+        if rest:
+            from_l2 = self.l2.get_many(rest)
+            self._count("l2_hits", len(from_l2))
+            self._count("l2_misses", len(rest) - len(from_l2))
+            for key, value in from_l2.items():
+                self.l1.set(key, value)
+            found.update(from_l2)
+        return found
+
+    def set(self, key, value, timeout=None):
+        self.l2.set(key, value, timeout)
+        _note_written({key: value})
+        if self._enabled():
+            self.l1.set(key, value, timeout)
+            self._broadcast([key])
+
+    def set_many(self, mapping, timeout=None):
+        self.l2.set_many(mapping, timeout)
+        _note_written(mapping)
+        if self._enabled():
+            for key, value in mapping.items():
+                self.l1.set(key, value, timeout)
+            self._broadcast(mapping.keys())
+
+    def delete(self, key):
+        self.l2.delete(key)
+        if self._enabled():
+            self.l1.delete(key)
+            self._broadcast([key])
+
+    def stats(self) -> dict:
+        """Счётчики попаданий/промахов по уровням, заполненность L1
+        и состояние предохранителя L2."""
+        data = dict(self.counters)
+        data["l1_items"] = len(self.l1) if self.l1 is not None else 0
+        data["l1_bytes"] = self.l1.size_bytes if self.l1 is not None else 0
+        if hasattr(self.l2, "stats"):
+            data.update({f"l2_{name}": value for name, value in self.l2.stats().items()})
+        return data
+
+
+tiered_cache = TwoTierCache()
@@ -1,7 +1,6 @@
 from django.urls import path
 from django.conf import settings
 from django.conf.urls.static import static
-from django.views.decorators.cache import cache_page
 
 from catalog.views import (
     HomeView,
@@ -12,21 +11,20 @@ from catalog.views import (
     ProductDeleteView,
     ProductUnpublishView,
     CategoryProductsView,
+    ProductSearchView,
+    SuggestView,
+    CacheMetricsView,
 )
 
 app_name = "catalog"
 
-# оборачиваем страницу товара в кеш, если включено кеширование
-product_detail_view = ProductDetailView.as_view()
-if settings.CACHE_ENABLED:
-    product_detail_view = cache_page(60 * 15)(product_detail_view)  # 15 минут
-
 urlpatterns = [
     # 🏠 Главная страница со списком товаров (ListView)
     path("", HomeView.as_view(), name="home"),
     # 📞 Страница "Контакты" с формой обратной связи (TemplateView)
     path("contacts/", ContactsView.as_view(), name="contacts"),
-    # 📦 Страница отдельного товара (DetailView)
+    # 📦 Страница отдельного товара (DetailView); карточка кешируется
+    #    по товару и видимости в services.product_detail
     path("product/<int:pk>/", ProductDetailView.as_view(), name="product_detail"),
     # ➕ Добавление нового товара (CreateView)
     # path("products/add/", AddProductView.as_view(), name="product_add"),
@@ -43,6 +41,12 @@ urlpatterns = [
     path(
         "category/<int:category_id>/", CategoryProductsView.as_view(), name="category_products"
     ),
+    # 🔎 Полнотекстовый поиск по товарам
+    path("search/", ProductSearchView.as_view(), name="search"),
+    # ⌨️ Подсказки для строки поиска (JSON)
+    path("api/suggest/", SuggestView.as_view(), name="suggest"),
+    # 📊 Метрики кеша и предохранителя Redis (формат Prometheus)
+    path("metrics/cache/", CacheMetricsView.as_view(), name="cache_metrics"),
 ]
 
 # 🖼 Подключение статических путей для отображения загруженных изображений при DEBUG=True
@@ -1,12 +1,17 @@
+import hashlib
+
 from django.contrib import messages
-from django.core.cache import cache
 from django.conf import settings
 from django.contrib.auth.mixins import (
     LoginRequiredMixin,
     UserPassesTestMixin,
     PermissionRequiredMixin,
 )
-from django.shortcuts import get_object_or_404, redirect
+from django.http import Http404, HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date
 from django.views import View
 from django.urls import reverse_lazy, reverse
 from django.views.generic import (
@@ -18,60 +23,209 @@ from django.views.generic import (
     TemplateView,
 )
 
-from catalog.forms import ContactForm, ProductForm
+from catalog import facets, suggest
+from catalog.degraded import db_breaker, mark_degraded, stale_page
+from catalog.dto import ProductDetail
+from catalog.fragments import render_product_cards
+from catalog.id_bitmaps import is_known_id
+from catalog.forms import CategoryFilterForm, ContactForm, ProductForm
 from catalog.models import Product, Category
-from catalog.services import get_products_by_category
-from catalog.cache_utils import invalidate_home_products
+from catalog.services import (
+    CATEGORY_SORT_ORDERINGS,
+    SEARCH_ORDERING,
+    get_home_products,
+    get_products_by_category,
+    normalize_search_query,
+    product_detail,
+    product_meta,
+    search_products,
+)
+from catalog.cache_utils import (
+    PRODUCT_IDS_TAG,
+    PRODUCTS_TAG,
+    category_tag,
+    patch_page_cache_control,
+    product_detail_key,
+    read_stale,
+    tags_stamp,
+)
+from catalog.two_tier_cache import tiered_cache
+from catalog.pagination import (
+    DEFAULT_ORDERING,
+    InvalidCursor,
+    KeysetPage,
+    keyset_page_rows,
+)
+
+
+class KeysetPaginationMixin:
+    """Подменяет стандартную пагинацию ListView на keyset-пагинацию.
+    Читает из запроса ?page=, ?after=, ?before= и отдаёт в шаблон KeysetPage
+    (без Paginator и COUNT(*)). Сами строки страницы получает get_page_rows(),
+    которую переопределяют наследники — там же решается вопрос кеширования.
+    Испорченный курсор (обрезанная или подделанная ссылка) — первая страница."""
+
+    page_ordering = DEFAULT_ORDERING
+    cursor_links = True
+
+    def get_page_rows(self, queryset, page_size, *, after, before, page):
+        return keyset_page_rows(
+            queryset,
+            page_size,
+            ordering=self.page_ordering,
+            after=after,
+            before=before,
+            page=page,
+        )
+
+    def get_base_query(self):
+        """Параметры запроса, которые нужно сохранить в ссылках пагинации."""
+        params = self.request.GET.copy()
+        for name in ("page", "after", "before"):
+            params.pop(name, None)
+        return params.urlencode()
+
+    def paginate_queryset(self, queryset, page_size):
+        after = self.request.GET.get("after") or None
+        before = self.request.GET.get("before") or None
+        try:
+            page = int(self.request.GET.get("page") or 1)
+        except ValueError:
+            raise Http404("Некорректный номер страницы.")
+
+        try:
+            rows, number, has_next, has_previous = self.get_page_rows(
+                queryset, page_size, after=after, before=before, page=page
+            )
+        except InvalidCursor:
+            rows, number, has_next, has_previous = self.get_page_rows(
+                queryset, page_size, after=None, before=None, page=1
+            )
+        if not rows and number > 1:
+            raise Http404("Такой страницы нет.")
+
+        page_obj = KeysetPage(
+            rows,
+            number,
+            has_next,
+            has_previous,
+            ordering=self.page_ordering,
+            base_query=self.get_base_query(),
+            cursor_links=self.cursor_links,
+        )
+        return None, page_obj, page_obj.object_list, page_obj.has_other_pages()
+
 
+class ConditionalGetMixin:
+    """Условный GET: ETag / Last-Modified и ответ 304 без рендеринга шаблона.
+    Валидаторы считаются до основной логики view (get_validators) из дешёвых
+    источников — версий тегов кеша или узких выборок, — поэтому на 304
+    ни страница, ни строки товаров не загружаются.
+    В ETag входят роль (staff/public) и id пользователя: кнопки и навбар
+    зависят от того, кто смотрит. Cache-Control — public для анонимных
+    (их страницу может хранить прокси), иначе private. ETag слабый — токен CSRF в форме меняется
+    при каждом рендеринге, побайтно страницы не совпадают."""
 
-class HomeView(ListView):
-    """Главная страница интернет-магазина — с низкоуровневым кешированием списка продуктов."""
+    def get_validators(self):
+        """Возвращает (части ETag, время последнего изменения) или None."""
+        return None
+
+    def _viewer_parts(self):
+        user = self.request.user
+        role = "staff" if user.is_authenticated and user.is_staff else "public"
+        return role, user.pk or 0
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD"):
+            return super().dispatch(request, *args, **kwargs)
+        # непрочитанные сообщения показываются один раз — 304 их бы «съел»
+        has_messages = len(messages.get_messages(request)) > 0
+        validators = None if has_messages else self.get_validators()
+        if validators is None:
+            return super().dispatch(request, *args, **kwargs)
+
+        parts, modified_at = validators
+        digest = hashlib.sha1(
+            "|".join(map(str, (*self._viewer_parts(), *parts))).encode()
+        ).hexdigest()
+        etag = f'W/"{digest}"'
+        last_modified = int(modified_at) if modified_at else None
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            response.headers.setdefault("ETag", etag)
+            if last_modified:
+                response.headers.setdefault("Last-Modified", http_date(last_modified))
+        patch_page_cache_control(request, response)
+        return response
+
+
+class HomeView(ConditionalGetMixin, KeysetPaginationMixin, ListView):
+    """Главная страница интернет-магазина — keyset-пагинация по (created_at, id)
+    и кеширование каждой страницы отдельным ключом.
+    Ссылки «→»/«←» несут курсор (?after= / ?before=), старые ссылки ?page=N
+    продолжают работать через OFFSET. В обоих режимах читается не больше
+    paginate_by + 1 строк, поэтому стоимость запроса не зависит от размера каталога."""
 
     model = Product
     template_name = "catalog/home.html"
     context_object_name = "products"
     paginate_by = 8
-    ordering = ["-created_at"]
+    ordering = ["-created_at", "-id"]
 
-    def get_queryset(self):
-        """Возвращает список продуктов с учётом кеширования."""
-        user = self.request.user
-        is_staff = user.is_authenticated and user.is_staff
-
-        # ключ для кэша зависит от роли пользователя
-        cache_key = f"home:products:{'staff' if is_staff else 'public'}"
-        cache_ttl = getattr(settings, "CACHE_TTL", 300)  # 5 минут по умолчанию
-
-        products = None
-        if getattr(settings, "CACHE_ENABLED", False):
-            products = cache.get(cache_key)
-
-        if products is None:
-            print("🧱 Кэш пуст — загружаем продукты из базы")
-            qs = Product.objects.select_related("category").order_by("-created_at")
-            if not is_staff:
-                qs = qs.filter(is_published=True)
+    @staticmethod
+    def page_cache_tags(view_kwargs):
+        """Теги страницы для AnonymousPageCacheMiddleware."""
+        return [PRODUCTS_TAG]
 
-            # превращаем QuerySet в list, чтобы не было повторных SQL-запросов
-            products = list(qs)
+    @staticmethod
+    def degraded_response(request, view_kwargs):
+        """Ответ без БД (catalog.degraded): последняя закешированная страница."""
+        return stale_page(request)
 
-            if getattr(settings, "CACHE_ENABLED", False):
-                cache.set(cache_key, products, cache_ttl)
-                print(f"✅ Кэш обновлён: {cache_key}")
-        else:
-            print(f"⚡ Используем продукты из кэша: {cache_key}")
+    def get_queryset(self):
+        """Базовый (ленивый) QuerySet с учётом роли — срезается в get_page_rows."""
+        qs = Product.objects.select_related("category")
+        if not self._is_staff():
+            qs = qs.filter(is_published=True)
+        return qs
 
-        return products
+    def _is_staff(self):
+        user = self.request.user
+        return user.is_authenticated and user.is_staff
+
+    def get_validators(self):
+        # любая правка товара или категории сдвигает версию тега списков
+        stamp = tags_stamp([PRODUCTS_TAG])
+        if stamp is None:
+            return None
+        version, changed_at = stamp
+        return (version,), changed_at
+
+    def get_page_rows(self, queryset, page_size, *, after, before, page):
+        """Возвращает одну страницу карточек товаров, по возможности из кеша.
+        read_through не даёт всем воркерам разом пойти в БД после инвалидации."""
+        return get_home_products(
+            self._is_staff(),
+            page=page,
+            after=after,
+            before=before,
+            page_size=page_size,
+        )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Просто отладочная выдача последних 5 товаров (не влияет на шаблон)
-        latest_products = Product.objects.order_by("-created_at")[:5]
-        print("🆕 Последние добавленные товары:")
-        for p in latest_products:
-            print(f"- {p.name} ({p.price} ₽)")
-        # Добавляем список всех категорий для кнопок
-        context["categories"] = Category.objects.all().order_by("name")
+        context["product_cards"] = render_product_cards(context["products"])
+        # Кнопки категорий с числом товаров из предрасчитанных фасетов
+        counts = facets.category_counts(self._is_staff())
+        categories = list(Category.objects.all().order_by("name"))
+        for cat in categories:
+            cat.products_count = counts.get(cat.id, 0)
+        context["categories"] = categories
         return context
 
 
@@ -109,19 +263,61 @@ class ContactsView(TemplateView):
         return self.render_to_response(context)
 
 
-class ProductDetailView(DetailView):
+class ProductDetailView(ConditionalGetMixin, DetailView):
     """Обычным пользователям доступна только опубликованная карточка.
-    Staff видит любую."""
+    Staff видит любую. Валидаторы — updated_at товара и название категории
+    из закешированных метаданных (services.product_meta).
+    Сама карточка берётся из кеша готовым HTML (services.product_detail),
+    а кнопки, зависящие от пользователя, рендерятся поверх неё каждый раз."""
 
     model = Product
     template_name = "catalog/product_detail.html"
     context_object_name = "product"
 
-    def get_queryset(self):
-        qs = super().get_queryset()
-        if self.request.user.is_authenticated and self.request.user.is_staff:
-            return qs
-        return qs.filter(is_published=True)
+    @classmethod
+    def degraded_response(cls, request, view_kwargs):
+        """Ответ без БД (catalog.degraded): публичная карточка из кеша
+        фрагментов, даже устаревшая."""
+        data, stale_for = read_stale(product_detail_key(view_kwargs["pk"], False))
+        if not data:
+            return None
+        response = render(
+            request, cls.template_name, {"product": ProductDetail(**data)}
+        )
+        return mark_degraded(response, stale_for)
+
+    def dispatch(self, request, *args, **kwargs):
+        # несуществующие и скрытые id отсекаем по битовой карте до выборки страницы
+        is_staff = self._viewer_parts()[0] == "staff"
+        queryset = Product.objects.all()
+        if not is_staff:
+            queryset = queryset.filter(is_published=True)
+        if not is_known_id(
+            f"product:{'staff' if is_staff else 'public'}",
+            queryset,
+            PRODUCT_IDS_TAG,
+            kwargs["pk"],
+        ):
+            raise Http404("Товар не найден.")
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_object(self, queryset=None):
+        detail = product_detail(
+            self.kwargs["pk"], is_staff=self._viewer_parts()[0] == "staff"
+        )
+        if detail is None:
+            raise Http404("Товар не найден.")
+        return detail
+
+    def get_validators(self):
+        meta = product_meta(self.kwargs["pk"])
+        if meta is None:
+            return None
+        updated_at, is_published, category_id, category_name = meta
+        if not is_published and self._viewer_parts()[0] != "staff":
+            return None  # пусть view ответит 404
+        parts = (updated_at.isoformat(), is_published, category_id, category_name)
+        return parts, updated_at.timestamp()
 
 
 class AddProductView(LoginRequiredMixin, PermissionRequiredMixin, CreateView):
@@ -142,7 +338,6 @@ class AddProductView(LoginRequiredMixin, PermissionRequiredMixin, CreateView):
     def form_valid(self, form):
         form.instance.owner = self.request.user
         responce = super().form_valid(form)
-        invalidate_home_products()
         messages.success(
             self.request, f"✅ Товар «{self.object.name}» успешно добавлен!"
         )
@@ -216,7 +411,6 @@ class ProductUpdateView(LoginRequiredMixin, OwnerRequiredMixin, UpdateView):
 
     def form_valid(self, form):
         resp = super().form_valid(form)
-        invalidate_home_products()
         messages.success(
             self.request,
             f"✅ Товар «{self.object.name}» обновлён.",
@@ -245,7 +439,6 @@ class ProductDeleteView(LoginRequiredMixin, OwnerOrModeratorRequiredMixin, Delet
 
     def get_success_url(self):
         messages.success(self.request, f"🗑 Товар «{self.object.name}» удалён.")
-        invalidate_home_products()
         return reverse("catalog:home")
 
 
@@ -258,7 +451,6 @@ class ProductUnpublishView(LoginRequiredMixin, PermissionRequiredMixin, View):
         product = get_object_or_404(Product, pk=pk)
         product.is_published = False
         product.save(update_fields=["is_published"])
-        invalidate_home_products()
         messages.info(request, f"Публикация товара «{product.name}» отменена.")
         return redirect(product.get_absolute_url())
 
@@ -276,19 +468,225 @@ class OwnerRequiredMixin(UserPassesTestMixin):
         return super().handle_no_permission()
 
 
-class CategoryProductsView(TemplateView):
-    """Представление для отображения всех товаров в выбранной категории."""
+class CategoryProductsView(ConditionalGetMixin, KeysetPaginationMixin, ListView):
+    """Товары выбранной категории: постраничный вывод, фильтр по цене
+    и сортировка (новые / дешёвые / дорогие). Каждая страница для каждой
+    комбинации фильтров кешируется отдельно в get_products_by_category."""
 
     model = Product
     template_name = "catalog/category_products.html"
     context_object_name = "products"
     paginate_by = 8
 
+    @staticmethod
+    def page_cache_tags(view_kwargs):
+        """Теги страницы для AnonymousPageCacheMiddleware."""
+        return [category_tag(view_kwargs["category_id"])]
+
+    @staticmethod
+    def degraded_response(request, view_kwargs):
+        """Ответ без БД (catalog.degraded): последняя закешированная страница."""
+        return stale_page(request)
+
+    def get(self, request, *args, **kwargs):
+        self.category = get_object_or_404(Category, pk=self.kwargs.get("category_id"))
+        self.filter_form = CategoryFilterForm(request.GET or None)
+        if self.filter_form.is_valid():
+            self.filters = self.filter_form.cleaned_data
+        else:
+            self.filters = {"min_price": None, "max_price": None, "sort": "newest"}
+        self.page_ordering = CATEGORY_SORT_ORDERINGS[self.filters["sort"]]
+        return super().get(request, *args, **kwargs)
+
+    def get_validators(self):
+        # тег категории сдвигается при правке её самой и любого её товара
+        stamp = tags_stamp([category_tag(self.kwargs.get("category_id"))])
+        if stamp is None:
+            return None
+        version, changed_at = stamp
+        return (version,), changed_at
+
+    def get_queryset(self):
+        # строки страницы выбирает сервис, сюда нужен только тип модели
+        return Product.objects.none()
+
+    def _is_staff(self):
+        user = self.request.user
+        return user.is_authenticated and user.is_staff
+
+    def get_page_rows(self, queryset, page_size, *, after, before, page):
+        return get_products_by_category(
+            self.category.id,
+            is_staff=self._is_staff(),
+            min_price=self.filters["min_price"],
+            max_price=self.filters["max_price"],
+            sort=self.filters["sort"],
+            page=page,
+            after=after,
+            before=before,
+            page_size=page_size,
+        )
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        category_id = self.kwargs.get("category_id")
-        category = get_object_or_404(Category, pk=category_id)
+        context["category"] = self.category
+        context["filter_form"] = self.filter_form
+        context["product_cards"] = render_product_cards(context["products"])
+        context["price_facets"] = facets.price_facets(
+            self.category.id,
+            is_staff=self._is_staff(),
+            selected=(self.filters["min_price"], self.filters["max_price"]),
+            extra_query={"sort": self.filters["sort"]},
+        )
+        context["products_count"] = facets.category_counts(self._is_staff()).get(
+            self.category.id, 0
+        )
+        context["current_sort"] = self.filters["sort"]
+        context["price_filtered"] = (
+            self.filters["min_price"] is not None
+            or self.filters["max_price"] is not None
+        )
+        return context
+
+
+class ProductSearchView(KeysetPaginationMixin, ListView):
+    """Полнотекстовый поиск по опубликованным товарам: /search/?q=...
+    Результаты отсортированы по релевантности и кешируются по нормализованному
+    запросу и номеру страницы (см. catalog.services.search_products)."""
+
+    model = Product
+    template_name = "catalog/search.html"
+    context_object_name = "products"
+    paginate_by = 12
+    page_ordering = SEARCH_ORDERING
+    cursor_links = False  # ранг не годится для курсора — только ?page=N
+
+    def get(self, request, *args, **kwargs):
+        self.query = normalize_search_query(request.GET.get("q", ""))
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        # строки страницы выбирает сервис, сюда нужен только тип модели
+        return Product.objects.none()
+
+    def get_page_rows(self, queryset, page_size, *, after, before, page):
+        if not self.query:
+            return [], 1, False, False
+        return search_products(self.query, page=page, page_size=page_size)
 
-        context["category"] = category
-        context["products"] = get_products_by_category(category.id)
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["query"] = self.query
         return context
+
+
+class SuggestView(View):
+    """Автодополнение для строки поиска: /api/suggest/?q=...&limit=N
+    Отвечает из индекса в памяти процесса (catalog.suggest) — без ORM,
+    поэтому его можно дёргать на каждое нажатие клавиши."""
+
+    max_limit = 20
+
+    def get(self, request):
+        query = request.GET.get("q", "")
+        try:
+            limit = int(request.GET.get("limit") or settings.SUGGEST_LIMIT)
+        except ValueError:
+            limit = settings.SUGGEST_LIMIT
+        limit = max(1, min(limit, self.max_limit))
+
+        results = []
+        for kind, pk, name in suggest.shared_index.search(query, limit):
+            if kind == "product":
+                url = reverse("catalog:product_detail", kwargs={"pk": pk})
+            else:
+                url = reverse("catalog:category_products", kwargs={"category_id": pk})
+            results.append({"type": kind, "id": pk, "name": name, "url": url})
+        return JsonResponse({"query": query, "results": results})
+
+
+class CacheMetricsView(View):
+    """Метрики кеша и предохранителей процесса: /metrics/cache/ (формат Prometheus).
+    Главная — cache_breaker_state (0 — Redis работает, 1 — пробный запрос,
+    2 — кеш временно в памяти процесса). Доступ — по заголовку
+    Authorization: Bearer <METRICS_TOKEN> или staff-пользователю.
+    Там же db_breaker_state — предохранитель аварийного режима без БД;
+    по токену метрики отдаются и когда БД недоступна."""
+
+    @classmethod
+    def degraded_response(cls, request, view_kwargs):
+        return cls().get(request)
+
+    def get(self, request):
+        if not self._allowed(request):
+            return HttpResponse(status=403)
+        stats = tiered_cache.stats()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{labels} {value}")
+
+        metric(
+            "cache_breaker_state",
+            "gauge",
+            "Предохранитель Redis: 0 closed, 1 half_open, 2 open.",
+            [("", stats.get("l2_breaker_state_value", 0))],
+        )
+        for name, help_text in (
+            ("failures", "Ошибки обращений к Redis."),
+            ("trips", "Сколько раз предохранитель размыкался."),
+            ("rejected", "Операции, не отправленные в Redis из-за предохранителя."),
+        ):
+            metric(
+                f"cache_breaker_{name}_total",
+                "counter",
+                help_text,
+                [("", stats.get(f"l2_breaker_{name}", 0))],
+            )
+        db = db_breaker().stats()
+        metric(
+            "db_breaker_state",
+            "gauge",
+            "Предохранитель БД: 0 closed, 1 half_open, 2 open (режим только чтение).",
+            [("", db["state_value"])],
+        )
+        metric(
+            "db_breaker_trips_total",
+            "counter",
+            "Сколько раз БД признавалась недоступной.",
+            [("", db["trips"])],
+        )
+        metric(
+            "cache_fallback_ops_total",
+            "counter",
+            "Операции, выполненные на кеше процесса вместо Redis.",
+            [("", stats.get("l2_fallback_ops", 0))],
+        )
+        metric(
+            "cache_hits_total",
+            "counter",
+            "Попадания по уровням кеша.",
+            [('{level="l1"}', stats["l1_hits"]), ('{level="l2"}', stats["l2_hits"])],
+        )
+        metric(
+            "cache_misses_total",
+            "counter",
+            "Промахи по уровням кеша.",
+            [('{level="l1"}', stats["l1_misses"]), ('{level="l2"}', stats["l2_misses"])],
+        )
+        metric("cache_l1_items", "gauge", "Записей в L1.", [("", stats["l1_items"])])
+        metric("cache_l1_bytes", "gauge", "Объём L1, байт.", [("", stats["l1_bytes"])])
+        return HttpResponse(
+            "\n".join(lines) + "\n", content_type="text/plain; version=0.0.4"
+        )
+
+    @staticmethod
+    def _allowed(request):
+        token = getattr(settings, "METRICS_TOKEN", "")
+        header = request.headers.get("Authorization", "")
+        if token and constant_time_compare(header, f"Bearer {token}"):
+            return True
+        return request.user.is_authenticated and request.user.is_staff
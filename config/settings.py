@@ -41,19 +41,26 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "catalog.apps.CatalogConfig",
     "blog",
     "users",
+    "notifications",
 ]
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "catalog.middleware.DegradedModeMiddleware",
+    "catalog.middleware.InvalidationBatchMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
+    "catalog.middleware.AnonymousPageCacheMiddleware",
+    "catalog.middleware.SurrogateKeyMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "catalog.middleware.CacheStalenessMiddleware",
 ]
 
 ROOT_URLCONF = "config.urls"
@@ -88,8 +95,23 @@ DATABASES = {
         "PASSWORD": os.getenv("DATABASE_PASSWORD"),
         "HOST": os.getenv("DATABASE_HOST", default="127.0.0.1"),
         "PORT": os.getenv("DATABASE_PORT", default="5432"),
+        "OPTIONS": {
+            # не ждать недоступную БД дольше нескольких секунд
+            "connect_timeout": int(os.getenv("DATABASE_CONNECT_TIMEOUT", 3)),
+        },
     }
 }
+# ограничение времени одного SQL-запроса, мс (0 — без ограничения);
+# для веб-воркеров разумно 5000, миграциям и fill_db оно может помешать
+DATABASE_STATEMENT_TIMEOUT = int(os.getenv("DATABASE_STATEMENT_TIMEOUT", 0))
+if DATABASE_STATEMENT_TIMEOUT:
+    DATABASES["default"]["OPTIONS"]["options"] = (
+        f"-c statement_timeout={DATABASE_STATEMENT_TIMEOUT}"
+    )
+# аварийный режим «только чтение» (catalog.degraded): после стольких ошибок БД
+# подряд запросы к ней не делаются, пробный — раз в DB_BREAKER_RESET секунд
+DB_BREAKER_FAILURES = int(os.getenv("DB_BREAKER_FAILURES", 3))
+DB_BREAKER_RESET = float(os.getenv("DB_BREAKER_RESET", 5))
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -146,10 +168,32 @@ EMAIL_USE_SSL = os.getenv("EMAIL_USE_SSL", "False").lower() == "true"
 EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD")
 DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL", EMAIL_HOST_USER)
+# SMTP не должен держать воркер send_outbox дольше этого
+EMAIL_TIMEOUT = int(os.getenv("EMAIL_TIMEOUT", 10))
+
+# 📨 Очередь писем (notifications.outbox): письма пишутся в таблицу в транзакции
+# события и отправляются командой send_outbox
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 50))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 8))
+# задержка повтора: OUTBOX_RETRY_BASE × 2^(попытка-1) секунд, не больше OUTBOX_RETRY_MAX
+OUTBOX_RETRY_BASE = int(os.getenv("OUTBOX_RETRY_BASE", 30))
+OUTBOX_RETRY_MAX = int(os.getenv("OUTBOX_RETRY_MAX", 3600))
+# на сколько секунд воркер захватывает пачку; должно хватать на отправку всей
+# пачки (OUTBOX_BATCH_SIZE × EMAIL_TIMEOUT), иначе её заберёт другой воркер
+OUTBOX_LEASE = int(os.getenv("OUTBOX_LEASE", 300))
 
 # 📬 Основной e-mail администратора для уведомлений
 ADMIN_EMAIL = os.getenv("ADMIN_EMAIL", "email@example.com")
 
+# просмотры постов копятся в памяти воркера и пишутся в БД пачкой раз в N секунд
+BLOG_VIEWS_FLUSH_INTERVAL = float(os.getenv("BLOG_VIEWS_FLUSH_INTERVAL", 5))
+# 🎉 рубежи просмотров поста, о первом достижении которых пишем администратору
+BLOG_VIEW_MILESTONES = [
+    int(value)
+    for value in os.getenv("BLOG_VIEW_MILESTONES", "100,1000,10000").split(",")
+    if value.strip()
+]
+
 AUTHENTICATION_BACKENDS = [
     "users.backends.EmailAuthBackend",  # наш email-backend
     "django.contrib.auth.backends.ModelBackend",  # запасной
@@ -160,19 +204,67 @@ LOGOUT_REDIRECT_URL = "catalog:home"
 
 # включение/отключение кеша флагом
 CACHE_ENABLED = os.getenv("CACHE_ENABLED", "1").lower() in {"1", "true", "yes"}
-# конфигурация Redis
+# время жизни записей кеша (секунды)
+CACHE_TTL = int(os.getenv("CACHE_TTL", 300))
+# stale-while-revalidate для списков товаров: после инвалидации или истечения
+# мягкого срока (CACHE_SOFT_TTL) отдаём прежнее значение и пересчитываем его в фоне;
+# старше жёсткого срока (CACHE_HARD_TTL) запись уже не отдаётся
+CACHE_STALE_WHILE_REVALIDATE = os.getenv(
+    "CACHE_STALE_WHILE_REVALIDATE", "1"
+).lower() in {"1", "true", "yes"}
+CACHE_SOFT_TTL = int(os.getenv("CACHE_SOFT_TTL", CACHE_TTL))
+CACHE_HARD_TTL = int(os.getenv("CACHE_HARD_TTL", CACHE_TTL * 12))
+# защита от stampede: замок на пересчёт ключа и ожидание чужого пересчёта
+CACHE_LOCK_TIMEOUT = int(os.getenv("CACHE_LOCK_TIMEOUT", 10))
+CACHE_LOCK_WAIT = float(os.getenv("CACHE_LOCK_WAIT", 0.5))
+# вероятностное раннее обновление горячих ключей (0 — выключено)
+CACHE_EARLY_REFRESH_BETA = float(os.getenv("CACHE_EARLY_REFRESH_BETA", 1.0))
+# L1: LRU-кеш в памяти процесса перед Redis; инвалидации рассылаются
+# всем воркерам через Redis pub/sub (канал CACHE_INVALIDATION_CHANNEL)
+CACHE_L1_ENABLED = os.getenv("CACHE_L1_ENABLED", "1").lower() in {"1", "true", "yes"}
+CACHE_L1_MAX_ITEMS = int(os.getenv("CACHE_L1_MAX_ITEMS", 1000))
+CACHE_L1_MAX_BYTES = int(os.getenv("CACHE_L1_MAX_BYTES", 16 * 1024 * 1024))
+CACHE_L1_TTL = int(os.getenv("CACHE_L1_TTL", 60))
+CACHE_INVALIDATION_CHANNEL = "cache:invalidate"
+# кеш целых страниц для анонимных посетителей (главная, категории, блог)
+PAGE_CACHE_ENABLED = os.getenv("PAGE_CACHE_ENABLED", "1").lower() in {"1", "true", "yes"}
+PAGE_CACHE_TTL = int(os.getenv("PAGE_CACHE_TTL", CACHE_TTL))
+# прокси/CDN перед приложением: сколько он хранит анонимные страницы и куда
+# слать purge по тегам (пусто — purge выключен; для разработки:
+# manage.py purge_stub_server и CACHE_PURGE_URL=http://127.0.0.1:8089/purge)
+PROXY_CACHE_TTL = int(os.getenv("PROXY_CACHE_TTL", CACHE_TTL))
+CACHE_PURGE_URL = os.getenv("CACHE_PURGE_URL", "")
+CACHE_PURGE_TOKEN = os.getenv("CACHE_PURGE_TOKEN", "")
+CACHE_PURGE_BATCH = int(os.getenv("CACHE_PURGE_BATCH", 256))
+CACHE_PURGE_TIMEOUT = float(os.getenv("CACHE_PURGE_TIMEOUT", 2.0))
+# блобы карточек товаров длиннее этого порога сжимаются (lz4, если установлен, иначе zlib)
+CACHE_COMPRESS_MIN_BYTES = int(os.getenv("CACHE_COMPRESS_MIN_BYTES", 1024))
+# автодополнение: снимок индекса подсказок (общий для всех воркеров узла)
+SUGGEST_INDEX_PATH = os.getenv(
+    "SUGGEST_INDEX_PATH", os.path.join(BASE_DIR, "var", "suggest_index.json")
+)
+SUGGEST_LIMIT = 8
+# фасеты каталога: нижние границы ценовых диапазонов, ₽
+# (после изменения пересчитать счётчики: manage.py rebuild_facets)
+PRICE_FACET_BUCKETS = (0, 1000, 5000, 20000, 50000)
+# конфигурация Redis: соединение открывается при первом обращении к кешу,
+# таймауты сокета не дают медленному Redis задерживать запросы
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://127.0.0.1:6379/1")
+CACHE_REDIS_TIMEOUT = float(os.getenv("CACHE_REDIS_TIMEOUT", 0.25))
 CACHES = {
     "default": {
         "BACKEND": "django.core.cache.backends.redis.RedisCache",
-        "LOCATION": "redis://127.0.0.1:6379/1",
+        "LOCATION": CACHE_REDIS_URL,
+        "OPTIONS": {
+            "socket_connect_timeout": CACHE_REDIS_TIMEOUT,
+            "socket_timeout": CACHE_REDIS_TIMEOUT,
+        },
     }
 }
-
-# опционально) для тестов, если Redis не работает
-try:
-    import redis
-
-    redis.from_url(CACHES["default"]["LOCATION"]).ping()
-except Exception:
-    print("⚠ Redis недоступен — кеширование отключено.")
-    CACHE_ENABLED = False
+# предохранитель Redis: после стольких ошибок подряд кеш временно переходит
+# на память процесса и раз в CACHE_BREAKER_RESET секунд проверяет Redis снова
+CACHE_BREAKER_FAILURES = int(os.getenv("CACHE_BREAKER_FAILURES", 3))
+CACHE_BREAKER_RESET = float(os.getenv("CACHE_BREAKER_RESET", 10))
+CACHE_FALLBACK_MAX_ENTRIES = int(os.getenv("CACHE_FALLBACK_MAX_ENTRIES", 5000))
+# метрики кеша (/metrics/cache/): без токена доступны только staff
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
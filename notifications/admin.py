@@ -0,0 +1,30 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    """Очередь писем: просмотр и повтор отправки не ушедших писем."""
+
+    list_display = ("id", "subject", "status", "attempts", "next_attempt_at", "sent_at")
+    list_filter = ("status",)
+    search_fields = ("subject", "recipients")
+    readonly_fields = [field.name for field in OutboxEmail._meta.fields]
+
+    actions = ("retry_now",)
+
+    @admin.action(description="Отправить повторно")
+    def retry_now(self, request, queryset):
+        # письма, которые сейчас отправляет воркер, не трогаем
+        queryset.exclude(
+            status__in=(OutboxEmail.STATUS_SENT, OutboxEmail.STATUS_SENDING)
+        ).update(
+            status=OutboxEmail.STATUS_PENDING,
+            attempts=0,
+            next_attempt_at=timezone.now(),
+        )
+
+    def has_add_permission(self, request):
+        return False
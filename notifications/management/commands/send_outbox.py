@@ -0,0 +1,71 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from notifications.outbox import OutboxSender
+
+
+class Command(BaseCommand):
+    """
+    Воркер очереди писем (notifications.outbox). Забирает готовые к отправке письма
+    пачками по --batch и отправляет их через одно SMTP-соединение, которое
+    держится открытым, пока в очереди есть работа. Не ушедшее письмо
+    повторяется с нарастающей задержкой (OUTBOX_RETRY_BASE, OUTBOX_RETRY_MAX),
+    после OUTBOX_MAX_ATTEMPTS попыток помечается как failed.
+    Когда очередь пуста, SMTP-соединение и соединение с БД закрываются,
+    и воркер спит --interval секунд. Запуск:
+        python manage.py send_outbox            # постоянно
+        python manage.py send_outbox --once     # разобрать очередь и выйти (cron)
+    Воркеров можно запустить несколько: пачка захватывается на OUTBOX_LEASE
+    секунд (SELECT ... FOR UPDATE SKIP LOCKED), а письма уходят вне транзакции.
+    """
+
+    help = "Отправить письма из очереди (outbox)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Разобрать готовые письма и выйти.",
+        )
+        parser.add_argument(
+            "--batch",
+            type=int,
+            default=None,
+            help="Размер пачки (по умолчанию OUTBOX_BATCH_SIZE).",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5.0,
+            help="Пауза при пустой очереди, секунд (5).",
+        )
+
+    def handle(self, *args, **options):
+        sender = OutboxSender()
+        total_sent = total_failed = 0
+        try:
+            while True:
+                sent, failed = sender.send_batch(options["batch"])
+                total_sent += sent
+                total_failed += failed
+                if sent or failed:
+                    self.stdout.write(f"Отправлено: {sent}, ошибок: {failed}")
+                if sent:
+                    continue
+                # отправлять нечего или SMTP недоступен — не держим соединения
+                sender.close()
+                if options["once"]:
+                    break
+                connection.close()
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sender.close()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Всего отправлено: {total_sent}, ошибок: {total_failed}"
+            )
+        )
@@ -0,0 +1,93 @@
+import socketserver
+from email.header import decode_header, make_header
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """
+    Заглушка SMTP-сервера для разработки и ручной проверки очереди писем:
+    принимает письма по протоколу SMTP (без TLS и авторизации) и печатает
+    отправителя, получателей и тему. Запуск:
+        python manage.py smtp_stub_server --port 8025
+    и в .env: EMAIL_HOST=127.0.0.1, EMAIL_PORT=8025, EMAIL_USE_TLS=False
+    """
+
+    help = "Локальная заглушка SMTP-сервера для проверки send_outbox."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8025)
+
+    def handle(self, *args, **options):
+        stdout = self.stdout
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(f"{line}\r\n".encode())
+
+            def handle(self):
+                self.reply("220 smtp-stub ready")
+                sender, recipients = None, []
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    command = line.decode("utf-8", "replace").strip()
+                    verb = command[:4].upper()
+                    if verb == "EHLO":
+                        self.reply("250-smtp-stub")
+                        self.reply("250 8BITMIME")
+                    elif verb == "HELO":
+                        self.reply("250 smtp-stub")
+                    elif verb == "MAIL":
+                        sender, recipients = command[10:].strip(), []
+                        self.reply("250 OK")
+                    elif verb == "RCPT":
+                        recipients.append(command[8:].strip())
+                        self.reply("250 OK")
+                    elif verb == "DATA":
+                        self.reply("354 End data with <CR><LF>.<CR><LF>")
+                        subject = self.read_data()
+                        stdout.write(
+                            f"MAIL {sender} → {', '.join(recipients)}: {subject}"
+                        )
+                        self.reply("250 OK")
+                    elif verb in ("RSET", "NOOP"):
+                        self.reply("250 OK")
+                    elif verb == "QUIT":
+                        self.reply("221 Bye")
+                        return
+                    else:
+                        self.reply("502 Command not implemented")
+
+            def read_data(self):
+                """Читает тело письма до строки «.» и возвращает заголовок Subject."""
+                subject, in_subject = "", False
+                for line in iter(self.rfile.readline, b""):
+                    if line in (b".\r\n", b".\n"):
+                        break
+                    text = line.decode("utf-8", "replace")
+                    if in_subject and text[:1] in (" ", "\t"):
+                        subject += text.rstrip("\r\n")  # свёрнутый заголовок
+                        continue
+                    in_subject = not subject and text.lower().startswith("subject:")
+                    if in_subject:
+                        subject = text[8:].strip()
+                # не-ASCII тема приходит в виде =?utf-8?b?...?=
+                return str(make_header(decode_header(subject)))
+
+        class Server(socketserver.ThreadingTCPServer):
+            allow_reuse_address = True
+            daemon_threads = True
+
+        server = Server((options["host"], options["port"]), Handler)
+        self.stdout.write(
+            f"SMTP-заглушка слушает {options['host']}:{options['port']}"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
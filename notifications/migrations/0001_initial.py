@@ -0,0 +1,108 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """Очередь писем переезжает из catalog: таблица catalog_outboxemail уже
+    есть (catalog.0013_outboxemail), здесь модель только заводится в состоянии
+    миграций приложения, переименование таблицы — в 0002."""
+
+    initial = True
+
+    dependencies = [
+        ("catalog", "0014_product_search_vector_generated"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name="OutboxEmail",
+                    fields=[
+                        (
+                            "id",
+                            models.BigAutoField(
+                                auto_created=True,
+                                primary_key=True,
+                                serialize=False,
+                                verbose_name="ID",
+                            ),
+                        ),
+                        (
+                            "subject",
+                            models.CharField(max_length=255, verbose_name="Тема"),
+                        ),
+                        ("body", models.TextField(verbose_name="Текст")),
+                        (
+                            "from_email",
+                            models.CharField(
+                                blank=True, max_length=254, verbose_name="Отправитель"
+                            ),
+                        ),
+                        (
+                            "recipients",
+                            models.JSONField(default=list, verbose_name="Получатели"),
+                        ),
+                        (
+                            "status",
+                            models.CharField(
+                                choices=[
+                                    ("pending", "В очереди"),
+                                    ("sent", "Отправлено"),
+                                    ("failed", "Не удалось отправить"),
+                                ],
+                                default="pending",
+                                max_length=8,
+                                verbose_name="Статус",
+                            ),
+                        ),
+                        (
+                            "attempts",
+                            models.PositiveIntegerField(
+                                default=0, verbose_name="Попыток"
+                            ),
+                        ),
+                        (
+                            "next_attempt_at",
+                            models.DateTimeField(
+                                default=django.utils.timezone.now,
+                                verbose_name="Следующая попытка",
+                            ),
+                        ),
+                        (
+                            "last_error",
+                            models.TextField(
+                                blank=True, verbose_name="Последняя ошибка"
+                            ),
+                        ),
+                        (
+                            "created_at",
+                            models.DateTimeField(
+                                auto_now_add=True, verbose_name="Создано"
+                            ),
+                        ),
+                        (
+                            "sent_at",
+                            models.DateTimeField(
+                                blank=True, null=True, verbose_name="Отправлено"
+                            ),
+                        ),
+                    ],
+                    options={
+                        "verbose_name": "Письмо в очереди",
+                        "verbose_name_plural": "Очередь писем",
+                        "ordering": ["-created_at"],
+                        "db_table": "catalog_outboxemail",
+                        "indexes": [
+                            models.Index(
+                                condition=models.Q(("status", "pending")),
+                                fields=["next_attempt_at"],
+                                name="catalog_outbox_pending_idx",
+                            )
+                        ],
+                    },
+                ),
+            ],
+            database_operations=[],
+        ),
+    ]
@@ -0,0 +1,54 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """Таблица получает имя приложения, а письма — статус «отправляется»
+    и срок аренды: воркер захватывает пачку, отправляет её вне транзакции
+    и только потом записывает результат."""
+
+    dependencies = [
+        ("catalog", "0015_move_outboxemail"),
+        ("notifications", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AlterModelTable(
+            name="outboxemail",
+            table=None,
+        ),
+        migrations.RenameIndex(
+            model_name="outboxemail",
+            new_name="notif_outbox_pending_idx",
+            old_name="catalog_outbox_pending_idx",
+        ),
+        migrations.AddField(
+            model_name="outboxemail",
+            name="leased_until",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="Захвачено воркером до"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="outboxemail",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "В очереди"),
+                    ("sending", "Отправляется"),
+                    ("sent", "Отправлено"),
+                    ("failed", "Не удалось отправить"),
+                ],
+                default="pending",
+                max_length=8,
+                verbose_name="Статус",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="outboxemail",
+            index=models.Index(
+                condition=models.Q(("status", "sending")),
+                fields=["leased_until"],
+                name="notif_outbox_lease_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,66 @@
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class OutboxEmail(models.Model):
+    """Письмо в очереди на отправку (см. notifications.outbox).
+    Запись создаётся в той же транзакции, что и событие, о котором письмо
+    (регистрация, порог просмотров поста), а отправляет её отдельный процесс
+    manage.py send_outbox — запрос пользователя не ждёт SMTP."""
+
+    STATUS_PENDING = "pending"
+    STATUS_SENDING = "sending"
+    STATUS_SENT = "sent"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = (
+        (STATUS_PENDING, "В очереди"),
+        (STATUS_SENDING, "Отправляется"),
+        (STATUS_SENT, "Отправлено"),
+        (STATUS_FAILED, "Не удалось отправить"),
+    )
+
+    subject = models.CharField(max_length=255, verbose_name="Тема")
+    body = models.TextField(verbose_name="Текст")
+    from_email = models.CharField(
+        max_length=254, blank=True, verbose_name="Отправитель"
+    )
+    recipients = models.JSONField(default=list, verbose_name="Получатели")
+    status = models.CharField(
+        max_length=8,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        verbose_name="Статус",
+    )
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Попыток")
+    next_attempt_at = models.DateTimeField(
+        default=timezone.now, verbose_name="Следующая попытка"
+    )
+    leased_until = models.DateTimeField(
+        null=True, blank=True, verbose_name="Захвачено воркером до"
+    )
+    last_error = models.TextField(blank=True, verbose_name="Последняя ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создано")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Отправлено")
+
+    class Meta:
+        verbose_name = "Письмо в очереди"
+        verbose_name_plural = "Очередь писем"
+        ordering = ["-created_at"]
+        indexes = [
+            # выборка воркера: status=pending и next_attempt_at <= now
+            models.Index(
+                fields=["next_attempt_at"],
+                condition=Q(status="pending"),
+                name="notif_outbox_pending_idx",
+            ),
+            # письма упавшего воркера: status=sending и leased_until <= now
+            models.Index(
+                fields=["leased_until"],
+                condition=Q(status="sending"),
+                name="notif_outbox_lease_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} → {', '.join(self.recipients)} ({self.status})"
@@ -0,0 +1,183 @@
+import logging
+import smtplib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from notifications.models import OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+# ---------- ОЧЕРЕДЬ ПИСЕМ (OUTBOX) ----------
+# Код, которому нужно отправить письмо, вызывает enqueue() — это одна вставка
+# в notifications_outboxemail в текущей транзакции: при откате письма просто нет.
+# Отправляет письма manage.py send_outbox: пачками, через одно постоянное
+# SMTP-соединение, с повторами по нарастающей задержке. Пачка проходит три шага:
+# 1) короткая транзакция захватывает строки (SELECT ... FOR UPDATE SKIP LOCKED,
+#    status=sending и срок аренды leased_until) — другие воркеры их не возьмут;
+# 2) письма уходят по SMTP вне транзакции — медленный сервер не держит
+#    блокировки строк и соединение с БД в состоянии «idle in transaction»;
+# 3) вторая короткая транзакция записывает результаты.
+# Если воркер упадёт до шага 3, аренда истечёт (OUTBOX_LEASE) и пачку заберёт
+# другой воркер. Гарантия «хотя бы один раз»: уже ушедшее письмо тогда
+# отправится повторно.
+
+
+def enqueue(subject, message, recipient_list, from_email=None):
+    """Ставит письмо в очередь. Аргументы — как у django.core.mail.send_mail."""
+    return OutboxEmail.objects.create(
+        subject=subject,
+        body=message,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL or "",
+        recipients=list(recipient_list),
+    )
+
+
+def is_connection_error(exc) -> bool:
+    """Сервер недоступен (а не отказ по конкретному письму) — пачку прерываем,
+    остальным письмам не лучше. SMTPException — тоже OSError, их различаем."""
+    if isinstance(exc, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+        return True
+    return isinstance(exc, OSError) and not isinstance(exc, smtplib.SMTPException)
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """Пауза после attempts неудачных попыток: база × 2^(attempts-1), с потолком."""
+    base = getattr(settings, "OUTBOX_RETRY_BASE", 30)
+    cap = getattr(settings, "OUTBOX_RETRY_MAX", 3600)
+    return timedelta(seconds=min(base * 2 ** max(attempts - 1, 0), cap))
+
+
+class OutboxSender:
+    """Отправитель очереди с одним SMTP-соединением на всё время работы.
+    Соединение открывается при первой отправке и переоткрывается после ошибки."""
+
+    def __init__(self, connection=None):
+        self.connection = connection or get_connection(fail_silently=False)
+        self._open = False
+
+    def close(self):
+        if self._open:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+            self._open = False
+
+    def send_batch(self, batch_size=None) -> tuple[int, int]:
+        """Отправляет одну пачку готовых к отправке писем.
+        Возвращает (отправлено, не отправлено)."""
+        emails, leased_until = self._claim(batch_size)
+        if not emails:
+            return 0, 0
+        max_attempts = getattr(settings, "OUTBOX_MAX_ATTEMPTS", 8)
+        sent = failed = 0
+        processed = []
+        for email in emails:
+            processed.append(email)
+            try:
+                self._send(email)
+            except Exception as exc:
+                failed += 1
+                # ошибка могла оставить соединение в неизвестном состоянии
+                self.close()
+                email.last_error = f"{type(exc).__name__}: {exc}"[:2000]
+                if email.attempts >= max_attempts:
+                    email.status = OutboxEmail.STATUS_FAILED
+                    logger.error("Письмо %s не отправлено: %s", email.pk, exc)
+                else:
+                    email.status = OutboxEmail.STATUS_PENDING
+                    email.next_attempt_at = timezone.now() + retry_delay(
+                        email.attempts
+                    )
+                if is_connection_error(exc):
+                    logger.warning("SMTP-сервер недоступен: %s", exc)
+                    break
+            else:
+                sent += 1
+                email.status = OutboxEmail.STATUS_SENT
+                email.sent_at = timezone.now()
+                email.last_error = ""
+        # до отправки не дошло — возвращаем в очередь без траты попытки
+        for email in emails[len(processed) :]:
+            email.status = OutboxEmail.STATUS_PENDING
+            email.attempts -= 1
+        self._record(emails, leased_until)
+        return sent, failed
+
+    def _claim(self, batch_size=None):
+        """Шаг 1: захватывает пачку — готовые письма и письма с истёкшей арендой
+        (воркер упал, не записав результат). Попытка засчитывается сразу,
+        чтобы письмо, на котором воркер падает, не крутилось бесконечно."""
+        batch_size = batch_size or getattr(settings, "OUTBOX_BATCH_SIZE", 50)
+        now = timezone.now()
+        leased_until = now + timedelta(seconds=getattr(settings, "OUTBOX_LEASE", 300))
+        with transaction.atomic():
+            emails = list(
+                OutboxEmail.objects.select_for_update(skip_locked=True)
+                .filter(
+                    Q(status=OutboxEmail.STATUS_PENDING, next_attempt_at__lte=now)
+                    | Q(status=OutboxEmail.STATUS_SENDING, leased_until__lte=now)
+                )
+                .order_by("next_attempt_at", "pk")[:batch_size]
+            )
+            if emails:
+                OutboxEmail.objects.filter(pk__in=[e.pk for e in emails]).update(
+                    status=OutboxEmail.STATUS_SENDING,
+                    leased_until=leased_until,
+                    attempts=F("attempts") + 1,
+                )
+        for email in emails:
+            email.attempts += 1
+            email.leased_until = None
+        return emails, leased_until
+
+    def _record(self, emails, leased_until):
+        """Шаг 3: записывает результаты. Строки, аренду которых за время
+        отправки перехватил другой воркер, не трогаем — ими распоряжается он."""
+        with transaction.atomic():
+            owned = set(
+                OutboxEmail.objects.select_for_update()
+                .filter(
+                    pk__in=[e.pk for e in emails],
+                    status=OutboxEmail.STATUS_SENDING,
+                    leased_until=leased_until,
+                )
+                .values_list("pk", flat=True)
+            )
+            OutboxEmail.objects.bulk_update(
+                [email for email in emails if email.pk in owned],
+                [
+                    "status",
+                    "attempts",
+                    "next_attempt_at",
+                    "leased_until",
+                    "last_error",
+                    "sent_at",
+                ],
+            )
+
+    def _send(self, email):
+        message = EmailMessage(
+            subject=email.subject,
+            body=email.body,
+            from_email=email.from_email or None,
+            to=email.recipients,
+            connection=self.connection,
+        )
+        try:
+            self._deliver(message)
+        except smtplib.SMTPServerDisconnected:
+            # сервер закрыл простаивавшее соединение — переоткрываем один раз
+            self.close()
+            self._deliver(message)
+
+    def _deliver(self, message):
+        if not self._open:
+            self.connection.open()
+            self._open = True
+        message.send()
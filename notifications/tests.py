@@ -0,0 +1,163 @@
+import smtplib
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend as LocMemEmailBackend
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from notifications import outbox
+from notifications.models import OutboxEmail
+
+
+class RefusingEmailBackend(LocMemEmailBackend):
+    """locmem-бэкенд, который отказывает в отправке указанной ошибкой."""
+
+    def __init__(self, error, **kwargs):
+        super().__init__(**kwargs)
+        self.error = error
+
+    def send_messages(self, messages):
+        raise self.error
+
+
+@override_settings(OUTBOX_MAX_ATTEMPTS=3, OUTBOX_RETRY_BASE=10, OUTBOX_RETRY_MAX=25)
+class OutboxTests(TestCase):
+    def enqueue(self, n=1):
+        return [
+            outbox.enqueue(f"Письмо {i}", "Текст", [f"user{i}@example.com"])
+            for i in range(n)
+        ]
+
+    def test_enqueue_is_part_of_the_transaction(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.enqueue()
+                raise RuntimeError
+        self.assertFalse(OutboxEmail.objects.exists())
+
+    def test_batch_is_sent_over_one_connection(self):
+        self.enqueue(3)
+        with mock.patch.object(LocMemEmailBackend, "open") as open_connection:
+            sender = outbox.OutboxSender()
+            self.assertEqual(sender.send_batch(batch_size=2), (2, 0))
+            self.assertEqual(sender.send_batch(batch_size=2), (1, 0))
+        self.assertEqual(open_connection.call_count, 1)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].to, ["user0@example.com"])
+        self.assertFalse(OutboxEmail.objects.exclude(status=OutboxEmail.STATUS_SENT))
+
+    def test_refused_email_backs_off_then_fails(self):
+        (email,) = self.enqueue()
+        sender = outbox.OutboxSender(
+            RefusingEmailBackend(smtplib.SMTPRecipientsRefused({}))
+        )
+        delays = []
+        for _ in range(3):
+            before = timezone.now()
+            self.assertEqual(sender.send_batch(), (0, 1))
+            email.refresh_from_db()
+            delays.append(round((email.next_attempt_at - before).total_seconds()))
+            # пауза ещё не прошла — письмо не берётся
+            self.assertEqual(sender.send_batch(), (0, 0))
+            OutboxEmail.objects.update(next_attempt_at=timezone.now())
+
+        self.assertEqual(delays[:2], [10, 20])  # база × 2^(попытка-1)
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboxEmail.STATUS_FAILED)
+        self.assertEqual(email.attempts, 3)
+        self.assertIn("SMTPRecipientsRefused", email.last_error)
+        self.assertEqual(sender.send_batch(), (0, 0))
+
+    def test_connection_error_stops_the_batch(self):
+        first, second = self.enqueue(2)
+        sender = outbox.OutboxSender(RefusingEmailBackend(ConnectionRefusedError()))
+        self.assertEqual(sender.send_batch(), (0, 1))
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.attempts, second.attempts), (1, 0))
+        self.assertEqual(second.status, OutboxEmail.STATUS_PENDING)
+
+    def test_crashed_worker_batch_is_reclaimed_after_lease(self):
+        (email,) = self.enqueue()
+        emails, _ = outbox.OutboxSender()._claim()  # воркер упал после захвата
+        self.assertEqual([e.pk for e in emails], [email.pk])
+        self.assertEqual(outbox.OutboxSender().send_batch(), (0, 0))
+
+        OutboxEmail.objects.update(leased_until=timezone.now())
+        self.assertEqual(outbox.OutboxSender().send_batch(), (1, 0))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboxEmail.STATUS_SENT, 2))
+        self.assertIsNone(email.leased_until)
+
+    def test_result_is_not_recorded_over_a_lost_lease(self):
+        (email,) = self.enqueue()
+        sender = outbox.OutboxSender()
+
+        def lease_taken_over(message):
+            # отправка затянулась: аренда истекла, пачку захватил другой воркер
+            OutboxEmail.objects.update(leased_until=timezone.now())
+            outbox.OutboxSender()._claim()
+
+        with mock.patch.object(sender, "_send", side_effect=lease_taken_over):
+            self.assertEqual(sender.send_batch(), (1, 0))
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboxEmail.STATUS_SENDING)
+
+    def test_retry_delay_is_capped(self):
+        self.assertEqual(outbox.retry_delay(10), timedelta(seconds=25))
+
+
+class OutboxSkipLockedTests(TransactionTestCase):
+    """Два воркера не берут одно письмо: занятые строки пропускаются."""
+
+    def test_rows_locked_by_another_worker_are_skipped(self):
+        locked, free = (
+            outbox.enqueue(f"Письмо {i}", "Текст", ["user@example.com"])
+            for i in range(2)
+        )
+        acquired, release = threading.Event(), threading.Event()
+
+        def other_worker():
+            try:
+                with transaction.atomic():
+                    list(OutboxEmail.objects.select_for_update().filter(pk=locked.pk))
+                    acquired.set()
+                    release.wait(5)
+            finally:
+                connection.close()
+
+        worker = threading.Thread(target=other_worker)
+        worker.start()
+        try:
+            self.assertTrue(acquired.wait(5))
+            self.assertEqual(outbox.OutboxSender().send_batch(), (1, 0))
+        finally:
+            release.set()
+            worker.join()
+
+        self.assertEqual([m.subject for m in mail.outbox], [free.subject])
+        locked.refresh_from_db()
+        self.assertEqual(locked.status, OutboxEmail.STATUS_PENDING)
+        self.assertEqual(outbox.OutboxSender().send_batch(), (1, 0))
+
+    def test_smtp_runs_outside_the_transaction(self):
+        email = outbox.enqueue("Письмо", "Текст", ["user@example.com"])
+        seen = []
+
+        def send_messages(backend, messages):
+            # строка уже захвачена и зафиксирована, блокировок на время SMTP нет
+            seen.append(
+                (
+                    connection.in_atomic_block,
+                    OutboxEmail.objects.get(pk=email.pk).status,
+                )
+            )
+            return len(messages)
+
+        with mock.patch.object(LocMemEmailBackend, "send_messages", send_messages):
+            self.assertEqual(outbox.OutboxSender().send_batch(), (1, 0))
+        self.assertEqual(seen, [(False, OutboxEmail.STATUS_SENDING)])
@@ -1,12 +1,14 @@
 from django.contrib import messages
 from django.contrib.auth import login, logout, authenticate, get_user_model
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.core.mail import send_mail
 from django.shortcuts import redirect
 from django.urls import reverse_lazy, reverse
+from django.db import transaction
 from django.views.generic import FormView, TemplateView, UpdateView
 from django.conf import settings
 
+from notifications import outbox
+
 from .forms import (
     UserRegistrationForm,
     EmailAuthenticationForm,
@@ -23,7 +25,8 @@ class RegisterView(FormView):
     - сохраняет пользователя;
     - аутентифицирует по email+password через кастомный backend;
     - при необходимости логинит с явным указанием backend;
-    - отправляет приветственное письмо;
+    - ставит приветственное письмо в очередь (notifications.outbox) в той же
+      транзакции, что и создание пользователя — отправит его send_outbox;
     - редиректит на главную.
     """
 
@@ -32,8 +35,20 @@ class RegisterView(FormView):
     success_url = reverse_lazy("catalog:home")
 
     def form_valid(self, form):
-        # 1) Сохраняем пользователя (форма уже хеширует пароль)
-        user = form.save()
+        # 1) Сохраняем пользователя (форма уже хеширует пароль) и письмо
+        # приветствия на адрес из формы: оба или ни одного
+        with transaction.atomic():
+            user = form.save()
+            outbox.enqueue(
+                subject="Добро пожаловать в SkyStore! 🎉",
+                message=(
+                    f"Здравствуйте, {user.email}!\n\n"
+                    "Спасибо за регистрацию в SkyStore. Рады видеть вас 😊\n\n"
+                    "— Команда SkyStore"
+                ),
+                from_email=settings.DEFAULT_FROM_EMAIL,  # адрес отправителя из .env
+                recipient_list=[user.email],  # адрес получателя из формы регистрации
+            )
 
         # 2) Аутентификация через кастомный email backend
         email = user.email
@@ -49,22 +64,6 @@ class RegisterView(FormView):
             # Фолбэк: явно указываем backend, чтобы избежать ValueError про multiple backends
             login(self.request, user, backend="users.backends.EmailAuthBackend")
 
-        # 3) Письмо приветствия на адрес, введённый при регистрации (user.email)
-        try:
-            send_mail(
-                subject="Добро пожаловать в SkyStore! 🎉",
-                message=(
-                    f"Здравствуйте, {user.email}!\n\n"
-                    "Спасибо за регистрацию в SkyStore. Рады видеть вас 😊\n\n"
-                    "— Команда SkyStore"
-                ),
-                from_email=settings.DEFAULT_FROM_EMAIL,  # адрес отправителя из .env
-                recipient_list=[user.email],  # адрес получателя из формы регистрации
-                fail_silently=False,
-            )
-        except Exception as e:
-            messages.warning(self.request, f"⚠️ Не удалось отправить письмо: {e}")
-
         messages.success(self.request, "✅ Регистрация успешна! Добро пожаловать 👋")
         return super().form_valid(form)
 